@@ -0,0 +1,102 @@
+"""
+Бенчмарк: services.analytics_service на пользователе с большим числом операций.
+
+    SECRET_KEY=bench python benchmarks/bench_analytics.py [--rows 1000000] [--db]
+
+Без --db меряется только расчёт compute_summary на синтетических массивах.
+С --db строки сначала пишутся во временную SQLite-базу, и отдельно меряется
+загрузка колонок (crud.operation.get_operation_columns + to_arrays).
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "bench")
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from db.database import Base
+from models import models
+from services import analytics_service
+import crud.operation
+
+TODAY = date(2024, 12, 1)
+
+
+def _synthetic(rows: int):
+    rng = np.random.default_rng(42)
+    dates = np.datetime64("2015-01-01") + rng.integers(0, 3620, rows)
+    amounts = np.round(-rng.lognormal(3, 1, rows), 2)
+    amounts[rng.random(rows) < 0.1] *= -5  # доходы
+    categories = rng.integers(-1, 30, rows)
+    # ежемесячная подписка — должна найтись в recurring_payments
+    subscription = np.arange(np.datetime64("2015-01-05"), np.datetime64(TODAY), 30)
+    return (
+        np.concatenate([dates, subscription]),
+        np.concatenate([amounts, np.full(len(subscription), -9.99)]),
+        np.concatenate([categories, np.full(len(subscription), 30)]),
+    )
+
+
+def _time(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return result, timings
+
+
+def _report(name: str, timings: list[float]):
+    print(f"{name:<10} median {statistics.median(timings) * 1000:8.1f} ms   max {max(timings) * 1000:8.1f} ms")
+
+
+def _seed_db(dates, amounts, categories):
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = models.User(username="bench", hashed_password="x")
+    db.add(user)
+    db.commit()
+    rows = [
+        {"date": d, "amount": float(a), "category_id": None if c < 0 else int(c), "user_id": user.id}
+        for d, a, c in zip(dates.astype(object), amounts, categories)
+    ]
+    for i in range(0, len(rows), 50_000):
+        db.execute(insert(models.Operation), rows[i:i + 50_000])
+    db.commit()
+    return db, user
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", action="store_true", help="также мерить загрузку колонок из SQLite")
+    args = parser.parse_args()
+
+    dates, amounts, categories = _synthetic(args.rows)
+    print(f"rows: {len(amounts)}")
+
+    summary, timings = _time(lambda: analytics_service.compute_summary(dates, amounts, categories, today=TODAY), args.repeat)
+    _report("compute", timings)
+    print(f"recurring: {summary['recurring_payments'][:1]}")
+
+    if args.db:
+        db, user = _seed_db(dates, amounts, categories)
+        _, timings = _time(
+            lambda: analytics_service.to_arrays(crud.operation.get_operation_columns(db, user)), args.repeat,
+        )
+        _report("load", timings)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
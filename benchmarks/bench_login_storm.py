@@ -0,0 +1,102 @@
+"""
+Бенчмарк: влияние шторма логинов на латентность GET /operations.
+
+    SECRET_KEY=bench python benchmarks/bench_login_storm.py [--logins 200] [--requests 200]
+
+Запускает приложение in-process (httpx + ASGITransport) на временной SQLite-базе,
+меряет p50/p99 GET /operations без нагрузки и на фоне параллельных логинов.
+bcrypt выполняется в выделенном пуле (utils.utils), поэтому потоки threadpool
+Starlette, обслуживающие /operations, не должны голодать.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "bench")
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from db.database import Base, get_db, get_async_db, to_async_url
+from main import app
+
+
+def _setup_db():
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    async_session_factory = async_sessionmaker(create_async_engine(to_async_url(url)), expire_on_commit=False)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with async_session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+
+
+def _percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms"
+
+
+async def _measure_operations(client, headers, n: int, concurrency: int = 8) -> list[float]:
+    samples = []
+
+    async def worker():
+        while len(samples) < n:
+            started = time.perf_counter()
+            r = await client.get("/operations/", headers=headers)
+            r.raise_for_status()
+            samples.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+async def main(logins: int, requests: int):
+    _setup_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/auth/register", json={"username": "bench", "password": "bench123"})
+        tokens = (await client.post("/auth/login", data={"username": "bench", "password": "bench123"})).json()
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+        baseline = await _measure_operations(client, headers, requests)
+        print(f"/operations idle:        {_percentiles(baseline)}")
+
+        storm = [
+            client.post("/auth/login", data={"username": "bench", "password": "bench123"})
+            for _ in range(logins)
+        ]
+        storm_task = asyncio.gather(*storm)
+        await asyncio.sleep(0.05)
+        under_load = await _measure_operations(client, headers, requests)
+        results = await storm_task
+        rejected = sum(r.status_code == 503 for r in results)
+        print(f"/operations login storm: {_percentiles(under_load)}")
+        print(f"logins: {logins}, rejected with 503: {rejected}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.requests))
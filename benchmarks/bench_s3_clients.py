@@ -0,0 +1,71 @@
+"""
+Микробенчмарк: стоимость S3-вызова с новым boto3-клиентом на каждый вызов
+и с закэшированным клиентом services.s3_service.
+
+    SECRET_KEY=bench python benchmarks/bench_s3_clients.py [--calls 200]
+
+Меряется generate_presigned_url — подпись считается локально, сеть и MinIO
+не нужны, поэтому разница — ровно цена создания клиента.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "bench")
+
+import boto3
+from botocore.config import Config
+from services import s3_service
+
+
+def _old_client():
+    """Как s3_service._get_public_client() до кэширования: новый клиент на каждый вызов."""
+    return boto3.client(
+        "s3",
+        endpoint_url=s3_service.S3_PUBLIC_ENDPOINT,
+        aws_access_key_id=s3_service.S3_ACCESS_KEY,
+        aws_secret_access_key=s3_service.S3_SECRET_KEY,
+        config=Config(signature_version="s3v4"),
+    )
+
+
+def _presign(client) -> str:
+    return client.generate_presigned_url(
+        "get_object", Params={"Bucket": s3_service.S3_BUCKET, "Key": "bench.pdf"}, ExpiresIn=60,
+    )
+
+
+def _time(fn, calls: int) -> list[float]:
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _report(name: str, timings: list[float]):
+    print(f"{name:<16} median {statistics.median(timings) * 1000:8.3f} ms   "
+          f"p99 {sorted(timings)[int(len(timings) * 0.99) - 1] * 1000:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    new_each_call = _time(lambda: _presign(_old_client()), args.calls)
+    s3_service.init_clients()
+    cached = _time(lambda: _presign(s3_service._get_public_client()), args.calls)
+
+    _report("new client", new_each_call)
+    _report("cached client", cached)
+    saved = statistics.median(new_each_call) - statistics.median(cached)
+    print(f"saved per call: {saved * 1000:.3f} ms ({statistics.median(new_each_call) / statistics.median(cached):.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from models import models
+from utils.auth import invalidate_cached_user
 import schemas.user
 
 def get_all_users(db: Session):
@@ -12,5 +13,6 @@ def update_user_role(user: models.User, new_role: str, db: Session):
     user.role = new_role
     db.add(user)
     db.commit()
+    invalidate_cached_user(user.id)
     db.refresh(user)
     return user
@@ -1,5 +1,6 @@
 from models import models
 from sqlalchemy.orm import Session
+import crud.operation
 import schemas.category
 
 def get_categories(db: Session, current_user: models.User) -> list[models.Category]:
@@ -13,6 +14,10 @@ def get_category(category_id: int, db: Session,
         models.Category.user_id == current_user.id
     ).first()
 
+def get_category_ids_by_name(db: Session, current_user: models.User) -> dict[str, int]:
+    rows = db.query(models.Category.name, models.Category.id).filter(models.Category.user_id == current_user.id)
+    return {name: category_id for name, category_id in rows}
+
 def create_category(category: schemas.category.CategoryCreate,
         db: Session,
         current_user: models.User):
@@ -30,5 +35,6 @@ def update_category(category: models.Category, updated: schemas.category.Categor
     return category
 
 def delete_category(category: models.Category, db: Session):
+    crud.operation.detach_category(db, category.id)
     db.delete(category)
     db.commit()
@@ -1,9 +1,14 @@
 from models import models
-from sqlalchemy.orm import Session
-from sqlalchemy import func, asc, desc
+from sqlalchemy.orm import Session, selectinload, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import String, select, insert, update, delete, func, asc, desc, tuple_, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
+from collections import defaultdict
 import schemas.operation
-from datetime import date
+from datetime import date, datetime, timedelta
 from typing import Optional
+import base64
+import json
 
 
 SORT_FIELDS = {
@@ -11,6 +16,164 @@ SORT_FIELDS = {
     "amount": models.Operation.amount,
 }
 
+# Как подгружать category и files, которые сериализует schemas.operation.Operation.
+# "selectin" — 1 доп. запрос на связь для всей страницы, "joined" — JOIN в основном
+# запросе, "lazy" — по запросу на каждую строку (N+1; только если связи не нужны).
+RELATION_LOADERS = {
+    "selectin": selectinload,
+    "joined": joinedload,
+}
+DEFAULT_RELATIONS_LOADING = "selectin"
+
+
+def _with_relations(stmt, relations_loading: str):
+    loader = RELATION_LOADERS.get(relations_loading)
+    if loader is None:
+        return stmt
+    return stmt.options(loader(models.Operation.category), loader(models.Operation.files))
+
+
+def encode_cursor(op: models.Operation, sort_by: str, sort_order: str) -> str:
+    """Непрозрачный курсор: значение ключа сортировки + id последней операции страницы."""
+    value = getattr(op, sort_by)
+    payload = {
+        "s": sort_by,
+        "o": sort_order,
+        "v": value.isoformat() if isinstance(value, date) else value,
+        "id": op.id,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload["s"] != sort_by or payload["o"] != sort_order:
+            raise ValueError("cursor was issued for a different sort")
+        value = date.fromisoformat(payload["v"]) if sort_by == "date" else float(payload["v"])
+        return value, int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _operation_conditions(
+        current_user: models.User,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        category_id: Optional[int] = None,
+        comment: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+) -> list:
+    conditions = [models.Operation.user_id == current_user.id]
+    if start_date:
+        conditions.append(models.Operation.date >= start_date)
+    if end_date:
+        conditions.append(models.Operation.date <= end_date)
+    if category_id:
+        conditions.append(models.Operation.category_id == category_id)
+    if comment:
+        conditions.append(models.Operation.comment.ilike(f"%{comment}%"))
+    if min_amount is not None:
+        conditions.append(models.Operation.amount >= min_amount)
+    if max_amount is not None:
+        conditions.append(models.Operation.amount <= max_amount)
+    return conditions
+
+
+def _operations_page_statements(
+        current_user: models.User,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        category_id: Optional[int] = None,
+        comment: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        sort_by: str = "date",
+        sort_order: str = "desc",
+        page: int = 1,
+        page_size: int = 20,
+        cursor: Optional[str] = None,
+        with_total: bool = True,
+        relations_loading: str = DEFAULT_RELATIONS_LOADING,
+):
+    """Строит (count_stmt | None, page_stmt) — общие для sync и async версий."""
+    conditions = _operation_conditions(
+        current_user, start_date=start_date, end_date=end_date, category_id=category_id,
+        comment=comment, min_amount=min_amount, max_amount=max_amount,
+    )
+
+    count_stmt = select(func.count(models.Operation.id)).where(*conditions) if with_total else None
+
+    sort_col = SORT_FIELDS[sort_by]
+    descending = sort_order == "desc"
+    order_fn = desc if descending else asc
+
+    # id — тай-брейкер, чтобы порядок был строгим и курсор однозначным
+    stmt = select(models.Operation).where(*conditions).order_by(order_fn(sort_col), order_fn(models.Operation.id))
+
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, sort_by, sort_order)
+        key = tuple_(sort_col, models.Operation.id)
+        bound = tuple_(last_value, last_id)
+        stmt = stmt.where(key < bound if descending else key > bound)
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+
+    page_stmt = _with_relations(stmt, relations_loading).limit(page_size + 1)
+    return count_stmt, page_stmt
+
+
+def _operations_page(rows, total, sort_by: str, sort_order: str, page: int, page_size: int) -> dict:
+    items = rows[:page_size]
+    next_cursor = encode_cursor(items[-1], sort_by, sort_order) if len(rows) > page_size else None
+    pages = (total + page_size - 1) // page_size if total is not None else None
+    return {
+        "items": items, "total": total, "page": page, "page_size": page_size, "pages": pages,
+        "next_cursor": next_cursor,
+    }
+
+
+EXPORT_COLUMNS = ("id", "date", "amount", "comment", "category_id", "category")
+
+
+def iter_operations_for_export(db: Session, current_user: models.User, batch_size: int = 1000, **filters):
+    """Строки операций (RowMapping с EXPORT_COLUMNS) по порядку (date, id).
+
+    yield_per читает результат порциями через серверный курсор (stream_results),
+    поэтому память не зависит от числа операций. ORM-объекты не создаются.
+    """
+    stmt = (
+        select(
+            models.Operation.id, models.Operation.date, models.Operation.amount,
+            models.Operation.comment, models.Operation.category_id,
+            models.Category.name.label("category"),
+        )
+        .outerjoin(models.Category, models.Operation.category_id == models.Category.id)
+        .where(*_operation_conditions(current_user, **filters))
+        .order_by(models.Operation.date, models.Operation.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in db.execute(stmt).mappings().partitions():
+        yield from partition
+
+
+def get_operation_columns(db: Session, current_user: models.User, **filters) -> list[tuple]:
+    """(date, amount, category_id) всех операций пользователя одним запросом — для аналитики.
+
+    Дата не конвертируется в datetime.date: SQLite отдаёт ISO-строку, и NumPy разбирает
+    миллион таких строк на порядок быстрее, чем date-объекты (драйверы, которые сами
+    возвращают date, работают как раньше).
+    """
+    stmt = select(
+        type_coerce(models.Operation.date, String), models.Operation.amount, models.Operation.category_id,
+    ).where(
+        *_operation_conditions(current_user, **filters)
+    )
+    return db.execute(stmt).tuples().all()
+
 
 def get_operations(
         db: Session,
@@ -25,65 +188,343 @@ def get_operations(
         sort_order: str = "desc",
         page: int = 1,
         page_size: int = 20,
+        cursor: Optional[str] = None,
+        with_total: bool = True,
+        relations_loading: str = DEFAULT_RELATIONS_LOADING,
 ):
-    query = db.query(models.Operation).filter(models.Operation.user_id == current_user.id)
+    """Страница операций пользователя.
 
-    if start_date:
-        query = query.filter(models.Operation.date >= start_date)
-    if end_date:
-        query = query.filter(models.Operation.date <= end_date)
-    if category_id:
-        query = query.filter(models.Operation.category_id == category_id)
-    if comment:
-        query = query.filter(models.Operation.comment.ilike(f"%{comment}%"))
-    if min_amount is not None:
-        query = query.filter(models.Operation.amount >= min_amount)
-    if max_amount is not None:
-        query = query.filter(models.Operation.amount <= max_amount)
+    Без `cursor` работает классическая OFFSET-пагинация по `page`. С `cursor`
+    используется keyset-пагинация по (sort_col, id) — стоимость не зависит от
+    глубины страницы. `next_cursor` возвращается в обоих режимах.
+    При `with_total=False` отдельный COUNT(*) не выполняется, а `total`/`pages`
+    равны None — наличие следующей страницы видно по `next_cursor`.
+    """
+    if sort_by not in SORT_FIELDS:
+        sort_by = "date"
+    count_stmt, page_stmt = _operations_page_statements(
+        current_user, start_date=start_date, end_date=end_date,
+        category_id=category_id, comment=comment,
+        min_amount=min_amount, max_amount=max_amount,
+        sort_by=sort_by, sort_order=sort_order, page=page, page_size=page_size,
+        cursor=cursor, with_total=with_total, relations_loading=relations_loading,
+    )
+    total = db.execute(count_stmt).scalar_one() if count_stmt is not None else None
+    rows = db.execute(page_stmt).scalars().unique().all()
+    return _operations_page(rows, total, sort_by, sort_order, page, page_size)
+
+
+async def get_operations_async(db: AsyncSession, current_user: models.User, **params):
+    """Async-версия get_operations (те же параметры) для AsyncSession."""
+    if params.get("sort_by") not in SORT_FIELDS:
+        params["sort_by"] = "date"
+    params.setdefault("sort_order", "desc")
+    params.setdefault("page", 1)
+    params.setdefault("page_size", 20)
+    count_stmt, page_stmt = _operations_page_statements(current_user, **params)
+    total = (await db.execute(count_stmt)).scalar_one() if count_stmt is not None else None
+    rows = (await db.execute(page_stmt)).scalars().unique().all()
+    return _operations_page(rows, total, params["sort_by"], params["sort_order"], params["page"], params["page_size"])
+
+
+def _sum_amounts_select(user_id: int):
+    return select(func.coalesce(func.sum(models.Operation.amount), 0.0)).where(models.Operation.user_id == user_id)
+
+
+def _sum_amounts(db: Session, user_id: int) -> float:
+    return db.execute(_sum_amounts_select(user_id)).scalar_one()
 
-    total = query.count()
 
-    sort_col = SORT_FIELDS.get(sort_by, models.Operation.date)
-    order_fn = desc if sort_order == "desc" else asc
-    query = query.order_by(order_fn(sort_col))
+# INSERT ... ON CONFLICT: синтаксис SQLite и PostgreSQL совпадает, конструкторы — свои у диалекта
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
 
-    items = query.offset((page - 1) * page_size).limit(page_size).all()
-    pages = (total + page_size - 1) // page_size
 
-    return {"items": items, "total": total, "page": page, "page_size": page_size, "pages": pages}
+def _upsert_balance(db: Session, user_id: int, delta: float) -> None:
+    """Создаёт строку user_balances из SUM по операциям; если её уже вставила
+    параллельная транзакция — сдвигает баланс на delta (ON CONFLICT DO UPDATE)."""
+    balance = models.UserBalance
+    stmt = _UPSERT_INSERTS[db.get_bind().dialect.name](balance).values(
+        user_id=user_id, balance=_sum_amounts_select(user_id).scalar_subquery(),
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[balance.user_id],
+        set_={"balance": balance.balance + delta, "updated_at": datetime.utcnow()},
+    ))
+
+
+def _apply_balance_delta(db: Session, user_id: int, delta: float) -> None:
+    """Сдвигает user_balances на delta в текущей транзакции (до commit вызывающего).
+
+    UPDATE ... SET balance = balance + delta атомарен относительно других писателей.
+    Если строки ещё нет (операции созданы до появления таблицы), она создаётся
+    из SUM по операциям — уже с учётом изменений этой транзакции — через upsert,
+    чтобы две одновременные первые записи пользователя не упали на PK.
+    """
+    if not delta:
+        return
+    result = db.execute(
+        update(models.UserBalance)
+        .where(models.UserBalance.user_id == user_id)
+        .values(balance=models.UserBalance.balance + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.flush()
+        _upsert_balance(db, user_id, delta)
+
+
+def _daily_stats_select():
+    op = models.Operation
+    return select(
+        op.user_id, op.date.label("day"), op.category_id,
+        func.sum(op.amount).label("total"), func.count(op.id).label("count"),
+        func.min(op.amount).label("min_amount"), func.max(op.amount).label("max_amount"),
+    ).group_by(op.user_id, op.date, op.category_id)
+
+
+def _refresh_daily_stats(db: Session, user_id: int, days) -> None:
+    """Пересчитывает rollup за затронутые дни одним GROUP BY (в текущей транзакции)."""
+    days = set(days)
+    if not days:
+        return
+    db.flush()
+    stat = models.OperationDailyStat
+    db.execute(
+        delete(stat).where(stat.user_id == user_id, stat.day.in_(days))
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.execute(
+        _daily_stats_select().where(models.Operation.user_id == user_id, models.Operation.date.in_(days))
+    ).mappings().all()
+    if rows:
+        db.execute(insert(stat), [dict(row) for row in rows])
+
+
+def detach_category(db: Session, category_id: int) -> None:
+    """Переводит операции категории в «без категории» и пересчитывает их дни в rollup.
+
+    Вызывается перед удалением категории, в той же транзакции: иначе строки
+    operation_daily_stats остались бы под удалённым category_id.
+    """
+    op = models.Operation
+    days = defaultdict(set)
+    for user_id, day in db.execute(select(op.user_id, op.date).where(op.category_id == category_id).distinct()):
+        days[user_id].add(day)
+    db.execute(
+        update(op).where(op.category_id == category_id).values(category_id=None)
+        .execution_options(synchronize_session="fetch")
+    )
+    for user_id, user_days in days.items():
+        _refresh_daily_stats(db, user_id, user_days)
+
+
+def _sync_aggregates(db: Session, user_id: int, delta: float, days) -> None:
+    """Обновляет производные данные (баланс и дневной rollup) до commit вызывающего."""
+    _apply_balance_delta(db, user_id, delta)
+    _refresh_daily_stats(db, user_id, days)
 
 
 def create_operation(op: schemas.operation.OperationCreate, db: Session, current_user: models.User):
     new_op = models.Operation(**op.model_dump(), user_id=current_user.id)
     db.add(new_op)
+    _sync_aggregates(db, current_user.id, new_op.amount, {new_op.date})
     db.commit()
     db.refresh(new_op)
     return new_op
 
 
-def get_operation(operation_id: int, db: Session, current_user: models.User):
-    return db.query(models.Operation).filter(
+def bulk_create_operations(db: Session, rows: list[dict]) -> int:
+    """Вставляет готовые строки (с user_id) одним executemany и коммитит. Без refresh."""
+    if not rows:
+        return 0
+    db.execute(insert(models.Operation), rows)
+    deltas = defaultdict(float)
+    days = defaultdict(set)
+    for row in rows:
+        deltas[row["user_id"]] += row["amount"]
+        days[row["user_id"]].add(row["date"])
+    for user_id, delta in deltas.items():
+        _sync_aggregates(db, user_id, delta, days[user_id])
+    db.commit()
+    return len(rows)
+
+
+def _operation_statement(operation_id: int, current_user: models.User, relations_loading: str):
+    stmt = select(models.Operation).where(
         models.Operation.id == operation_id,
         models.Operation.user_id == current_user.id
-    ).first()
+    )
+    return _with_relations(stmt, relations_loading)
+
+
+def get_operation(operation_id: int, db: Session, current_user: models.User,
+                  relations_loading: str = DEFAULT_RELATIONS_LOADING):
+    return db.execute(_operation_statement(operation_id, current_user, relations_loading)).scalars().first()
+
+
+async def get_operation_async(operation_id: int, db: AsyncSession, current_user: models.User,
+                              relations_loading: str = DEFAULT_RELATIONS_LOADING):
+    result = await db.execute(_operation_statement(operation_id, current_user, relations_loading))
+    return result.scalars().first()
+
+
+def get_operations_by_ids(db: Session, current_user: models.User, operation_ids) -> dict[int, models.Operation]:
+    """Операции пользователя с files одним запросом `id IN (...)`; чужие и несуществующие id отсутствуют."""
+    stmt = (
+        select(models.Operation)
+        .where(models.Operation.id.in_(set(operation_ids)), models.Operation.user_id == current_user.id)
+        .options(selectinload(models.Operation.files))
+    )
+    return {op.id: op for op in db.execute(stmt).scalars()}
+
+
+def apply_operations_batch(
+        db: Session,
+        current_user: models.User,
+        creates: list[schemas.operation.OperationCreate],
+        updates: list[tuple[models.Operation, schemas.operation.OperationCreate]],
+        deletes: list[models.Operation],
+) -> list[int]:
+    """Применяет create/update/delete в одной транзакции. Возвращает id созданных операций."""
+    new_ops = [models.Operation(**op.model_dump(), user_id=current_user.id) for op in creates]
+    db.add_all(new_ops)
+    delta = sum(op.amount for op in new_ops)
+    days = {op.date for op in new_ops}
+    for op, updated in updates:
+        delta += updated.amount - op.amount
+        days.update((op.date, updated.date))
+        for key, value in updated.model_dump().items():
+            setattr(op, key, value)
+    for op in deletes:
+        delta -= op.amount
+        days.add(op.date)
+        db.delete(op)
+    _sync_aggregates(db, current_user.id, delta, days)
+    db.flush()
+    created_ids = [op.id for op in new_ops]  # до commit: после него объекты expired
+    db.commit()
+    return created_ids
 
 
 def update_operation(op: models.Operation, updated: schemas.operation.OperationCreate, db: Session):
+    delta = updated.amount - op.amount
+    days = {op.date, updated.date}
     for key, value in updated.model_dump().items():
         setattr(op, key, value)
+    _sync_aggregates(db, op.user_id, delta, days)
     db.commit()
     db.refresh(op)
 
 
 def delete_operation(op: models.Operation, db: Session):
     db.delete(op)
+    _sync_aggregates(db, op.user_id, -op.amount, {op.date})
     db.commit()
 
 
 def get_total_balance(db: Session, current_user: models.User):
-    return db.query(func.sum(models.Operation.amount)).filter(
-        models.Operation.user_id == current_user.id
-    ).scalar() or 0.0
+    """Баланс из user_balances (O(1)); пока строки нет — SUM по операциям."""
+    balance = db.execute(
+        select(models.UserBalance.balance).where(models.UserBalance.user_id == current_user.id)
+    ).scalar_one_or_none()
+    if balance is None:
+        return _sum_amounts(db, current_user.id)
+    return balance
+
+
+def get_balance_drift(db: Session, tolerance: float = 1e-6) -> list[dict]:
+    """Пользователи, у которых user_balances расходится с SUM(operations.amount) (или строки нет)."""
+    actual = dict(db.execute(
+        select(models.Operation.user_id, func.sum(models.Operation.amount)).group_by(models.Operation.user_id)
+    ).all())
+    stored = dict(db.execute(select(models.UserBalance.user_id, models.UserBalance.balance)).all())
+    drift = []
+    for user_id in sorted(actual.keys() | stored.keys()):
+        expected = actual.get(user_id, 0.0)
+        current = stored.get(user_id)
+        if current is None or abs(current - expected) > tolerance:
+            drift.append({"user_id": user_id, "stored": current, "actual": expected})
+    return drift
+
+
+def set_balances(db: Session, balances: dict[int, float]) -> None:
+    """Записывает точные значения балансов (создаёт недостающие строки) и коммитит."""
+    stored = models.UserBalance
+    upsert = _UPSERT_INSERTS[db.get_bind().dialect.name]
+    for user_id, balance in balances.items():
+        stmt = upsert(stored).values(user_id=user_id, balance=balance)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[stored.user_id],
+            set_={"balance": stmt.excluded.balance, "updated_at": datetime.utcnow()},
+        ))
+    db.commit()
+
+
+STATS_GRANULARITIES = ("day", "week", "month")
+
+
+def _period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())  # понедельник
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def get_operation_stats(
+        db: Session,
+        current_user: models.User,
+        granularity: str = "day",
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        category_id: Optional[int] = None,
+) -> list[dict]:
+    """Сумма / количество / min / max по категориям за день, неделю или месяц.
+
+    Читает дневной rollup (не больше одной строки на день и категорию), дни
+    сворачиваются в недели и месяцы в Python.
+    """
+    stat = models.OperationDailyStat
+    stmt = (
+        select(stat, models.Category.name)
+        .outerjoin(models.Category, stat.category_id == models.Category.id)
+        .where(stat.user_id == current_user.id)
+        .order_by(stat.day, stat.category_id)
+    )
+    if start_date:
+        stmt = stmt.where(stat.day >= start_date)
+    if end_date:
+        stmt = stmt.where(stat.day <= end_date)
+    if category_id:
+        stmt = stmt.where(stat.category_id == category_id)
+
+    buckets: dict[tuple, dict] = {}
+    for row, category_name in db.execute(stmt).all():
+        key = (_period_start(row.day, granularity), row.category_id)
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = {
+                "period": key[0], "category_id": row.category_id, "category": category_name,
+                "total": row.total, "count": row.count, "min": row.min_amount, "max": row.max_amount,
+            }
+        else:
+            bucket["total"] += row.total
+            bucket["count"] += row.count
+            bucket["min"] = min(bucket["min"], row.min_amount)
+            bucket["max"] = max(bucket["max"], row.max_amount)
+    return sorted(buckets.values(), key=lambda b: (b["period"], b["category_id"] is not None, b["category_id"] or 0))
+
+
+def rebuild_daily_stats(db: Session) -> int:
+    """Полностью пересобирает operation_daily_stats из operations (INSERT ... SELECT) и коммитит."""
+    stat = models.OperationDailyStat
+    db.execute(delete(stat))
+    select_stmt = _daily_stats_select()
+    db.execute(insert(stat).from_select(
+        ["user_id", "day", "category_id", "total", "count", "min_amount", "max_amount"], select_stmt,
+    ))
+    db.commit()
+    return db.execute(select(func.count(stat.id))).scalar_one()
 
 
 # --- файлы ---
@@ -101,6 +542,19 @@ def create_file(db: Session, operation_id: int, filename: str, s3_key: str, cont
     return f
 
 
+async def create_file_async(db: AsyncSession, operation_id: int, filename: str, s3_key: str, content_type: str):
+    f = models.OperationFile(
+        operation_id=operation_id,
+        filename=filename,
+        s3_key=s3_key,
+        content_type=content_type,
+    )
+    db.add(f)
+    await db.commit()
+    await db.refresh(f)
+    return f
+
+
 def get_file(db: Session, file_id: int):
     return db.query(models.OperationFile).filter(models.OperationFile.id == file_id).first()
 
@@ -1,5 +1,7 @@
 from models import models
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import schemas.user
 import schemas.auth
 
@@ -13,3 +15,16 @@ def create_user(user: schemas.user.UserCreate, db: Session, hashed: str):
     db.commit()
     db.refresh(new_user)
     return new_user
+
+
+async def get_user_async(user, db: AsyncSession):
+    result = await db.execute(select(models.User).where(models.User.username == user.username))
+    return result.scalars().first()
+
+
+async def create_user_async(user: schemas.user.UserCreate, db: AsyncSession, hashed: str):
+    new_user = models.User(username=user.username, hashed_password=hashed, currency=user.currency, role=user.role)
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    return new_user
@@ -1,8 +1,11 @@
+import asyncio
 from fastapi import FastAPI
 from db.database import Base, engine
 from routers import users, categories, operations, admin, seo, analysis
 from starlette.middleware.cors import CORSMiddleware
-from services.s3_service import ensure_bucket
+from services.s3_service import ensure_bucket, init_clients
+from services import maintenance_service, groq_service
+from services.job_service import analysis_jobs
 
 Base.metadata.create_all(bind=engine)
 
@@ -10,8 +13,29 @@ app = FastAPI(title="Personal Finance Tracker API (with Auth)")
 
 @app.on_event("startup")
 def startup():
+    init_clients()
     ensure_bucket()
 
+
+@app.on_event("startup")
+async def start_background_jobs():
+    if maintenance_service.TOKEN_PURGE_INTERVAL_SECONDS > 0:
+        app.state.token_purge_task = asyncio.create_task(maintenance_service.run_token_purge_loop())
+    await analysis_jobs.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    task = getattr(app.state, "token_purge_task", None)
+    if task:
+        task.cancel()
+    await analysis_jobs.stop()
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await groq_service.close_client()
+
 FRONTEND_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
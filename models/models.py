@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Boolean, Index, Text
 from datetime import datetime
 from sqlalchemy.orm import relationship
 from db.database import Base
@@ -24,7 +24,7 @@ class RefreshToken(Base):
     id = Column(Integer, primary_key=True, index=True)
     token = Column(String, unique=True, nullable=False, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
     revoked = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -57,12 +57,50 @@ class Operation(Base):
     user = relationship("User", back_populates="operations")
     files = relationship("OperationFile", back_populates="operation", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # keyset-пагинация: WHERE user_id = ? AND (date, id) < (?, ?) ORDER BY date, id
+        Index("ix_operations_user_date_id", "user_id", "date", "id"),
+        Index("ix_operations_user_amount_id", "user_id", "amount", "id"),
+        # фильтр по категории (+ диапазон дат) в списке операций
+        Index("ix_operations_user_category_date", "user_id", "category_id", "date"),
+        # покрывающий для analytics_service: (date, amount, category_id) без чтения строк таблицы
+        Index("ix_operations_user_date_amount_category", "user_id", "date", "amount", "category_id"),
+    )
+
+
+class UserBalance(Base):
+    """Материализованный баланс: SUM(operations.amount) пользователя, обновляется в crud.operation."""
+    __tablename__ = "user_balances"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    balance = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class OperationDailyStat(Base):
+    """Дневной rollup операций по (user, day, category); пересчитывается в crud.operation."""
+    __tablename__ = "operation_daily_stats"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    category_id = Column(Integer, nullable=True)
+    total = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
+    min_amount = Column(Float, nullable=False)
+    max_amount = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_operation_daily_stats_user_day", "user_id", "day"),
+    )
+
 
 class RevokedToken(Base):
     __tablename__ = "revoked_tokens"
 
     id = Column(Integer, primary_key=True, index=True)
-    token = Column(String, unique=True, nullable=False)
+    jti = Column(String, unique=True, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
@@ -70,10 +108,32 @@ class OperationFile(Base):
     __tablename__ = "operation_files"
 
     id = Column(Integer, primary_key=True, index=True)
-    operation_id = Column(Integer, ForeignKey("operations.id"), nullable=False)
+    operation_id = Column(Integer, ForeignKey("operations.id"), nullable=False, index=True)
     filename = Column(String, nullable=False)       # оригинальное имя файла
     s3_key = Column(String, unique=True, nullable=False)  # ключ в S3
     content_type = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     operation = relationship("Operation", back_populates="files")
+
+
+class AnalysisJob(Base):
+    """Фоновая задача AI-анализа; общая для всех воркеров uvicorn (services/job_service.py)."""
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(String(16), nullable=False)
+    operations = Column(Text, nullable=False, default="[]")  # JSON; очищается после выполнения
+    operations_count = Column(Integer, nullable=False)
+    analysis = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # воркеры забирают самую старую задачу в статусе queued
+        Index("ix_analysis_jobs_status_created", "status", "created_at"),
+        Index("ix_analysis_jobs_user_status", "user_id", "status"),
+    )
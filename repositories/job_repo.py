@@ -0,0 +1,74 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.orm import Session
+from models.models import AnalysisJob
+
+QUEUED, RUNNING = "queued", "running"
+
+
+def add_job(db: Session, job: AnalysisJob) -> None:
+    db.add(job)
+    db.commit()
+
+
+def get_job(db: Session, job_id: str) -> AnalysisJob | None:
+    return db.get(AnalysisJob, job_id)
+
+
+def update_job(db: Session, job_id: str, **values) -> None:
+    db.execute(update(AnalysisJob).where(AnalysisJob.id == job_id).values(**values))
+    db.commit()
+
+
+def _claimable(stale_before: datetime):
+    # queued — или running, но воркер, взявший задачу, давно не отчитался (упал вместе с процессом)
+    return or_(
+        AnalysisJob.status == QUEUED,
+        and_(AnalysisJob.status == RUNNING, AnalysisJob.started_at < stale_before),
+    )
+
+
+def claim_job(db: Session, stale_before: datetime, attempts: int = 5) -> Optional[AnalysisJob]:
+    """Переводит самую старую доступную задачу в running и возвращает её.
+
+    UPDATE ... WHERE id = ? AND <ещё доступна> — атомарная заявка: если задачу
+    успел забрать воркер другого процесса, rowcount = 0 и берётся следующая.
+    """
+    for _ in range(attempts):
+        job_id = db.execute(
+            select(AnalysisJob.id).where(_claimable(stale_before)).order_by(AnalysisJob.created_at).limit(1)
+        ).scalar_one_or_none()
+        if job_id is None:
+            db.rollback()
+            return None
+        claimed = db.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id, _claimable(stale_before))
+            .values(status=RUNNING, started_at=datetime.utcnow())
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(AnalysisJob, job_id)
+    return None
+
+
+def count_active(db: Session, user_id: int) -> int:
+    return db.execute(
+        select(func.count()).select_from(AnalysisJob)
+        .where(AnalysisJob.user_id == user_id, AnalysisJob.status.in_((QUEUED, RUNNING)))
+    ).scalar_one()
+
+
+def count_queued(db: Session) -> int:
+    return db.execute(
+        select(func.count()).select_from(AnalysisJob).where(AnalysisJob.status == QUEUED)
+    ).scalar_one()
+
+
+def delete_finished_before(db: Session, before: datetime) -> int:
+    deleted = db.execute(
+        delete(AnalysisJob).where(AnalysisJob.finished_at.is_not(None), AnalysisJob.finished_at <= before)
+    ).rowcount
+    db.commit()
+    return deleted
@@ -1,4 +1,5 @@
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.models import RefreshToken, RevokedToken
 from datetime import datetime
 
@@ -11,6 +12,14 @@ def save_refresh_token(db: Session, token: str, user_id: int, expires_at: dateti
     return rt
 
 
+async def save_refresh_token_async(db: AsyncSession, token: str, user_id: int, expires_at: datetime) -> RefreshToken:
+    rt = RefreshToken(token=token, user_id=user_id, expires_at=expires_at)
+    db.add(rt)
+    await db.commit()
+    await db.refresh(rt)
+    return rt
+
+
 def get_refresh_token(db: Session, token: str) -> RefreshToken | None:
     return db.query(RefreshToken).filter(RefreshToken.token == token).first()
 
@@ -30,12 +39,46 @@ def revoke_all_user_refresh_tokens(db: Session, user_id: int) -> None:
     db.commit()
 
 
-# Access token revocation (существующий механизм)
-def is_access_token_revoked(db: Session, token: str) -> bool:
-    return db.query(RevokedToken).filter(RevokedToken.token == token).first() is not None
+# Access token revocation (по jti токена)
+def is_access_token_revoked(db: Session, jti: str) -> bool:
+    return db.query(RevokedToken.id).filter(RevokedToken.jti == jti).first() is not None
+
+
+def revoke_access_token(db: Session, jti: str, expires_at: datetime) -> None:
+    if not is_access_token_revoked(db, jti):
+        db.add(RevokedToken(jti=jti, expires_at=expires_at))
+        db.commit()
+
 
+def get_revoked_jtis(db: Session, since: datetime | None = None) -> list[tuple[str, datetime]]:
+    """Ещё не истёкшие отзывы (jti, created_at), опционально — только созданные начиная с `since`."""
+    query = db.query(RevokedToken.jti, RevokedToken.created_at).filter(
+        RevokedToken.expires_at > datetime.utcnow()
+    )
+    if since is not None:
+        query = query.filter(RevokedToken.created_at >= since)
+    return query.all()
 
-def revoke_access_token(db: Session, token: str) -> None:
-    if not is_access_token_revoked(db, token):
-        db.add(RevokedToken(token=token))
+
+# Очистка истёкших записей
+def _delete_expired(db: Session, model, now: datetime, batch_size: int) -> int:
+    """Удаляет строки с expires_at < now пачками по batch_size, коммитя каждую пачку."""
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.query(model.id).filter(model.expires_at < now).limit(batch_size)]
+        if not ids:
+            break
+        db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
         db.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def delete_expired_refresh_tokens(db: Session, now: datetime, batch_size: int) -> int:
+    return _delete_expired(db, RefreshToken, now, batch_size)
+
+
+def delete_expired_revoked_tokens(db: Session, now: datetime, batch_size: int) -> int:
+    return _delete_expired(db, RevokedToken, now, batch_size)
@@ -4,6 +4,13 @@ from db.database import get_db
 from models import models
 import crud.admin_user
 from utils.role import role_required
+from utils.auth import user_cache
+from services.auth_service import revocation_cache
+from services.maintenance_service import purge_stats
+from services import groq_service
+from services.job_service import analysis_jobs
+from utils.utils import password_hasher_stats
+from db.database import pool_stats
 from schemas import user as user_schema
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
@@ -23,3 +30,18 @@ def change_user_role(user_id: int, role_update: user_schema.RoleUpdate, db: Sess
     if role_update.role not in ["user", "admin"]:
         raise HTTPException(status_code=400, detail="Invalid role")
     return crud.admin_user.update_user_role(user, role_update.role, db)
+
+
+@router.get("/metrics")
+def metrics(_: models.User = Depends(admin_dependency)):
+    """Счётчики in-process кэшей, фоновых задач и пула соединений этого воркера."""
+    return {
+        "user_cache": user_cache.stats(),
+        "revocation_cache": revocation_cache.stats(),
+        "token_purge": purge_stats,
+        "password_hasher": password_hasher_stats(),
+        "db_pool": pool_stats(),
+        "groq_cache": groq_service.cache_stats(),
+        "groq_breaker": groq_service.breaker.stats(),
+        "analysis_jobs": analysis_jobs.stats(),
+    }
@@ -1,27 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import json
+from datetime import date, timedelta
+from typing import AsyncIterator, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_db, get_async_db
 from utils.auth import get_current_user
 from models import models
-from services.groq_service import analyze_operations
+from services.groq_service import analyze_operations, stream_analysis
+from services import analytics_service
+from services.job_service import analysis_jobs, QueueFullError, UserLimitError
+from schemas.analysis import AnalysisJob
 import crud.operation
 
 router = APIRouter(prefix="/analysis", tags=["Analysis"])
 
 
-@router.get("/ai")
-async def ai_analysis(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-    limit: int = Query(50, ge=1, le=100),
-):
-    """Анализирует последние операции пользователя через Groq LLM."""
-    result = crud.operation.get_operations(
+# с days берутся все операции за период (не больше стольких), промпт сжимается под бюджет токенов
+ANALYSIS_MAX_OPERATIONS = 5000
+
+
+async def _recent_operations(db: AsyncSession, current_user: models.User, limit: int,
+                             days: Optional[int] = None) -> list[dict]:
+    result = await crud.operation.get_operations_async(
         db, current_user,
+        start_date=date.today() - timedelta(days=days - 1) if days else None,
         sort_by="date", sort_order="desc",
-        page=1, page_size=limit,
+        page=1, page_size=ANALYSIS_MAX_OPERATIONS if days else limit,
+        with_total=False,
     )
-    operations = [
+    return [
         {
             "date": str(op.date),
             "amount": op.amount,
@@ -31,6 +40,17 @@ async def ai_analysis(
         for op in result["items"]
     ]
 
+
+@router.get("/ai")
+async def ai_analysis(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=100),
+    days: Optional[int] = Query(None, ge=1, le=366),
+):
+    """Анализирует последние `limit` операций пользователя (или все за `days` дней) через Groq LLM."""
+    operations = await _recent_operations(db, current_user, limit, days)
+
     try:
         analysis = await analyze_operations(operations)
     except ValueError as e:
@@ -39,3 +59,91 @@ async def ai_analysis(
         raise HTTPException(status_code=503, detail=str(e))
 
     return {"analysis": analysis, "operations_count": len(operations)}
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse_events(first: Optional[str], chunks: AsyncIterator[str], operations_count: int) -> AsyncIterator[str]:
+    if first is not None:
+        yield _sse({"delta": first})
+    try:
+        async for delta in chunks:
+            yield _sse({"delta": delta})
+    except RuntimeError as e:
+        # заголовки уже отправлены — об ошибке сообщаем событием
+        yield _sse({"detail": str(e)}, event="error")
+        return
+    yield _sse({"operations_count": operations_count}, event="done")
+
+
+@router.get("/ai/stream")
+async def ai_analysis_stream(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=100),
+    days: Optional[int] = Query(None, ge=1, le=366),
+):
+    """То же, что /ai, но текст приходит Server-Sent Events по мере генерации.
+
+    События: `data: {"delta": "..."}` на каждый кусок текста, в конце
+    `event: done` с `operations_count` или `event: error` с `detail`.
+    """
+    operations = await _recent_operations(db, current_user, limit, days)
+    chunks = stream_analysis(operations)
+    # ждём первый кусок до отправки заголовков, чтобы ошибки Groq отдать как 503
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return StreamingResponse(
+        _sse_events(first, chunks, len(operations)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/jobs", response_model=AnalysisJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_analysis_job(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=100),
+    days: Optional[int] = Query(None, ge=1, le=366),
+):
+    """Ставит AI-анализ в очередь и сразу возвращает задачу; результат — через GET /analysis/jobs/{job_id}."""
+    operations = await _recent_operations(db, current_user, limit, days)
+    try:
+        return await analysis_jobs.submit(current_user.id, operations)
+    except UserLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/jobs/{job_id}", response_model=AnalysisJob)
+async def get_analysis_job(job_id: str, current_user: models.User = Depends(get_current_user)):
+    job = await analysis_jobs.get(job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/summary")
+def analytics_summary(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+):
+    """Скользящие средние, помесячная динамика, перцентили по категориям, регулярные платежи и аномалии.
+
+    Синхронный роут: расчёт на NumPy занимает CPU и выполняется в threadpool, не блокируя event loop.
+    """
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=422, detail="start_date cannot be after end_date")
+    return analytics_service.build_summary(db, current_user, start_date=start_date, end_date=end_date)
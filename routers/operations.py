@@ -1,12 +1,16 @@
 from datetime import date
 from typing import Optional, Literal
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_db, get_async_db
 from utils.auth import get_current_user
 from schemas import operation as op_schema
 from models import models
-from services import s3_service
+from services import s3_service, import_service, export_service
+import crud.category
 import crud.operation
 
 router = APIRouter(prefix="/operations", tags=["Operations"])
@@ -26,18 +30,24 @@ def get_operations(
         sort_order: Literal["asc", "desc"] = Query("desc"),
         page: int = Query(1, ge=1),
         page_size: int = Query(20, ge=1, le=100),
+        cursor: Optional[str] = Query(None, max_length=512),
+        with_total: bool = Query(True),
 ):
     if min_amount is not None and max_amount is not None and min_amount > max_amount:
         raise HTTPException(status_code=422, detail="min_amount cannot be greater than max_amount")
 
-    return crud.operation.get_operations(
-        db, current_user,
-        start_date=start_date, end_date=end_date,
-        category_id=category_id, comment=comment,
-        min_amount=min_amount, max_amount=max_amount,
-        sort_by=sort_by, sort_order=sort_order,
-        page=page, page_size=page_size,
-    )
+    try:
+        return crud.operation.get_operations(
+            db, current_user,
+            start_date=start_date, end_date=end_date,
+            category_id=category_id, comment=comment,
+            min_amount=min_amount, max_amount=max_amount,
+            sort_by=sort_by, sort_order=sort_order,
+            page=page, page_size=page_size,
+            cursor=cursor, with_total=with_total,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
 
 @router.post("/", response_model=op_schema.Operation)
@@ -49,6 +59,108 @@ def create_operation(
     return crud.operation.create_operation(op, db, current_user)
 
 
+@router.post("/import", response_model=op_schema.OperationImportResult)
+def import_operations(
+        file: UploadFile = File(...),
+        format: Optional[Literal["csv", "jsonl"]] = Query(None),
+        db: Session = Depends(get_db),
+        current_user: models.User = Depends(get_current_user),
+):
+    fmt = format or import_service.detect_format(file.filename)
+    try:
+        return import_service.import_operations(db, current_user, file.file, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/batch", response_model=op_schema.OperationBatchResult)
+def batch_operations(
+        batch: op_schema.OperationBatchRequest,
+        db: Session = Depends(get_db),
+        current_user: models.User = Depends(get_current_user),
+):
+    target_ids = [a.id for a in batch.actions if a.action != "create"]
+    if len(target_ids) != len(set(target_ids)):
+        raise HTTPException(status_code=422, detail="Each operation id may appear only once per batch")
+
+    # одна проверка владения для всех update/delete
+    owned = crud.operation.get_operations_by_ids(db, current_user, target_ids)
+    missing = [op_id for op_id in target_ids if op_id not in owned]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Operations not found: {missing}")
+
+    category_ids = {a.data.category_id for a in batch.actions if a.data and a.data.category_id is not None}
+    if category_ids - set(crud.category.get_category_ids_by_name(db, current_user).values()):
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    creates = [a.data for a in batch.actions if a.action == "create"]
+    updates = [(owned[a.id], a.data) for a in batch.actions if a.action == "update"]
+    deletes = [owned[a.id] for a in batch.actions if a.action == "delete"]
+    s3_keys = [f.s3_key for op in deletes for f in op.files]
+
+    created = crud.operation.apply_operations_batch(db, current_user, creates, updates, deletes)
+
+    # файлы удаляем после commit: если транзакция откатится, вложения останутся целы
+    if s3_keys:
+        try:
+            s3_service.delete_files(s3_keys)
+        except Exception:
+            pass
+    return {
+        "created": created,
+        "updated": [a.id for a in batch.actions if a.action == "update"],
+        "deleted": [a.id for a in batch.actions if a.action == "delete"],
+    }
+
+
+@router.get("/stats", response_model=op_schema.OperationStats)
+def get_operation_stats(
+        granularity: Literal["day", "week", "month"] = Query("day"),
+        start_date: Optional[date] = Query(None),
+        end_date: Optional[date] = Query(None),
+        category_id: Optional[int] = Query(None),
+        db: Session = Depends(get_db),
+        current_user: models.User = Depends(get_current_user),
+):
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=422, detail="start_date cannot be after end_date")
+    items = crud.operation.get_operation_stats(
+        db, current_user, granularity=granularity,
+        start_date=start_date, end_date=end_date, category_id=category_id,
+    )
+    return {"granularity": granularity, "items": items}
+
+
+@router.get("/export")
+def export_operations(
+        request: Request,
+        format: Literal["csv", "jsonl", "parquet", "arrow"] = Query("csv"),
+        start_date: Optional[date] = Query(None),
+        end_date: Optional[date] = Query(None),
+        category_id: Optional[int] = Query(None),
+        comment: Optional[str] = Query(None, max_length=200),
+        min_amount: Optional[float] = Query(None),
+        max_amount: Optional[float] = Query(None),
+        db: Session = Depends(get_db),
+        current_user: models.User = Depends(get_current_user),
+):
+    if not export_service.format_available(format):
+        raise HTTPException(status_code=400, detail=f"Format '{format}' is not available on this server (pyarrow is not installed)")
+
+    rows = crud.operation.iter_operations_for_export(
+        db, current_user, batch_size=export_service.EXPORT_BATCH_SIZE,
+        start_date=start_date, end_date=end_date, category_id=category_id,
+        comment=comment, min_amount=min_amount, max_amount=max_amount,
+    )
+    body = export_service.serialize(rows, format)
+    headers = {"Content-Disposition": f'attachment; filename="operations.{format}"', "Vary": "Accept-Encoding"}
+    # parquet/arrow уже сжаты внутри формата
+    if format in export_service.TEXT_FORMATS and export_service.accepts_gzip(request.headers.get("accept-encoding")):
+        body = export_service.gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=export_service.media_type(format), headers=headers)
+
+
 @router.get("/balance/total")
 def get_total_balance(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     total = crud.operation.get_total_balance(db, current_user)
@@ -96,25 +208,64 @@ def delete_operation(operation_id: int, db: Session = Depends(get_db),
 async def upload_file(
         operation_id: int,
         file: UploadFile = File(...),
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(get_current_user),
 ):
-    op = crud.operation.get_operation(operation_id, db, current_user)
+    op = await crud.operation.get_operation_async(operation_id, db, current_user, relations_loading="lazy")
     if not op:
         raise HTTPException(status_code=404, detail="Operation not found")
 
     if file.content_type not in s3_service.ALLOWED_CONTENT_TYPES:
         raise HTTPException(status_code=400, detail=f"File type not allowed. Allowed: {', '.join(s3_service.ALLOWED_CONTENT_TYPES)}")
 
-    file_bytes = await file.read()
-    if len(file_bytes) > s3_service.MAX_FILE_SIZE_BYTES:
-        raise HTTPException(status_code=400, detail=f"File too large. Max size: {s3_service.MAX_FILE_SIZE_MB}MB")
+    too_large = HTTPException(status_code=400, detail=f"File too large. Max size: {s3_service.MAX_FILE_SIZE_MB}MB")
+    if file.size is not None and file.size > s3_service.MAX_FILE_SIZE_BYTES:
+        raise too_large
 
-    s3_key = s3_service.upload_file(file_bytes, file.filename, file.content_type)
-    db_file = crud.operation.create_file(db, operation_id, file.filename, s3_key, file.content_type)
+    # файл читается кусками из временного файла multipart-парсера, boto3 — в threadpool
+    try:
+        s3_key = await run_in_threadpool(s3_service.upload_file, file.file, file.filename, file.content_type)
+    except s3_service.FileTooLargeError:
+        raise too_large
+    db_file = await crud.operation.create_file_async(db, operation_id, file.filename, s3_key, file.content_type)
     return db_file
 
 
+def _file_urls(op: models.Operation) -> dict:
+    files = []
+    for f in op.files:
+        url, expires_in = s3_service.get_cached_presigned_url(f.s3_key)
+        files.append({"id": f.id, "filename": f.filename, "content_type": f.content_type,
+                      "url": url, "expires_in": expires_in})
+    return {"operation_id": op.id, "files": files}
+
+
+@router.get("/files/urls", response_model=list[op_schema.OperationFileUrls])
+def get_files_urls(
+        ids: list[int] = Query(..., min_length=1, max_length=100),
+        db: Session = Depends(get_db),
+        current_user: models.User = Depends(get_current_user),
+):
+    """Presigned URL всех вложений нескольких операций одним запросом (в порядке ids)."""
+    ops = crud.operation.get_operations_by_ids(db, current_user, ids)
+    missing = sorted(set(ids) - ops.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Operations not found: {missing}")
+    return [_file_urls(ops[operation_id]) for operation_id in dict.fromkeys(ids)]
+
+
+@router.get("/{operation_id}/files/urls", response_model=op_schema.OperationFileUrls)
+def get_operation_files_urls(
+        operation_id: int,
+        db: Session = Depends(get_db),
+        current_user: models.User = Depends(get_current_user),
+):
+    op = crud.operation.get_operation(operation_id, db, current_user)
+    if not op:
+        raise HTTPException(status_code=404, detail="Operation not found")
+    return _file_urls(op)
+
+
 @router.get("/{operation_id}/files/{file_id}/url")
 def get_file_url(
         operation_id: int,
@@ -126,12 +277,13 @@ def get_file_url(
     if not op:
         raise HTTPException(status_code=404, detail="Operation not found")
 
-    f = crud.operation.get_file(db, file_id)
-    if not f or f.operation_id != operation_id:
+    # files уже загружены вместе с операцией — отдельный запрос за файлом не нужен
+    f = next((f for f in op.files if f.id == file_id), None)
+    if f is None:
         raise HTTPException(status_code=404, detail="File not found")
 
-    url = s3_service.get_presigned_url(f.s3_key)
-    return {"url": url, "filename": f.filename, "expires_in": s3_service.PRESIGNED_URL_EXPIRES}
+    url, expires_in = s3_service.get_cached_presigned_url(f.s3_key)
+    return {"url": url, "filename": f.filename, "expires_in": expires_in}
 
 
 @router.delete("/{operation_id}/files/{file_id}")
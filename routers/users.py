@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Body
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.database import get_db, get_async_db
 from schemas import user as user_schema
 from schemas.auth import Token, RefreshRequest
 from models import models
-from utils.utils import hash_password, verify_password
+from utils.utils import hash_password_async, verify_password_async, PasswordHasherBusy
 from utils.auth import get_current_user, oauth2_scheme
 from services import auth_service
 import crud.user
@@ -13,25 +14,45 @@ import crud.user
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+
+# register/login — async: bcrypt ждём из выделенного пула, с БД работаем через AsyncSession.
 @router.post("/register", response_model=user_schema.UserOut)
-def register(user: user_schema.UserCreate, db: Session = Depends(get_db)):
-    if crud.user.get_user(user, db):
+async def register(user: user_schema.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if await crud.user.get_user_async(user, db):
         raise HTTPException(status_code=400, detail="Username already taken")
-    hashed = hash_password(user.password)
-    return crud.user.create_user(user, db, hashed)
+    await db.close()  # не держим соединение из пула, пока ждём bcrypt
+    try:
+        hashed = await hash_password_async(user.password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+    return await crud.user.create_user_async(user, db, hashed)
 
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     class UsernameAdapter:
         username = form_data.username
 
-    db_user = crud.user.get_user(UsernameAdapter(), db)
-    if not db_user or not verify_password(form_data.password, db_user.hashed_password):
+    db_user = await crud.user.get_user_async(UsernameAdapter(), db)
+    if not db_user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    await db.close()  # не держим соединение из пула, пока ждём bcrypt; db_user остаётся загруженным
+    try:
+        password_ok = await verify_password_async(form_data.password, db_user.hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+    if not password_ok:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
     access_token = auth_service.create_access_token(db_user)
-    refresh_token = auth_service.create_refresh_token(db, db_user)
+    refresh_token = await auth_service.create_refresh_token_async(db, db_user)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
@@ -0,0 +1,17 @@
+from datetime import datetime
+from pydantic import BaseModel
+from typing import Optional, Literal
+
+
+class AnalysisJob(BaseModel):
+    id: str
+    status: Literal["queued", "running", "done", "failed"]
+    operations_count: int
+    analysis: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
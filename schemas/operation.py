@@ -1,5 +1,5 @@
 from datetime import date
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import Optional, Literal
 from schemas.category import Category
 
@@ -13,6 +13,19 @@ class OperationFileOut(BaseModel):
         orm_mode = True
 
 
+class OperationFileUrl(BaseModel):
+    id: int
+    filename: str
+    content_type: Optional[str] = None
+    url: str
+    expires_in: int  # секунд до истечения URL
+
+
+class OperationFileUrls(BaseModel):
+    operation_id: int
+    files: list[OperationFileUrl]
+
+
 class OperationBase(BaseModel):
     date: date
     amount: float
@@ -42,7 +55,60 @@ class Operation(OperationBase):
 
 class OperationsPage(BaseModel):
     items: list[Operation]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
+class OperationImportError(BaseModel):
+    line: int
+    error: str
+
+
+class OperationImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: list[OperationImportError]
+
+
+class OperationBatchAction(BaseModel):
+    action: Literal["create", "update", "delete"]
+    id: Optional[int] = None
+    data: Optional[OperationCreate] = None
+
+    @model_validator(mode="after")
+    def check_fields_for_action(self):
+        if self.action == "create" and (self.data is None or self.id is not None):
+            raise ValueError("create requires data and no id")
+        if self.action == "update" and (self.data is None or self.id is None):
+            raise ValueError("update requires id and data")
+        if self.action == "delete" and self.id is None:
+            raise ValueError("delete requires id")
+        return self
+
+
+class OperationBatchRequest(BaseModel):
+    actions: list[OperationBatchAction] = Field(..., min_length=1, max_length=1000)
+
+
+class OperationBatchResult(BaseModel):
+    created: list[int]
+    updated: list[int]
+    deleted: list[int]
+
+
+class OperationStatsBucket(BaseModel):
+    period: date  # первый день периода (для week — понедельник)
+    category_id: Optional[int] = None
+    category: Optional[str] = None
+    total: float
+    count: int
+    min: float
+    max: float
+
+
+class OperationStats(BaseModel):
+    granularity: Literal["day", "week", "month"]
+    items: list[OperationStatsBucket]
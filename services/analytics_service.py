@@ -0,0 +1,276 @@
+"""Аналитика расходов пользователя на NumPy.
+
+Колонки операций (date, amount, category_id) загружаются одним запросом в
+массивы, дальше всё считается векторно — без Python-циклов по строкам:
+скользящие средние, помесячная динамика, перцентили трат по категориям,
+регулярные платежи и аномальные траты.
+
+Траты (spend) — модуль отрицательных сумм; доходы — положительные суммы.
+"""
+from datetime import date
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import models
+import crud.category
+import crud.operation
+
+NO_CATEGORY = -1  # category_id = NULL в массивах
+
+MOVING_AVERAGE_WINDOWS = (7, 30)
+SERIES_DAYS = 90
+MONTHS = 12
+PERCENTILES = (50, 90, 95)
+
+# регулярный платёж: одна категория и сумма, >= 3 раз, с почти постоянным интервалом
+RECURRING_MIN_OCCURRENCES = 3
+RECURRING_PERIODS = {"weekly": (6, 8), "monthly": (26, 35), "yearly": (355, 375)}
+RECURRING_MAX_GAP_STD_DAYS = 3.0
+RECURRING_LIMIT = 20
+
+# аномалия: трата, z-score которой в своей категории выше порога. z считается
+# против остальных трат категории (leave-one-out): иначе выброс сам раздувает std,
+# и в категории из n трат z не превышает (n-1)/√n — при пороге 3 это n ≥ 11
+ANOMALY_Z = 3.0
+ANOMALY_MIN_CATEGORY_SIZE = 5
+# нижняя граница std остальных трат — доля их среднего (одинаковые траты дают std = 0)
+ANOMALY_STD_FLOOR = 0.05
+ANOMALY_LIMIT = 20
+
+
+def to_arrays(rows) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(date, amount, category_id) строки → массивы datetime64[D], float64, int64."""
+    if not rows:
+        return np.array([], dtype="datetime64[D]"), np.array([], dtype=np.float64), np.array([], dtype=np.int64)
+    dates, amounts, categories = zip(*rows)
+    return (
+        np.array(dates, dtype="datetime64[D]"),
+        np.array(amounts, dtype=np.float64),
+        np.array([NO_CATEGORY if c is None else c for c in categories], dtype=np.int64),
+    )
+
+
+def _day_str(value: np.datetime64) -> str:
+    return str(value.astype("datetime64[D]"))
+
+
+def _category(category_id: int) -> Optional[int]:
+    return None if category_id == NO_CATEGORY else int(category_id)
+
+
+def _moving_averages(dates: np.ndarray, spend: np.ndarray, today: np.datetime64) -> dict:
+    start = dates.min()
+    span = int((today - start).astype(int)) + 1
+    daily = np.bincount((dates - start).astype(np.int64), weights=spend, minlength=span)[:span]
+    cumsum = np.concatenate(([0.0], np.cumsum(daily)))
+
+    shown = min(SERIES_DAYS, span)
+    series = {"date": [_day_str(start + i) for i in range(span - shown, span)], "spend": daily[-shown:].round(2).tolist()}
+    latest = {}
+    for window in MOVING_AVERAGE_WINDOWS:
+        # среднее за window дней, заканчивающихся в день i (в начале истории — за сколько есть)
+        ends = np.arange(1, span + 1)
+        starts = np.maximum(ends - window, 0)
+        averages = (cumsum[ends] - cumsum[starts]) / (ends - starts)
+        series[f"ma{window}"] = averages[-shown:].round(2).tolist()
+        latest[f"ma{window}"] = round(float(averages[-1]), 2)
+    return {"latest": latest, "series": series}
+
+
+def _month_over_month(months: np.ndarray, amounts: np.ndarray) -> list[dict]:
+    first = months.min()
+    idx = (months - first).astype(np.int64)
+    size = int(idx.max()) + 1
+    income = np.bincount(idx, weights=np.where(amounts > 0, amounts, 0.0), minlength=size)
+    spend = np.bincount(idx, weights=np.where(amounts < 0, -amounts, 0.0), minlength=size)
+
+    previous = np.concatenate(([np.nan], spend[:-1]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(previous > 0, (spend - previous) / previous * 100, np.nan)
+
+    result = []
+    for i in range(max(size - MONTHS, 0), size):
+        result.append({
+            "month": str(first + i),
+            "income": round(float(income[i]), 2),
+            "spend": round(float(spend[i]), 2),
+            "net": round(float(income[i] - spend[i]), 2),
+            "spend_change_pct": None if np.isnan(change[i]) else round(float(change[i]), 1),
+        })
+    return result
+
+
+class _Expenses:
+    """Траты, один раз отсортированные по (категория, сумма, дата) — общая основа для групповых метрик."""
+
+    def __init__(self, dates: np.ndarray, categories: np.ndarray, spend: np.ndarray):
+        # плотные номера категорий: bincount вместо сортировки в np.unique
+        offset = categories.min()
+        present = np.bincount(categories - offset) > 0
+        self.category_values = np.flatnonzero(present) + offset
+        rank = (np.cumsum(present) - 1)[categories - offset]
+        cents = np.round(spend * 100).astype(np.int64)
+        day_numbers = dates.astype(np.int64)
+
+        self.order = self._sort_order(rank, cents, day_numbers)
+        self.rank = rank[self.order]
+        self.cents = cents[self.order]
+        self.days = day_numbers[self.order]
+        self.spend = spend[self.order]
+        self.unsorted_rank = rank
+
+    @staticmethod
+    def _sort_order(rank: np.ndarray, cents: np.ndarray, days: np.ndarray) -> np.ndarray:
+        day_offset = days - days.min()
+        bits_rank = int(rank.max()).bit_length()
+        bits_day = int(day_offset.max()).bit_length()
+        bits_cents = int(cents.max()).bit_length()
+        if bits_rank + bits_cents + bits_day <= 63:
+            # один argsort по упакованному int64-ключу в ~2.5 раза быстрее lexsort
+            key = (rank << (bits_cents + bits_day)) | (cents << bits_day) | day_offset
+            return np.argsort(key)
+        return np.lexsort((days, cents, rank))
+
+    def category_id(self, rank: int) -> Optional[int]:
+        return _category(self.category_values[rank])
+
+    @staticmethod
+    def bounds(change: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        starts = np.flatnonzero(np.concatenate(([True], change)))
+        return starts, np.diff(np.append(starts, len(change) + 1))
+
+
+def _category_percentiles(e: _Expenses) -> list[dict]:
+    starts, counts = e.bounds(e.rank[1:] != e.rank[:-1])
+    ends = starts + counts
+    values = e.spend  # внутри категории отсортированы по сумме
+    result = []
+    for q in PERCENTILES:
+        # линейная интерполяция внутри каждой отсортированной группы (как np.percentile)
+        pos = starts + (counts - 1) * (q / 100)
+        low = np.floor(pos).astype(np.int64)
+        high = np.minimum(low + 1, ends - 1)
+        frac = pos - low
+        result.append(values[low] * (1 - frac) + values[high] * frac)
+    totals = np.add.reduceat(values, starts)
+    return [
+        {
+            "category_id": e.category_id(e.rank[start]),
+            "count": int(counts[i]),
+            "total": round(float(totals[i]), 2),
+            **{f"p{q}": round(float(result[j][i]), 2) for j, q in enumerate(PERCENTILES)},
+        }
+        for i, start in enumerate(starts)
+    ]
+
+
+def _recurring_payments(e: _Expenses, today: np.datetime64) -> list[dict]:
+    same_key = (e.rank[1:] == e.rank[:-1]) & (e.cents[1:] == e.cents[:-1])
+    starts, counts = e.bounds(~same_key)
+    days = e.days
+
+    # интервалы между соседними платежами внутри группы (на границах групп вес 0)
+    gaps = np.diff(days, prepend=days[0]).astype(np.float64)
+    inner = np.concatenate(([0.0], same_key.astype(np.float64)))
+    gap_sum = np.add.reduceat(gaps * inner, starts)
+    gap_sq = np.add.reduceat(gaps * gaps * inner, starts)
+    n_gaps = np.maximum(counts - 1, 1)
+    mean_gap = gap_sum / n_gaps
+    std_gap = np.sqrt(np.maximum(gap_sq / n_gaps - mean_gap ** 2, 0.0))
+    last_days = days[starts + counts - 1]
+
+    # ещё активен: с последнего платежа прошло не больше полутора интервалов
+    active = (today.astype(np.int64) - last_days) <= 1.5 * mean_gap
+    candidates = (counts >= RECURRING_MIN_OCCURRENCES) & (std_gap <= RECURRING_MAX_GAP_STD_DAYS) & active
+    period = np.full(len(starts), "", dtype=object)
+    for name, (low, high) in RECURRING_PERIODS.items():
+        period[candidates & (mean_gap >= low) & (mean_gap <= high)] = name
+    found = np.flatnonzero(period != "")
+    found = found[np.argsort(-counts[found], kind="stable")][:RECURRING_LIMIT]
+
+    return [
+        {
+            "category_id": e.category_id(e.rank[starts[i]]),
+            "amount": round(float(e.cents[starts[i]]) / 100, 2),
+            "period": period[i],
+            "occurrences": int(counts[i]),
+            "mean_interval_days": round(float(mean_gap[i]), 1),
+            "last_date": _day_str(np.datetime64(int(last_days[i]), "D")),
+            "next_expected": _day_str(np.datetime64(int(round(last_days[i] + mean_gap[i])), "D")),
+        }
+        for i in found
+    ]
+
+
+def _anomalies(e: _Expenses, dates: np.ndarray, spend: np.ndarray) -> list[dict]:
+    cat_idx = e.unsorted_rank
+    counts = np.bincount(cat_idx)
+    sums = np.bincount(cat_idx, weights=spend)
+    squares = np.bincount(cat_idx, weights=spend * spend)
+    mean = sums / counts
+
+    # среднее и std остальных трат категории для каждой строки
+    others = counts[cat_idx] - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        others_mean = (sums[cat_idx] - spend) / others
+        others_var = (squares[cat_idx] - spend * spend) / others - others_mean ** 2
+        others_std = np.maximum(np.sqrt(np.maximum(others_var, 0.0)), ANOMALY_STD_FLOOR * np.abs(others_mean))
+        z = np.where((others > 0) & (others_std > 0), (spend - others_mean) / others_std, 0.0)
+    flagged = np.flatnonzero((z > ANOMALY_Z) & (counts[cat_idx] >= ANOMALY_MIN_CATEGORY_SIZE))
+    flagged = flagged[np.argsort(-z[flagged], kind="stable")][:ANOMALY_LIMIT]
+    return [
+        {
+            "date": _day_str(dates[i]),
+            "amount": round(float(-spend[i]), 2),
+            "category_id": e.category_id(cat_idx[i]),
+            "category_mean": round(float(mean[cat_idx[i]]), 2),
+            "z_score": round(float(z[i]), 2),
+        }
+        for i in flagged
+    ]
+
+
+def compute_summary(dates: np.ndarray, amounts: np.ndarray, categories: np.ndarray,
+                    today: Optional[date] = None) -> dict:
+    """Сводка по массивам одной выборки операций (порядок строк не важен)."""
+    if len(amounts) == 0:
+        return {
+            "operations_count": 0, "moving_average": None, "month_over_month": [],
+            "category_percentiles": [], "recurring_payments": [], "anomalies": [],
+        }
+    today = np.datetime64(today or date.today(), "D")
+    today = max(today, dates.max())
+
+    expenses = amounts < 0
+    spend_all = np.where(expenses, -amounts, 0.0)
+    e_dates, e_categories, e_spend = dates[expenses], categories[expenses], -amounts[expenses]
+
+    summary = {
+        "operations_count": int(len(amounts)),
+        "moving_average": _moving_averages(dates, spend_all, today),
+        "month_over_month": _month_over_month(dates.astype("datetime64[M]"), amounts),
+        "category_percentiles": [], "recurring_payments": [], "anomalies": [],
+    }
+    if len(e_spend):
+        e = _Expenses(e_dates, e_categories, e_spend)
+        summary["category_percentiles"] = _category_percentiles(e)
+        summary["recurring_payments"] = _recurring_payments(e, today)
+        summary["anomalies"] = _anomalies(e, e_dates, e_spend)
+    return summary
+
+
+def _with_category_names(summary: dict, names: dict[int, str]) -> dict:
+    for section in ("category_percentiles", "recurring_payments", "anomalies"):
+        for item in summary[section]:
+            item["category"] = names.get(item["category_id"])
+    return summary
+
+
+def build_summary(db: Session, current_user: models.User, start_date: Optional[date] = None,
+                  end_date: Optional[date] = None) -> dict:
+    rows = crud.operation.get_operation_columns(db, current_user, start_date=start_date, end_date=end_date)
+    summary = compute_summary(*to_arrays(rows), today=end_date)
+    names = {category_id: name for name, category_id in crud.category.get_category_ids_by_name(db, current_user).items()}
+    return _with_category_names(summary, names)
@@ -1,13 +1,18 @@
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from fastapi import HTTPException, status
 import secrets
+import threading
+import time
+import uuid
 import os
 from dotenv import load_dotenv
 
 from models.models import User
 from repositories import token_repo
+from utils.cache import TTLCache, BloomFilter
 
 load_dotenv()
 
@@ -16,10 +21,15 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
+# Как часто подтягивать из БД отзывы, сделанные другими воркерами (секунды).
+# Это же — максимальное окно, в которое отозванный в другом процессе токен ещё принимается.
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+REVOCATION_FILTER_CAPACITY = 100_000
+
 
 def create_access_token(user: User) -> str:
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    payload = {"user_id": user.id, "role": user.role, "exp": expire}
+    payload = {"user_id": user.id, "role": user.role, "exp": expire, "jti": uuid.uuid4().hex}
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
@@ -30,6 +40,13 @@ def create_refresh_token(db: Session, user: User) -> str:
     return token
 
 
+async def create_refresh_token_async(db: AsyncSession, user: User) -> str:
+    token = secrets.token_urlsafe(64)
+    expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    await token_repo.save_refresh_token_async(db, token=token, user_id=user.id, expires_at=expires_at)
+    return token
+
+
 def decode_access_token(token: str) -> dict:
     try:
         return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -53,6 +70,79 @@ def rotate_refresh_token(db: Session, old_token: str) -> tuple[User, str]:
     return rt.user, new_token
 
 
+class RevocationCache:
+    """Проверка отзыва access-токенов по `jti` без похода в БД в типичном случае.
+
+    Фильтр Блума содержит все известные процессу отозванные `jti`: если `jti`
+    в нём нет — токен точно не отозван. Положительные ответы (в т.ч. ложные)
+    подтверждаются запросом в БД; кэшируется только подтверждённый отзыв —
+    «не отозван» мог бы устареть, если токен отзовут позже. Отзывы из других
+    воркеров подтягиваются инкрементально раз в REVOCATION_SYNC_SECONDS.
+    """
+
+    def __init__(self, capacity: int, sync_seconds: float):
+        self.capacity = capacity
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self._filter = BloomFilter(self.capacity)
+        self._confirmed = TTLCache(maxsize=10_000, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+        self._synced_at = None       # time.monotonic() последней синхронизации
+        self._synced_until = None    # created_at самой свежей загруженной записи
+
+    def add(self, jti: str) -> None:
+        self._filter.add(jti)
+        self._confirmed.set(jti, True)
+
+    def sync(self, db: Session, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self._synced_at is not None and now - self._synced_at < self.sync_seconds:
+            return
+        with self._lock:
+            if not force and self._synced_at is not None and now - self._synced_at < self.sync_seconds:
+                return
+            if self._filter.count >= self.capacity:
+                # фильтр переполнен — пересобираем из актуальных (не истёкших) записей
+                self._filter = BloomFilter(self.capacity)
+                self._synced_until = None
+            # перекрытие окна, чтобы не пропустить записи, закоммиченные с опозданием
+            since = self._synced_until - timedelta(seconds=self.sync_seconds) if self._synced_until else None
+            for jti, created_at in token_repo.get_revoked_jtis(db, since=since):
+                self._filter.add(jti)
+                if self._synced_until is None or created_at > self._synced_until:
+                    self._synced_until = created_at
+            self._synced_at = now
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        self.sync(db)
+        if jti not in self._filter:
+            return False
+        if self._confirmed.get(jti):
+            return True
+        revoked = token_repo.is_access_token_revoked(db, jti)
+        if revoked:
+            self._confirmed.set(jti, True)
+        return revoked
+
+    def stats(self) -> dict:
+        return {"filter_entries": self._filter.count, "confirmed": self._confirmed.stats()}
+
+
+revocation_cache = RevocationCache(REVOCATION_FILTER_CAPACITY, REVOCATION_SYNC_SECONDS)
+
+
+def is_access_token_revoked(db: Session, jti: str) -> bool:
+    return revocation_cache.is_revoked(db, jti)
+
+
+def revoke_access_token(db: Session, access_token: str) -> None:
+    payload = decode_access_token(access_token)
+    token_repo.revoke_access_token(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+    revocation_cache.add(payload["jti"])
+
+
 def logout(db: Session, access_token: str, refresh_token: str) -> None:
-    token_repo.revoke_access_token(db, access_token)
+    revoke_access_token(db, access_token)
     token_repo.revoke_refresh_token(db, refresh_token)
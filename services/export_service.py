@@ -0,0 +1,149 @@
+"""Потоковый экспорт операций в CSV / JSONL / Parquet / Arrow.
+
+Строки приходят итератором из crud.operation.iter_operations_for_export и
+сериализуются порциями — в памяти держится одна порция, а не весь набор.
+Parquet и Arrow доступны, только если установлен pyarrow.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from typing import Iterable, Iterator, Mapping, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow — опциональная зависимость
+    pa = None
+    pq = None
+
+from crud.operation import EXPORT_COLUMNS
+
+EXPORT_BATCH_SIZE = 1000
+
+TEXT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+}
+ARROW_FORMATS = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+EXPORT_FORMATS = (*TEXT_FORMATS, *ARROW_FORMATS)
+
+
+def format_available(fmt: str) -> bool:
+    return fmt in TEXT_FORMATS or (fmt in ARROW_FORMATS and pa is not None)
+
+
+def media_type(fmt: str) -> str:
+    return TEXT_FORMATS.get(fmt) or ARROW_FORMATS[fmt]
+
+
+def _batches(rows: Iterable[Mapping], size: int) -> Iterator[list[Mapping]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _iter_csv(rows: Iterable[Mapping]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in _batches(rows, EXPORT_BATCH_SIZE):
+        writer.writerows([row[column] for column in EXPORT_COLUMNS] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _iter_jsonl(rows: Iterable[Mapping]) -> Iterator[bytes]:
+    for batch in _batches(rows, EXPORT_BATCH_SIZE):
+        yield "".join(
+            json.dumps(dict(row), ensure_ascii=False, default=_json_default) + "\n" for row in batch
+        ).encode()
+
+
+class _ChunkSink:
+    """Файлоподобный приёмник для pyarrow: копит записанные байты до выдачи в ответ."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("date", pa.date32()),
+        ("amount", pa.float64()),
+        ("comment", pa.string()),
+        ("category_id", pa.int64()),
+        ("category", pa.string()),
+    ])
+
+
+def _iter_arrow(rows: Iterable[Mapping], fmt: str) -> Iterator[bytes]:
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+    # каждая порция — отдельная row group (parquet) или record batch (arrow)
+    for batch in _batches(rows, EXPORT_BATCH_SIZE):
+        writer.write_batch(pa.RecordBatch.from_pylist([dict(row) for row in batch], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def serialize(rows: Iterable[Mapping], fmt: str) -> Iterator[bytes]:
+    if fmt == "csv":
+        return _iter_csv(rows)
+    if fmt == "jsonl":
+        return _iter_jsonl(rows)
+    return _iter_arrow(rows, fmt)
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip-обёртка
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() == "gzip":
+            return params.replace(" ", "") != "q=0"
+    return False
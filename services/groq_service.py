@@ -1,33 +1,190 @@
+import asyncio
+import hashlib
+import json
+import math
 import os
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Optional
 import httpx
 from dotenv import load_dotenv
+from utils.cache import TTLCache
+from utils.circuit_breaker import HALF_OPEN, CircuitBreaker
+
+try:
+    import h2  # noqa: F401 — HTTP/2 в httpx доступен только с пакетом h2 (httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
 TIMEOUT = 15.0
+CONNECT_TIMEOUT = 5.0
 MAX_RETRIES = 2
+MAX_TOKENS = 400
+TEMPERATURE = 0.7
 
+# Пул соединений общего клиента
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", "10"))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "30"))
 
-def _build_prompt(operations: list[dict]) -> str:
-    if not operations:
-        return "Операций нет."
-    lines = []
+# Ретраи: экспоненциальная задержка с full jitter; на 429 — сколько просит Retry-After,
+# но если дольше GROQ_RETRY_AFTER_MAX_SECONDS, запрос сразу завершается ошибкой
+GROQ_BACKOFF_BASE_SECONDS = float(os.getenv("GROQ_BACKOFF_BASE_SECONDS", "0.5"))
+GROQ_BACKOFF_MAX_SECONDS = float(os.getenv("GROQ_BACKOFF_MAX_SECONDS", "8"))
+GROQ_RETRY_AFTER_MAX_SECONDS = float(os.getenv("GROQ_RETRY_AFTER_MAX_SECONDS", "30"))
+
+# Circuit breaker: после стольких сбоев подряд (таймаут, обрыв, 5xx) запросы
+# к Groq отклоняются сразу на GROQ_BREAKER_RESET_SECONDS
+GROQ_BREAKER_FAILURES = int(os.getenv("GROQ_BREAKER_FAILURES", "5"))
+GROQ_BREAKER_RESET_SECONDS = float(os.getenv("GROQ_BREAKER_RESET_SECONDS", "30"))
+breaker = CircuitBreaker(GROQ_BREAKER_FAILURES, GROQ_BREAKER_RESET_SECONDS)
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Бюджет промпта с операциями: длинная история сжимается (см. _build_prompt).
+# Токены оцениваются по длине текста — точный токенизатор модели не нужен.
+GROQ_PROMPT_TOKEN_BUDGET = int(os.getenv("GROQ_PROMPT_TOKEN_BUDGET", "3000"))
+PROMPT_CHARS_PER_TOKEN = 3  # грубо для смеси кириллицы, цифр и дат
+PROMPT_TOP_CATEGORIES = 5
+PROMPT_LIST_LIMIT = 30  # повторяющихся / крупнейших операций в сжатом промпте
+
+# Кэш ответов по хэшу запроса (модель + параметры + промпт). Промпт строится из
+# самих операций, поэтому любое их изменение даёт новый ключ — отдельная
+# инвалидация не нужна, старая запись просто вытесняется по TTL/LRU.
+GROQ_CACHE_TTL_SECONDS = float(os.getenv("GROQ_CACHE_TTL_SECONDS", "3600"))
+GROQ_CACHE_SIZE = int(os.getenv("GROQ_CACHE_SIZE", "1024"))
+analysis_cache = TTLCache(maxsize=GROQ_CACHE_SIZE, ttl=GROQ_CACHE_TTL_SECONDS)
+
+# single-flight: одинаковые запросы, пришедшие одновременно, ждут один вызов Groq
+_inflight: dict[str, asyncio.Task] = {}
+_coalesced = 0
+
+
+def _category_name(op: dict) -> str:
+    cat = op.get("category", {})
+    return cat.get("name", "Без категории") if cat else "Без категории"
+
+
+def _operation_line(op: dict) -> str:
+    sign = "+" if op["amount"] >= 0 else ""
+    return f"- {op['date']}: {sign}{op['amount']} ₽, категория: {_category_name(op)}, комментарий: {op.get('comment') or '—'}"
+
+
+def _money(value: float) -> str:
+    return f"{value:+.2f}"
+
+
+def _estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / PROMPT_CHARS_PER_TOKEN)
+
+
+def _group_repeated(operations: list[dict]) -> list[list[dict]]:
+    """Группы одинаковых операций (сумма, категория, комментарий) в порядке первого появления."""
+    groups: dict[tuple, list[dict]] = {}
     for op in operations:
-        cat = op.get("category", {})
-        cat_name = cat.get("name", "Без категории") if cat else "Без категории"
-        sign = "+" if op["amount"] >= 0 else ""
-        lines.append(f"- {op['date']}: {sign}{op['amount']} ₽, категория: {cat_name}, комментарий: {op.get('comment') or '—'}")
+        groups.setdefault((op["amount"], _category_name(op), op.get("comment") or ""), []).append(op)
+    return list(groups.values())
+
+
+def _group_line(group: list[dict]) -> str:
+    if len(group) == 1:
+        return _operation_line(group[0])
+    op = group[0]
+    dates = sorted(str(o["date"]) for o in group)
+    sign = "+" if op["amount"] >= 0 else ""
+    return (f"- {sign}{op['amount']} ₽ ×{len(group)} ({dates[0]} … {dates[-1]}), "
+            f"категория: {_category_name(op)}, комментарий: {op.get('comment') or '—'}")
+
+
+def _month_lines(operations: list[dict]) -> list[str]:
+    months: dict[str, dict] = {}
+    for op in operations:
+        month = months.setdefault(str(op["date"])[:7], {"income": 0.0, "spend": 0.0, "categories": {}})
+        month["income" if op["amount"] > 0 else "spend"] += op["amount"]
+        if op["amount"] < 0:
+            total, count = month["categories"].get(_category_name(op), (0.0, 0))
+            month["categories"][_category_name(op)] = (total + op["amount"], count + 1)
+
+    lines = []
+    for name in sorted(months):
+        month = months[name]
+        top = sorted(month["categories"].items(), key=lambda item: item[1][0])[:PROMPT_TOP_CATEGORIES]
+        categories = ", ".join(f"{cat} {_money(total)} ({count})" for cat, (total, count) in top)
+        line = f"- {name}: доходы {_money(month['income'])}, расходы {_money(month['spend'])}"
+        lines.append(f"{line}; {categories}" if categories else line)
+    return lines
+
+
+def _aggregated_prompt(operations: list[dict], groups: list[list[dict]], budget: int) -> str:
+    dates = sorted(str(op["date"]) for op in operations)
+    income = sum(op["amount"] for op in operations if op["amount"] > 0)
+    spend = sum(op["amount"] for op in operations if op["amount"] < 0)
+    lines = [
+        f"Период: {dates[0]} — {dates[-1]}, операций: {len(operations)}, "
+        f"доходы: {_money(income)} ₽, расходы: {_money(spend)} ₽.",
+        "По месяцам (доходы, расходы; главные категории расходов — сумма и число операций):",
+    ]
+    months = _month_lines(operations)
+    max_chars = budget * PROMPT_CHARS_PER_TOKEN
+    chars = sum(len(line) + 1 for line in lines)
+    fitted = []
+    for line in reversed(months):  # если не влезают все месяцы — оставляем последние
+        if chars + len(line) + 1 > max_chars:
+            break
+        fitted.append(line)
+        chars += len(line) + 1
+    lines += reversed(fitted)
+
+    repeated = sorted((g for g in groups if len(g) > 1), key=len, reverse=True)
+    largest = sorted((g[0] for g in groups if len(g) == 1), key=lambda op: abs(op["amount"]), reverse=True)
+    sections = (
+        ("Повторяющиеся операции:", [_group_line(g) for g in repeated[:PROMPT_LIST_LIMIT]]),
+        ("Крупнейшие операции:", [_operation_line(op) for op in largest[:PROMPT_LIST_LIMIT]]),
+    )
+    for title, candidates in sections:
+        added = []
+        extra = len(title) + 1
+        for line in candidates:
+            if chars + extra + len(line) + 1 > max_chars:
+                break
+            added.append(line)
+            extra += len(line) + 1
+        if added:
+            lines += [title, *added]
+            chars += extra
     return "\n".join(lines)
 
 
-async def analyze_operations(operations: list[dict]) -> str:
-    """Отправляет операции в Groq и возвращает текстовый анализ."""
-    if not GROQ_API_KEY:
-        raise ValueError("GROQ_API_KEY не задан")
+def _build_prompt(operations: list[dict], budget: Optional[int] = None) -> str:
+    """Операции текстом, не длиннее `budget` токенов (по оценке _estimate_tokens).
+
+    Пока влезает — по строке на операцию. Иначе одинаковые операции (подписки,
+    регулярные платежи) схлопываются в строку «×N», а если и так не влезает —
+    агрегаты по месяцам и категориям плюс повторяющиеся и крупнейшие операции.
+    """
+    if not operations:
+        return "Операций нет."
+    budget = budget or GROQ_PROMPT_TOKEN_BUDGET
+    prompt = "\n".join(_operation_line(op) for op in operations)
+    if _estimate_tokens(prompt) <= budget:
+        return prompt
 
+    groups = _group_repeated(operations)
+    prompt = "\n".join(_group_line(g) for g in groups)
+    if _estimate_tokens(prompt) <= budget:
+        return prompt
+    return _aggregated_prompt(operations, groups, budget)
+
+
+def _build_payload(operations: list[dict]) -> dict:
     prompt = _build_prompt(operations)
     messages = [
         {
@@ -44,35 +201,247 @@ async def analyze_operations(operations: list[dict]) -> str:
             "content": f"Вот мои операции за последнее время:\n{prompt}\n\nПроанализируй.",
         },
     ]
+    return {
+        "model": GROQ_MODEL,
+        "messages": messages,
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+    }
+
+
+def _cache_key(payload: dict) -> str:
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
 
+def cache_stats() -> dict:
+    return {**analysis_cache.stats(), "inflight": len(_inflight), "coalesced": _coalesced}
+
+
+def reset_cache() -> None:
+    global _coalesced
+    analysis_cache.clear()
+    analysis_cache.hits = analysis_cache.misses = 0
+    _inflight.clear()
+    _coalesced = 0
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=GROQ_MAX_KEEPALIVE,
+            keepalive_expiry=GROQ_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """Общий клиент воркера: TCP/TLS-соединения переиспользуются между запросами.
+
+    Соединения привязаны к event loop, поэтому в другом loop (например, в тестах)
+    создаётся новый клиент.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client, _client_loop = _new_client(), loop
+    return _client
+
+
+async def close_client() -> None:
+    global _client, _client_loop
+    client, _client, _client_loop = _client, None, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Retry-After в секундах: число секунд или HTTP-дата."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def _backoff_delay(attempt: int) -> float:
+    # full jitter: случайная задержка в [0, base * 2^attempt], чтобы ретраи воркеров не совпадали
+    return random.uniform(0, min(GROQ_BACKOFF_MAX_SECONDS, GROQ_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _unavailable_error() -> RuntimeError:
+    return RuntimeError(f"Groq временно недоступен, повторите через {math.ceil(breaker.retry_in())} с")
+
+
+async def _request_analysis(payload: dict) -> str:
+    if not breaker.allow():
+        raise _unavailable_error()
+    trial = breaker.state == HALF_OPEN
+    try:
+        return await _post_with_retries(payload)
+    finally:
+        if trial:  # отмена пробного запроса не должна оставить цепь в half-open
+            breaker.release()
+
+
+async def _post_with_retries(payload: dict) -> str:
+    client = get_client()
     last_error = None
     for attempt in range(MAX_RETRIES + 1):
+        delay = None
         try:
-            async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-                response = await client.post(
-                    GROQ_API_URL,
-                    headers={
-                        "Authorization": f"Bearer {GROQ_API_KEY}",
-                        "Content-Type": "application/json",
-                    },
-                    json={
-                        "model": GROQ_MODEL,
-                        "messages": messages,
-                        "max_tokens": 400,
-                        "temperature": 0.7,
-                    },
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
-        except httpx.TimeoutException as e:
+            response = await client.post(
+                GROQ_API_URL,
+                headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
+                json=payload,
+            )
+        except httpx.TimeoutException:
+            breaker.record_failure()
             last_error = f"Таймаут запроса к Groq (попытка {attempt + 1})"
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:
-                last_error = "Превышен лимит запросов к Groq API"
-                break  # не ретраим при rate limit
-            last_error = f"Ошибка Groq API: {e.response.status_code}"
         except Exception as e:
+            breaker.record_failure()
             last_error = f"Ошибка при обращении к Groq: {str(e)}"
+        else:
+            if response.status_code >= 500:
+                breaker.record_failure()
+                last_error = f"Ошибка Groq API: {response.status_code}"
+            else:
+                breaker.record_success()  # Groq отвечает — даже 4xx не повод размыкать цепь
+                if response.status_code == 429:
+                    last_error = "Превышен лимит запросов к Groq API"
+                    delay = _retry_after_seconds(response)
+                    if delay is not None and delay > GROQ_RETRY_AFTER_MAX_SECONDS:
+                        break
+                elif response.is_error:
+                    raise RuntimeError(f"Ошибка Groq API: {response.status_code}")  # 4xx не ретраим
+                else:
+                    try:
+                        return response.json()["choices"][0]["message"]["content"]
+                    except (ValueError, LookupError, TypeError):
+                        raise RuntimeError("Некорректный ответ Groq API")
+
+        if attempt == MAX_RETRIES:
+            break
+        if not breaker.allow():
+            raise _unavailable_error()
+        await asyncio.sleep(_backoff_delay(attempt) if delay is None else delay)
 
     raise RuntimeError(last_error or "Неизвестная ошибка Groq")
+
+
+def _finish(key: str, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if task.cancelled():
+        return
+    if task.exception() is None:  # ошибки не кэшируем
+        analysis_cache.set(key, task.result())
+
+
+async def analyze_operations(operations: list[dict]) -> str:
+    """Отправляет операции в Groq и возвращает текстовый анализ.
+
+    Повторный запрос с теми же операциями отдаётся из кэша, а одновременные
+    одинаковые запросы ждут один общий вызов.
+    """
+    global _coalesced
+    if not GROQ_API_KEY:
+        raise ValueError("GROQ_API_KEY не задан")
+
+    payload = _build_payload(operations)
+    key = _cache_key(payload)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    task = _inflight.get(key)
+    if task is not None and task.get_loop() is loop:
+        _coalesced += 1
+    else:
+        task = loop.create_task(_request_analysis(payload))
+        task.add_done_callback(lambda t: _finish(key, t))
+        _inflight[key] = task
+    # shield: отмена одного из ожидающих (клиент ушёл) не отменяет общий вызов
+    return await asyncio.shield(task)
+
+
+async def _stream_request(payload: dict) -> AsyncIterator[str]:
+    """Запрос с `stream: true`: отдаёт кусочки текста из SSE-ответа Groq по мере генерации.
+
+    Без ретраев — часть ответа к этому моменту может быть уже отдана клиенту.
+    """
+    if not breaker.allow():
+        raise _unavailable_error()
+    trial = breaker.state == HALF_OPEN
+    try:
+        async with get_client().stream(
+            "POST",
+            GROQ_API_URL,
+            headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
+            json={**payload, "stream": True},
+        ) as response:
+            if response.status_code >= 500:
+                breaker.record_failure()
+                raise RuntimeError(f"Ошибка Groq API: {response.status_code}")
+            breaker.record_success()
+            if response.status_code == 429:
+                raise RuntimeError("Превышен лимит запросов к Groq API")
+            if response.is_error:
+                raise RuntimeError(f"Ошибка Groq API: {response.status_code}")
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    delta = json.loads(data)["choices"][0]["delta"].get("content")
+                except (ValueError, LookupError, TypeError, AttributeError):
+                    raise RuntimeError("Некорректный ответ Groq API")
+                if delta:
+                    yield delta
+    except httpx.TimeoutException:
+        breaker.record_failure()
+        raise RuntimeError("Таймаут запроса к Groq")
+    except httpx.TransportError as e:
+        breaker.record_failure()
+        raise RuntimeError(f"Ошибка при обращении к Groq: {str(e)}")
+    finally:
+        if trial:  # клиент ушёл или генератор закрыт до ответа Groq
+            breaker.release()
+
+
+async def stream_analysis(operations: list[dict]) -> AsyncIterator[str]:
+    """Как analyze_operations, но отдаёт анализ кусочками по мере генерации.
+
+    Ответ из кэша отдаётся одним куском; полный ответ после стрима кладётся в кэш.
+    """
+    if not GROQ_API_KEY:
+        raise ValueError("GROQ_API_KEY не задан")
+
+    payload = _build_payload(operations)
+    key = _cache_key(payload)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for delta in _stream_request(payload):
+        parts.append(delta)
+        yield delta
+    analysis_cache.set(key, "".join(parts))
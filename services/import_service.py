@@ -0,0 +1,125 @@
+"""Импорт операций из CSV / JSONL.
+
+Файл читается построчно, строки валидируются `OperationCreate` и вставляются
+пачками по IMPORT_CHUNK_SIZE: один INSERT (executemany) и один commit на пачку.
+Ошибочные строки не прерывают импорт — они попадают в отчёт.
+
+Колонки: date, amount, comment (опц.), category_id или category (имя категории).
+"""
+import csv
+import io
+import json
+import os
+from typing import BinaryIO, Iterator, Optional
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from models import models
+from schemas.operation import OperationCreate
+import crud.category
+import crud.operation
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_ERRORS = 100  # в ответе — не больше стольких ошибок, остальные только считаются
+
+
+def detect_format(filename: Optional[str]) -> str:
+    name = (filename or "").lower()
+    return "jsonl" if name.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def _iter_csv(text: io.TextIOBase) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    reader = csv.DictReader(text)
+    for record in reader:
+        yield reader.line_num, record, None
+
+
+def _iter_jsonl(text: io.TextIOBase) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, None, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "Expected a JSON object"
+            continue
+        yield line_no, record, None
+
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+    )
+
+
+def _to_row(record: dict, categories: dict[str, int], category_ids: set[int], current_user: models.User) -> dict:
+    """Приводит запись файла к dict для INSERT. Бросает ValueError с текстом ошибки."""
+    # в CSV пустая ячейка — пустая строка
+    data = {key: (None if value == "" else value) for key, value in record.items() if key}
+
+    category_name = data.pop("category", None)
+    if data.get("category_id") is None and category_name is not None:
+        if category_name not in categories:
+            raise ValueError(f"Unknown category: {category_name}")
+        data["category_id"] = categories[category_name]
+
+    try:
+        op = OperationCreate.model_validate(data)
+    except ValidationError as e:
+        raise ValueError(_format_validation_error(e))
+
+    if op.category_id is not None and op.category_id not in category_ids:
+        raise ValueError("category_id: Category not found")
+    return {**op.model_dump(), "user_id": current_user.id}
+
+
+def import_operations(
+        db: Session,
+        current_user: models.User,
+        fileobj: BinaryIO,
+        fmt: str,
+        chunk_size: Optional[int] = None,
+) -> dict:
+    """Импортирует операции из бинарного файла; возвращает отчёт imported/failed/errors.
+
+    Пачки, вставленные до ошибки чтения файла (например, не UTF-8), остаются
+    в БД — в этом случае бросается ValueError.
+    """
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    categories = crud.category.get_category_ids_by_name(db, current_user)
+    category_ids = set(categories.values())
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    records = _iter_jsonl(text) if fmt == "jsonl" else _iter_csv(text)
+
+    imported, failed, errors = 0, 0, []
+    chunk: list[dict] = []
+
+    def fail(line_no: int, message: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"line": line_no, "error": message})
+
+    try:
+        for line_no, record, error in records:
+            if error is None:
+                try:
+                    chunk.append(_to_row(record, categories, category_ids, current_user))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                fail(line_no, error)
+            if len(chunk) >= chunk_size:
+                imported += crud.operation.bulk_create_operations(db, chunk)
+                chunk = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ValueError(f"Cannot read file: {e}")
+    finally:
+        text.detach()  # файл закрывает владелец (UploadFile)
+
+    if chunk:
+        imported += crud.operation.bulk_create_operations(db, chunk)
+    return {"imported": imported, "failed": failed, "errors": errors}
@@ -0,0 +1,306 @@
+"""Фоновые задачи AI-анализа: запрос к Groq не держит веб-воркер.
+
+`POST /analysis/jobs` сохраняет задачу в статусе queued и сразу возвращает id;
+пул воркеров (в каждом процессе uvicorn) забирает задачи из хранилища по
+статусу и выполняет analyze_operations, результат читается через
+`GET /analysis/jobs/{id}` — любым процессом.
+
+По умолчанию задачи лежат в таблице analysis_jobs (DbJobStore): опрос попадает
+в любой воркер uvicorn, лимиты считаются по всем процессам, задачи переживают
+рестарт. Задача, зависшая в running дольше ANALYSIS_JOB_STALE_SECONDS (процесс
+упал посреди выполнения), забирается заново. JobStore — то же в памяти одного
+процесса.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from db.database import SessionLocal
+from models import models
+from repositories import job_repo
+from services import groq_service
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "4"))
+ANALYSIS_JOB_QUEUE_SIZE = int(os.getenv("ANALYSIS_JOB_QUEUE_SIZE", "100"))
+ANALYSIS_JOBS_PER_USER = int(os.getenv("ANALYSIS_JOBS_PER_USER", "2"))  # queued + running
+ANALYSIS_JOB_RESULT_TTL_SECONDS = float(os.getenv("ANALYSIS_JOB_RESULT_TTL_SECONDS", "3600"))
+# как часто свободный воркер проверяет задачи, поставленные другими процессами
+ANALYSIS_JOB_POLL_SECONDS = float(os.getenv("ANALYSIS_JOB_POLL_SECONDS", "1"))
+ANALYSIS_JOB_STALE_SECONDS = float(os.getenv("ANALYSIS_JOB_STALE_SECONDS", "600"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class UserLimitError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, user_id: int, operations: list[dict]):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.operations = operations
+        self.operations_count = len(operations)
+        self.status = QUEUED
+        self.analysis: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    @classmethod
+    def from_record(cls, record: models.AnalysisJob) -> "Job":
+        job = cls.__new__(cls)
+        for name in ("id", "user_id", "operations_count", "status", "analysis", "error",
+                     "created_at", "started_at", "finished_at"):
+            setattr(job, name, getattr(record, name))
+        job.operations = json.loads(record.operations)
+        return job
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def claimable(self, stale_before: datetime) -> bool:
+        return self.status == QUEUED or (self.status == RUNNING and self.started_at < stale_before)
+
+
+class JobStore:
+    """Задачи в памяти одного процесса (тесты, запуск с одним воркером uvicorn)."""
+
+    def __init__(self, result_ttl: float = ANALYSIS_JOB_RESULT_TTL_SECONDS):
+        self.result_ttl = result_ttl
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def add(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def claim(self, stale_before: datetime) -> Optional[Job]:
+        with self._lock:
+            candidates = [job for job in self._jobs.values() if job.claimable(stale_before)]
+            if not candidates:
+                return None
+            job = min(candidates, key=lambda job: job.created_at)
+            job.status = RUNNING
+            job.started_at = datetime.utcnow()
+            return job
+
+    def save(self, job: Job) -> None:
+        """Вызывается после каждой смены статуса (in-memory — объект уже в словаре)."""
+
+    def count_active(self, user_id: int) -> int:
+        return sum(1 for job in list(self._jobs.values()) if job.user_id == user_id and job.active)
+
+    def count_queued(self) -> int:
+        return sum(1 for job in list(self._jobs.values()) if job.status == QUEUED)
+
+    def prune(self) -> int:
+        """Удаляет завершённые задачи старше result_ttl; возвращает их число."""
+        deadline = datetime.utcnow() - timedelta(seconds=self.result_ttl)
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at <= deadline]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class DbJobStore:
+    """Задачи в таблице analysis_jobs — общие для всех процессов. Методы блокирующие (вызываются в threadpool)."""
+
+    def __init__(self, session_factory=SessionLocal, result_ttl: float = ANALYSIS_JOB_RESULT_TTL_SECONDS):
+        self.session_factory = session_factory
+        self.result_ttl = result_ttl
+
+    def _call(self, fn, *args, **kwargs):
+        db = self.session_factory()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    def add(self, job: Job) -> None:
+        record = models.AnalysisJob(
+            id=job.id, user_id=job.user_id, status=job.status,
+            operations=json.dumps(job.operations, ensure_ascii=False),
+            operations_count=job.operations_count, created_at=job.created_at,
+        )
+        self._call(job_repo.add_job, record)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        def _get(db):
+            record = job_repo.get_job(db, job_id)
+            return Job.from_record(record) if record else None
+        return self._call(_get)
+
+    def claim(self, stale_before: datetime) -> Optional[Job]:
+        def _claim(db):
+            record = job_repo.claim_job(db, stale_before)
+            return Job.from_record(record) if record else None
+        return self._call(_claim)
+
+    def save(self, job: Job) -> None:
+        self._call(
+            job_repo.update_job, job.id,
+            status=job.status, analysis=job.analysis, error=job.error,
+            started_at=job.started_at, finished_at=job.finished_at,
+            operations=json.dumps(job.operations, ensure_ascii=False),
+        )
+
+    def count_active(self, user_id: int) -> int:
+        return self._call(job_repo.count_active, user_id)
+
+    def count_queued(self) -> int:
+        return self._call(job_repo.count_queued)
+
+    def prune(self) -> int:
+        return self._call(job_repo.delete_finished_before, datetime.utcnow() - timedelta(seconds=self.result_ttl))
+
+
+class JobQueue:
+    """Пул воркеров в event loop процесса; задачи берутся из общего хранилища по статусу.
+
+    Своя задача будит воркер сразу, задачи других процессов подхватываются
+    опросом раз в `poll_interval` секунд. Лимиты очереди и пользователя
+    считаются по хранилищу, то есть по всем процессам.
+    """
+
+    def __init__(
+            self,
+            run: Callable[[list[dict]], Awaitable[str]],
+            store=None,
+            workers: int = ANALYSIS_JOB_WORKERS,
+            maxsize: int = ANALYSIS_JOB_QUEUE_SIZE,
+            per_user: int = ANALYSIS_JOBS_PER_USER,
+            poll_interval: float = ANALYSIS_JOB_POLL_SECONDS,
+            stale_after: float = ANALYSIS_JOB_STALE_SECONDS,
+    ):
+        self.run = run
+        self.store = store if store is not None else JobStore()
+        self.workers = workers
+        self.maxsize = maxsize
+        self.per_user = per_user
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.running = 0
+        self.counters = {"submitted": 0, "done": 0, "failed": 0, "rejected_queue_full": 0, "rejected_user_limit": 0}
+
+    async def start(self) -> None:
+        """Поднимает воркеры в текущем event loop (повторный вызов в том же loop ничего не делает)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self.running = 0
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+        self._loop = None
+
+    async def submit(self, user_id: int, operations: list[dict]) -> Job:
+        await self.start()
+        await run_in_threadpool(self.store.prune)
+        if await run_in_threadpool(self.store.count_active, user_id) >= self.per_user:
+            self.counters["rejected_user_limit"] += 1
+            raise UserLimitError(f"Не больше {self.per_user} задач анализа одновременно")
+        if await run_in_threadpool(self.store.count_queued) >= self.maxsize:
+            self.counters["rejected_queue_full"] += 1
+            raise QueueFullError("Очередь анализа переполнена, попробуйте позже")
+
+        job = Job(user_id, operations)
+        await run_in_threadpool(self.store.add, job)
+        self._wakeup.set()
+        self.counters["submitted"] += 1
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await run_in_threadpool(self.store.get, job_id)
+
+    async def _claim(self) -> Optional[Job]:
+        stale_before = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        try:
+            return await run_in_threadpool(self.store.claim, stale_before)
+        except Exception:
+            logger.exception("Failed to claim analysis job")
+            return None
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._claim()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Job) -> None:
+        self.running += 1
+        try:
+            job.analysis = await self.run(job.operations)
+            job.status = DONE
+        except asyncio.CancelledError:
+            # остановка пула: задача вернётся в очередь (синхронно — loop уже останавливается)
+            job.status = QUEUED
+            job.started_at = None
+            self.store.save(job)
+            raise
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            if not isinstance(e, (ValueError, RuntimeError)):
+                logger.exception("Analysis job %s failed", job.id)
+        finally:
+            self.running -= 1
+        job.operations = []
+        job.finished_at = datetime.utcnow()
+        self.counters["done" if job.status == DONE else "failed"] += 1
+        try:
+            await run_in_threadpool(self.store.save, job)
+        except Exception:
+            logger.exception("Failed to save analysis job %s", job.id)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "queue_depth": self.store.count_queued(),
+            "queue_size": self.maxsize,
+            "running": self.running,
+            **self.counters,
+        }
+
+    def reset(self) -> None:
+        for key in self.counters:
+            self.counters[key] = 0
+
+
+analysis_jobs = JobQueue(lambda operations: groq_service.analyze_operations(operations), store=DbJobStore())
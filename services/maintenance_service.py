@@ -0,0 +1,128 @@
+"""Фоновые задачи обслуживания БД.
+
+Запускаются периодически внутри приложения (см. main.py) или вручную:
+
+    python -m services.maintenance_service purge-tokens
+    python -m services.maintenance_service reconcile-balances [--dry-run]
+    python -m services.maintenance_service rebuild-stats
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from db.database import SessionLocal
+from repositories import token_repo
+import crud.operation
+
+logger = logging.getLogger(__name__)
+
+# 0 — не запускать очистку внутри приложения (например, если она идёт по cron)
+TOKEN_PURGE_INTERVAL_SECONDS = int(os.getenv("TOKEN_PURGE_INTERVAL_SECONDS", "3600"))
+TOKEN_PURGE_BATCH_SIZE = int(os.getenv("TOKEN_PURGE_BATCH_SIZE", "1000"))
+
+purge_stats = {
+    "runs": 0,
+    "refresh_tokens_deleted": 0,
+    "revoked_tokens_deleted": 0,
+    "last_run_at": None,
+    "last_duration_seconds": None,
+    "last_error": None,
+}
+
+
+def purge_expired_tokens(db: Session, batch_size: int = TOKEN_PURGE_BATCH_SIZE) -> dict:
+    """Удаляет истёкшие refresh-токены и записи об отозванных access-токенах."""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    refresh_deleted = token_repo.delete_expired_refresh_tokens(db, now, batch_size)
+    revoked_deleted = token_repo.delete_expired_revoked_tokens(db, now, batch_size)
+    duration = time.perf_counter() - started
+
+    purge_stats["runs"] += 1
+    purge_stats["refresh_tokens_deleted"] += refresh_deleted
+    purge_stats["revoked_tokens_deleted"] += revoked_deleted
+    purge_stats["last_run_at"] = now.isoformat()
+    purge_stats["last_duration_seconds"] = round(duration, 4)
+    purge_stats["last_error"] = None
+    logger.info(
+        "Token purge: %d refresh, %d revoked deleted in %.3fs",
+        refresh_deleted, revoked_deleted, duration,
+    )
+    return {
+        "refresh_tokens_deleted": refresh_deleted,
+        "revoked_tokens_deleted": revoked_deleted,
+        "duration_seconds": duration,
+    }
+
+
+def _with_new_session(fn, *args, **kwargs):
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+def _purge_with_new_session() -> dict:
+    return _with_new_session(purge_expired_tokens)
+
+
+async def run_token_purge_loop(interval: float = TOKEN_PURGE_INTERVAL_SECONDS) -> None:
+    while True:
+        try:
+            await run_in_threadpool(_purge_with_new_session)
+        except Exception as e:
+            purge_stats["last_error"] = str(e)
+            logger.exception("Token purge failed")
+        await asyncio.sleep(interval)
+
+
+def reconcile_balances(db: Session, fix: bool = True) -> dict:
+    """Сверяет user_balances с SUM(operations.amount); при fix=True исправляет расхождения.
+
+    Запись в user_balances идёт в тех же транзакциях, что и запись операций, так что
+    расхождение означает запись в operations в обход crud.operation (или отсутствие
+    строки для пользователей, у которых не было изменений после появления таблицы).
+    """
+    drift = crud.operation.get_balance_drift(db)
+    if fix and drift:
+        crud.operation.set_balances(db, {row["user_id"]: row["actual"] for row in drift})
+    for row in drift:
+        logger.warning("Balance drift for user %s: stored=%s actual=%s", row["user_id"], row["stored"], row["actual"])
+    return {"drifted": len(drift), "fixed": len(drift) if fix else 0, "users": drift}
+
+
+def rebuild_stats(db: Session) -> dict:
+    """Пересобирает дневной rollup operation_daily_stats целиком."""
+    started = time.perf_counter()
+    rows = crud.operation.rebuild_daily_stats(db)
+    duration = time.perf_counter() - started
+    logger.info("Daily stats rebuilt: %d rows in %.3fs", rows, duration)
+    return {"rows": rows, "duration_seconds": duration}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m services.maintenance_service")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("purge-tokens", help="удалить истёкшие refresh/revoked токены")
+    reconcile = commands.add_parser("reconcile-balances", help="пересчитать user_balances и показать расхождения")
+    reconcile.add_argument("--dry-run", action="store_true", help="только показать расхождения")
+    commands.add_parser("rebuild-stats", help="пересобрать дневную статистику операций")
+    args = parser.parse_args(argv)
+
+    if args.command == "purge-tokens":
+        print(json.dumps(_purge_with_new_session()))
+    elif args.command == "reconcile-balances":
+        print(json.dumps(_with_new_session(reconcile_balances, fix=not args.dry_run)))
+    elif args.command == "rebuild-stats":
+        print(json.dumps(_with_new_session(rebuild_stats)))
+
+
+if __name__ == "__main__":
+    main()
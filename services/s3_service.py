@@ -2,8 +2,12 @@ import boto3
 from botocore.exceptions import ClientError
 from botocore.config import Config
 import os
+import threading
+import time
 import uuid
+from typing import BinaryIO
 from dotenv import load_dotenv
+from utils.cache import TTLCache
 
 load_dotenv()
 
@@ -13,6 +17,9 @@ S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "minioadmin")
 S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "minioadmin")
 S3_BUCKET = os.getenv("S3_BUCKET", "finance-files")
 PRESIGNED_URL_EXPIRES = 3600  # 1 час
+# URL из кэша отдаётся, пока до его истечения больше стольких секунд
+PRESIGNED_URL_REFRESH_MARGIN = int(os.getenv("PRESIGNED_URL_REFRESH_MARGIN", "300"))
+presigned_url_cache = TTLCache(maxsize=10_000, ttl=PRESIGNED_URL_EXPIRES - PRESIGNED_URL_REFRESH_MARGIN)
 
 ALLOWED_CONTENT_TYPES = {
     "image/jpeg", "image/png", "image/webp",
@@ -21,27 +28,60 @@ ALLOWED_CONTENT_TYPES = {
 }
 MAX_FILE_SIZE_MB = 10
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+S3_UPLOAD_PART_SIZE = int(os.getenv("S3_UPLOAD_PART_SIZE", str(5 * 1024 * 1024)))  # минимум S3 для multipart — 5 МБ
 
 
-def _get_client():
-    return boto3.client(
+# Пул соединений и ретраи boto3. max_pool_connections — не меньше числа потоков,
+# одновременно работающих с S3 (threadpool Starlette — 40 потоков).
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "40"))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "3"))  # всего попыток, включая первую
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", "5"))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", "30"))
+
+_clients: dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+
+def _new_client(endpoint_url: str):
+    return boto3.session.Session().client(
         "s3",
-        endpoint_url=S3_ENDPOINT,
+        endpoint_url=endpoint_url,
         aws_access_key_id=S3_ACCESS_KEY,
         aws_secret_access_key=S3_SECRET_KEY,
-        config=Config(signature_version="s3v4"),
+        config=Config(
+            signature_version="s3v4",
+            max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+            retries={"total_max_attempts": S3_MAX_ATTEMPTS, "mode": "standard"},
+            connect_timeout=S3_CONNECT_TIMEOUT,
+            read_timeout=S3_READ_TIMEOUT,
+        ),
     )
 
 
+def _cached_client(endpoint_url: str):
+    """Один клиент на endpoint на процесс: клиенты boto3 потокобезопасны, а создание стоит десятки мс."""
+    client = _clients.get(endpoint_url)
+    if client is None:
+        with _clients_lock:  # создание клиента (сессия, резолв endpoint) не потокобезопасно
+            client = _clients.get(endpoint_url)
+            if client is None:
+                client = _clients[endpoint_url] = _new_client(endpoint_url)
+    return client
+
+
+def _get_client():
+    return _cached_client(S3_ENDPOINT)
+
+
 def _get_public_client():
     """Клиент с публичным endpoint — для генерации presigned URL."""
-    return boto3.client(
-        "s3",
-        endpoint_url=S3_PUBLIC_ENDPOINT,
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY,
-        config=Config(signature_version="s3v4"),
-    )
+    return _cached_client(S3_PUBLIC_ENDPOINT)
+
+
+def init_clients() -> None:
+    """Создаёт клиенты заранее (на старте приложения), чтобы первый запрос не платил за это."""
+    _get_client()
+    _get_public_client()
 
 
 def ensure_bucket():
@@ -52,17 +92,52 @@ def ensure_bucket():
         client.create_bucket(Bucket=S3_BUCKET)
 
 
-def upload_file(file_bytes: bytes, original_filename: str, content_type: str) -> str:
+class FileTooLargeError(ValueError):
+    pass
+
+
+def _new_key(original_filename: str) -> str:
     ext = original_filename.rsplit(".", 1)[-1] if "." in original_filename else ""
-    s3_key = f"{uuid.uuid4()}.{ext}" if ext else str(uuid.uuid4())
+    return f"{uuid.uuid4()}.{ext}" if ext else str(uuid.uuid4())
+
+
+def upload_file(fileobj: BinaryIO, original_filename: str, content_type: str,
+                max_size: int = MAX_FILE_SIZE_BYTES) -> str:
+    """Загружает файл в S3 кусками по S3_UPLOAD_PART_SIZE: в памяти — не больше одного куска.
 
+    Файл меньше куска уходит одним PutObject, иначе — multipart upload.
+    Если размер превысил max_size, загрузка прерывается (multipart отменяется)
+    и бросается FileTooLargeError. Блокирующая функция — из async-кода звать через threadpool.
+    """
+    s3_key = _new_key(original_filename)
     client = _get_client()
-    client.put_object(
-        Bucket=S3_BUCKET,
-        Key=s3_key,
-        Body=file_bytes,
-        ContentType=content_type,
-    )
+
+    chunk = fileobj.read(S3_UPLOAD_PART_SIZE)
+    if len(chunk) > max_size:
+        raise FileTooLargeError(f"File too large. Max size: {max_size} bytes")
+    if len(chunk) < S3_UPLOAD_PART_SIZE:  # весь файл уместился в один кусок
+        client.put_object(Bucket=S3_BUCKET, Key=s3_key, Body=chunk, ContentType=content_type)
+        return s3_key
+
+    upload_id = client.create_multipart_upload(Bucket=S3_BUCKET, Key=s3_key, ContentType=content_type)["UploadId"]
+    try:
+        parts, total = [], 0
+        while chunk:
+            total += len(chunk)
+            if total > max_size:
+                raise FileTooLargeError(f"File too large. Max size: {max_size} bytes")
+            part_number = len(parts) + 1
+            response = client.upload_part(
+                Bucket=S3_BUCKET, Key=s3_key, UploadId=upload_id, PartNumber=part_number, Body=chunk,
+            )
+            parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+            chunk = fileobj.read(S3_UPLOAD_PART_SIZE)
+        client.complete_multipart_upload(
+            Bucket=S3_BUCKET, Key=s3_key, UploadId=upload_id, MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        client.abort_multipart_upload(Bucket=S3_BUCKET, Key=s3_key, UploadId=upload_id)
+        raise
     return s3_key
 
 
@@ -75,6 +150,39 @@ def get_presigned_url(s3_key: str) -> str:
     )
 
 
+def get_cached_presigned_url(s3_key: str) -> tuple[str, int]:
+    """(url, сколько секунд он ещё действителен). Подписанный URL переиспользуется,
+    пока до его истечения остаётся больше PRESIGNED_URL_REFRESH_MARGIN."""
+    cached = presigned_url_cache.get(s3_key)
+    now = time.time()
+    if cached is not None:
+        url, expires_at = cached
+        return url, int(expires_at - now)
+    url = get_presigned_url(s3_key)
+    presigned_url_cache.set(s3_key, (url, now + PRESIGNED_URL_EXPIRES))
+    return url, PRESIGNED_URL_EXPIRES
+
+
 def delete_file(s3_key: str) -> None:
     client = _get_client()
     client.delete_object(Bucket=S3_BUCKET, Key=s3_key)
+    presigned_url_cache.pop(s3_key)
+
+
+S3_DELETE_BATCH = 1000  # лимит ключей в одном DeleteObjects
+
+
+def delete_files(s3_keys: list[str]) -> list[str]:
+    """Удаляет объекты пачками через DeleteObjects. Возвращает ключи, которые удалить не удалось."""
+    client = _get_client()
+    failed = []
+    for i in range(0, len(s3_keys), S3_DELETE_BATCH):
+        batch = s3_keys[i:i + S3_DELETE_BATCH]
+        response = client.delete_objects(
+            Bucket=S3_BUCKET,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+        )
+        failed.extend(error["Key"] for error in response.get("Errors", []))
+    for key in s3_keys:
+        presigned_url_cache.pop(key)
+    return failed
@@ -1,16 +1,29 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from db.database import Base, get_db
+from sqlalchemy.pool import NullPool
+from db.database import Base, SerializedWriteSession, get_db, get_async_db, to_async_url
 from main import app
+from utils.auth import user_cache
+from services.auth_service import revocation_cache
+import services.groq_service as groq_service
+from services.job_service import DbJobStore, analysis_jobs
+from services.s3_service import presigned_url_cache
+from tests.groq_stub import GroqStub, StubServer
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test_shared.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=SerializedWriteSession)
+
+# NullPool: TestClient поднимает свой event loop на каждый запрос,
+# поэтому async-соединения нельзя переиспользовать между запросами
+async_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 
 def override_get_db():
@@ -21,7 +34,43 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
+analysis_jobs.store = DbJobStore(TestingSessionLocal)
+
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """БД пересоздаётся в каждом тесте, поэтому in-process кэши тоже сбрасываем."""
+    user_cache.clear()
+    revocation_cache.reset()
+    groq_service.reset_cache()
+    groq_service.breaker.reset()
+    analysis_jobs.reset()
+    presigned_url_cache.clear()
+    yield
+
+
+@pytest.fixture(scope="session")
+def groq_stub_server():
+    server = StubServer(GroqStub()).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def groq_stub(groq_stub_server, monkeypatch):
+    """Groq-сервис смотрит на локальную заглушку; ретраи без задержек."""
+    groq_stub_server.stub.reset()
+    monkeypatch.setattr(groq_service, "GROQ_API_URL", groq_stub_server.url)
+    monkeypatch.setattr(groq_service, "GROQ_API_KEY", "fake-key")
+    monkeypatch.setattr(groq_service, "GROQ_BACKOFF_BASE_SECONDS", 0)
+    return groq_stub_server.stub
 
 
 @pytest.fixture
@@ -0,0 +1,103 @@
+"""
+Локальная заглушка Groq chat/completions для тестов groq_service.
+
+Каждый запрос берёт следующий шаг сценария (статус, заголовки, задержка);
+когда сценарий пуст — 200 с текстом `reply` через `latency` секунд.
+Запрос с `stream: true` получает `reply` SSE-чанками по словам, с паузой
+`chunk_delay` между ними, и `data: [DONE]` в конце.
+В тестах сервер поднимается фикстурой `groq_stub` (conftest.py) на случайном порту,
+вручную: uvicorn tests.groq_stub:app --port 8001
+и GROQ_API_URL=http://127.0.0.1:8001/openai/v1/chat/completions
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import uvicorn
+
+
+class GroqStub:
+    def __init__(self, reply: str = "Анализ готов", latency: float = 0.0, chunk_delay: float = 0.0):
+        self.reply = reply
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.steps: list[dict] = []
+        self.requests: list[dict] = []
+        self.connections: set[tuple] = set()  # адреса клиентов — по ним видно переиспользование соединений
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def then(self, status: int = 200, headers: dict | None = None, delay: float | None = None,
+             reply: str | None = None) -> "GroqStub":
+        self.steps.append({"status": status, "headers": headers or {}, "delay": delay, "reply": reply})
+        return self
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        self.requests.append({
+            "headers": {key.decode(): value.decode() for key, value in scope["headers"]},
+            "json": json.loads(body or b"null"),
+        })
+        self.connections.add(tuple(scope["client"]))
+
+        step = self.steps.pop(0) if self.steps else {"status": 200, "headers": {}, "delay": None, "reply": None}
+        await asyncio.sleep(self.latency if step["delay"] is None else step["delay"])
+        if (self.requests[-1]["json"] or {}).get("stream") and step["status"] < 400:
+            await self._send_stream(send, step["reply"] or self.reply)
+            return
+        if step["status"] < 400:
+            payload = {"choices": [{"message": {"role": "assistant", "content": step["reply"] or self.reply}}]}
+        else:
+            payload = {"error": {"message": f"stub error {step['status']}"}}
+        headers = [(b"content-type", b"application/json")]
+        headers += [(key.encode(), str(value).encode()) for key, value in step["headers"].items()]
+        await send({"type": "http.response.start", "status": step["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": json.dumps(payload, ensure_ascii=False).encode()})
+
+    async def _send_stream(self, send, text: str):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            chunk = {"choices": [{"delta": {"content": word if i == 0 else " " + word}}]}
+            event = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+            await send({"type": "http.response.body", "body": event, "more_body": True})
+            await asyncio.sleep(self.chunk_delay)
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+
+
+app = GroqStub()
+
+
+class StubServer:
+    """uvicorn с заглушкой в фоновом потоке на свободном порту 127.0.0.1."""
+
+    def __init__(self, stub: GroqStub):
+        self.stub = stub
+        self._socket = socket.socket()
+        self._socket.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self._socket.getsockname()[1]}/openai/v1/chat/completions"
+        self._server = uvicorn.Server(uvicorn.Config(stub, lifespan="off", log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+
+    def start(self) -> "StubServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Groq stub did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
@@ -64,3 +64,41 @@ def test_regular_user_cannot_change_role(client):
     user_tokens = register_and_login(client, "regularuser")
     response = client.put("/admin/users/1/role", json={"role": "admin"}, headers={"Authorization": f"Bearer {user_tokens['access_token']}"})
     assert response.status_code == 403
+
+
+def test_role_change_takes_effect_immediately(client):
+    admin_tokens = register_and_login(client, "adminuser", role="admin")
+    user_tokens = register_and_login(client, "promoteduser")
+    me = client.get("/auth/me", headers={"Authorization": f"Bearer {user_tokens['access_token']}"}).json()
+    assert client.get("/admin/users", headers={"Authorization": f"Bearer {user_tokens['access_token']}"}).status_code == 403
+
+    client.put(f"/admin/users/{me['id']}/role", json={"role": "admin"}, headers={"Authorization": f"Bearer {admin_tokens['access_token']}"})
+
+    response = client.get("/admin/users", headers={"Authorization": f"Bearer {user_tokens['access_token']}"})
+    assert response.status_code == 200
+
+
+def test_metrics_expose_user_cache_counters(client):
+    admin_tokens = register_and_login(client, "adminuser", role="admin")
+    headers = {"Authorization": f"Bearer {admin_tokens['access_token']}"}
+    client.get("/auth/me", headers=headers)
+    client.get("/auth/me", headers=headers)
+
+    response = client.get("/admin/metrics", headers=headers)
+    assert response.status_code == 200
+    stats = response.json()["user_cache"]
+    assert stats["hits"] >= 2
+    assert stats["misses"] >= 1
+
+
+def test_regular_user_cannot_read_metrics(client):
+    user_tokens = register_and_login(client, "regularuser")
+    response = client.get("/admin/metrics", headers={"Authorization": f"Bearer {user_tokens['access_token']}"})
+    assert response.status_code == 403
+
+
+def test_metrics_expose_groq_cache(client):
+    admin_tokens = register_and_login(client, "adminuser", role="admin")
+    response = client.get("/admin/metrics", headers={"Authorization": f"Bearer {admin_tokens['access_token']}"})
+    stats = response.json()["groq_cache"]
+    assert {"size", "maxsize", "hits", "misses", "inflight", "coalesced"} <= stats.keys()
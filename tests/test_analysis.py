@@ -1,12 +1,17 @@
 """
-Интеграционные тесты эндпоинта /analysis/ai.
-analyze_operations мокируется целиком — реальных вызовов Groq нет.
+Интеграционные тесты эндпоинтов /analysis/ai, /analysis/ai/stream, /analysis/jobs и /analysis/summary.
+Вместо Groq — мок analyze_operations или локальная заглушка (фикстура groq_stub).
 Юнит-тесты самого сервиса — в test_services.py.
 """
+import asyncio
+import json
+import time
 import pytest
+from fastapi.testclient import TestClient
 from unittest.mock import patch
-from datetime import date
+from datetime import date, timedelta
 import services.groq_service as gs
+from services.job_service import QueueFullError
 from tests.conftest import register_and_login
 
 ANALYZE_PATH = "routers.analysis.analyze_operations"
@@ -83,6 +88,23 @@ class TestAnalysisEndpoint:
         )
         assert response.status_code == 422
 
+    def test_days_sends_whole_period(self, client):
+        tokens = register_and_login(client, "analysis_days_user")
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        today = date.today()
+        for offset in (0, 10, 100, 400):
+            client.post("/operations/", json={"date": str(today - timedelta(days=offset)), "amount": -5.0}, headers=headers)
+        with _ok() as mock:
+            response = client.get("/analysis/ai?days=365&limit=1", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["operations_count"] == 3
+        assert len(mock.call_args.args[0]) == 3
+
+    def test_days_above_max_returns_422(self, client):
+        tokens = register_and_login(client, "analysis_days_user2")
+        response = client.get("/analysis/ai?days=367", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        assert response.status_code == 422
+
     def test_limit_above_max_returns_422(self, client):
         tokens = register_and_login(client, "analysis_user6")
         response = client.get(
@@ -116,3 +138,205 @@ class TestAnalysisEndpoint:
                 headers={"Authorization": f"Bearer {tokens['access_token']}"},
             )
         assert response.status_code == 503
+
+
+class TestSummaryEndpoint:
+    def test_requires_auth(self, client):
+        assert client.get("/analysis/summary").status_code == 401
+
+    def test_summary_for_own_operations(self, client):
+        tokens = register_and_login(client, "summary_user1")
+        other = register_and_login(client, "summary_user2")
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        cat = client.post("/categories/", json={"name": "Подписки"}, headers=headers).json()
+        for month in range(1, 5):
+            client.post(
+                "/operations/",
+                json={"date": f"2024-0{month}-10", "amount": -9.99, "category_id": cat["id"]},
+                headers=headers,
+            )
+        client.post(
+            "/operations/", json={"date": "2024-04-01", "amount": -1000.0},
+            headers={"Authorization": f"Bearer {other['access_token']}"},
+        )
+
+        response = client.get("/analysis/summary?end_date=2024-04-20", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["operations_count"] == 4
+        assert [m["month"] for m in data["month_over_month"]] == ["2024-01", "2024-02", "2024-03", "2024-04"]
+        assert data["category_percentiles"][0]["category"] == "Подписки"
+        assert data["recurring_payments"][0]["category"] == "Подписки"
+        assert data["recurring_payments"][0]["period"] == "monthly"
+
+    def test_empty_summary(self, client):
+        tokens = register_and_login(client, "summary_user3")
+        response = client.get("/analysis/summary", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        assert response.status_code == 200
+        assert response.json()["operations_count"] == 0
+
+    def test_invalid_range_returns_422(self, client):
+        tokens = register_and_login(client, "summary_user4")
+        response = client.get(
+            "/analysis/summary?start_date=2024-02-01&end_date=2024-01-01",
+            headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        )
+        assert response.status_code == 422
+
+
+class TestAnalysisCacheEndpoint:
+    """Настоящий analyze_operations, мокается только HTTP-вызов к Groq."""
+
+    def test_repeated_request_uses_cache_until_operations_change(self, client, monkeypatch):
+        calls = []
+
+        async def fake_request(payload):
+            calls.append(payload)
+            return f"анализ #{len(calls)}"
+
+        monkeypatch.setattr(gs, "GROQ_API_KEY", "fake-key")
+        monkeypatch.setattr(gs, "_request_analysis", fake_request)
+        tokens = register_and_login(client, "analysis_cache_user")
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        client.post("/operations/", json={"date": "2024-01-01", "amount": -10.0}, headers=headers)
+
+        first = client.get("/analysis/ai", headers=headers).json()
+        second = client.get("/analysis/ai", headers=headers).json()
+        assert first["analysis"] == second["analysis"] == "анализ #1"
+        assert len(calls) == 1
+
+        client.post("/operations/", json={"date": "2024-01-02", "amount": -20.0}, headers=headers)
+        third = client.get("/analysis/ai", headers=headers).json()
+        assert third["analysis"] == "анализ #2"
+        assert len(calls) == 2
+
+
+class TestAnalysisStreamEndpoint:
+    @staticmethod
+    def _events(body: str) -> list[tuple]:
+        events = []
+        for block in body.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.split("\n"))
+            events.append((fields.get("event", "message"), json.loads(fields["data"])))
+        return events
+
+    def test_requires_auth(self, client):
+        assert client.get("/analysis/ai/stream").status_code == 401
+
+    def test_relays_groq_stream_as_sse(self, client, groq_stub):
+        groq_stub.reply = "Больше всего трат на еду"
+        tokens = register_and_login(client, "stream_user1")
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        client.post("/operations/", json={"date": "2024-01-01", "amount": -10.0}, headers=headers)
+
+        response = client.get("/analysis/ai/stream", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.headers["x-accel-buffering"] == "no"
+        events = self._events(response.text)
+        assert "".join(data["delta"] for name, data in events if name == "message") == groq_stub.reply
+        assert events[-1] == ("done", {"operations_count": 1})
+
+    def test_groq_error_before_stream_returns_503(self, client, groq_stub):
+        groq_stub.then(status=500)
+        tokens = register_and_login(client, "stream_user2")
+        response = client.get("/analysis/ai/stream", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        assert response.status_code == 503
+
+    def test_error_mid_stream_is_sent_as_event(self, client):
+        async def _broken(ops):
+            yield "начало"
+            raise RuntimeError("Таймаут запроса к Groq")
+
+        tokens = register_and_login(client, "stream_user3")
+        with patch("routers.analysis.stream_analysis", side_effect=_broken):
+            response = client.get("/analysis/ai/stream", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        assert response.status_code == 200
+        assert self._events(response.text) == [
+            ("message", {"delta": "начало"}),
+            ("error", {"detail": "Таймаут запроса к Groq"}),
+        ]
+
+
+@pytest.fixture
+def lifespan_client(client, monkeypatch):
+    """TestClient с startup/shutdown: пул воркеров живёт в общем event loop между запросами."""
+    import main
+    monkeypatch.setattr(main, "ensure_bucket", lambda: None)
+    monkeypatch.setattr(main.maintenance_service, "TOKEN_PURGE_INTERVAL_SECONDS", 0)
+    with TestClient(main.app) as lifespan:
+        yield lifespan
+
+
+class TestAnalysisJobs:
+    @staticmethod
+    def _poll(client, job_id, headers):
+        for _ in range(200):
+            job = client.get(f"/analysis/jobs/{job_id}", headers=headers).json()
+            if job["status"] in ("done", "failed"):
+                return job
+            time.sleep(0.01)
+        raise AssertionError("job did not finish")
+
+    def test_requires_auth(self, client):
+        assert client.post("/analysis/jobs").status_code == 401
+
+    def test_job_result_is_polled(self, lifespan_client, monkeypatch):
+        async def _impl(ops):
+            return f"Анализ {len(ops)} операций"
+
+        monkeypatch.setattr(gs, "analyze_operations", _impl)
+        tokens = register_and_login(lifespan_client, "jobs_user1")
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        lifespan_client.post("/operations/", json={"date": "2024-01-01", "amount": -10.0}, headers=headers)
+
+        response = lifespan_client.post("/analysis/jobs", headers=headers)
+        assert response.status_code == 202
+        assert response.json()["status"] in ("queued", "running")
+
+        job = self._poll(lifespan_client, response.json()["id"], headers)
+        assert job["status"] == "done"
+        assert job["analysis"] == "Анализ 1 операций"
+        assert job["operations_count"] == 1
+
+    def test_failed_job_reports_error(self, lifespan_client, monkeypatch):
+        async def _impl(ops):
+            raise RuntimeError("Groq недоступен")
+
+        monkeypatch.setattr(gs, "analyze_operations", _impl)
+        tokens = register_and_login(lifespan_client, "jobs_user2")
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        job_id = lifespan_client.post("/analysis/jobs", headers=headers).json()["id"]
+        job = self._poll(lifespan_client, job_id, headers)
+        assert (job["status"], job["error"]) == ("failed", "Groq недоступен")
+
+    def test_foreign_and_unknown_jobs_are_404(self, lifespan_client, monkeypatch):
+        async def _impl(ops):
+            return "ok"
+
+        monkeypatch.setattr(gs, "analyze_operations", _impl)
+        owner = register_and_login(lifespan_client, "jobs_owner")
+        other = register_and_login(lifespan_client, "jobs_other")
+        job_id = lifespan_client.post(
+            "/analysis/jobs", headers={"Authorization": f"Bearer {owner['access_token']}"}
+        ).json()["id"]
+        other_headers = {"Authorization": f"Bearer {other['access_token']}"}
+        assert lifespan_client.get(f"/analysis/jobs/{job_id}", headers=other_headers).status_code == 404
+        assert lifespan_client.get("/analysis/jobs/missing", headers=other_headers).status_code == 404
+
+    def test_per_user_limit_returns_429(self, lifespan_client, monkeypatch):
+        async def _slow(ops):
+            await asyncio.sleep(0.5)
+            return "ok"
+
+        monkeypatch.setattr(gs, "analyze_operations", _slow)
+        tokens = register_and_login(lifespan_client, "jobs_user3")
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        codes = [lifespan_client.post("/analysis/jobs", headers=headers).status_code for _ in range(3)]
+        assert codes == [202, 202, 429]
+
+    def test_full_queue_returns_503(self, client):
+        tokens = register_and_login(client, "jobs_user4")
+        with patch("routers.analysis.analysis_jobs.submit", side_effect=QueueFullError("Очередь анализа переполнена")):
+            response = client.post("/analysis/jobs", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        assert response.status_code == 503
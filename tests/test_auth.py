@@ -99,3 +99,48 @@ def test_logout_blocks_access_token(client):
     )
     response = client.get("/auth/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
     assert response.status_code == 401
+
+
+def test_token_without_jti_is_rejected(client):
+    from jose import jwt
+    from datetime import datetime, timedelta
+    from services.auth_service import SECRET_KEY, ALGORITHM
+
+    register_and_login(client, "nojtiuser")
+    token = jwt.encode(
+        {"user_id": 1, "role": "user", "exp": datetime.utcnow() + timedelta(minutes=5)},
+        SECRET_KEY, algorithm=ALGORITHM,
+    )
+    response = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+
+
+def test_logout_revokes_only_that_token(client):
+    register_and_login(client, "multisession")
+    second = client.post("/auth/login", data={"username": "multisession", "password": "test123"}).json()
+    first = client.post("/auth/login", data={"username": "multisession", "password": "test123"}).json()
+    client.post(
+        "/auth/logout",
+        json={"refresh_token": first["refresh_token"]},
+        headers={"Authorization": f"Bearer {first['access_token']}"}
+    )
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {first['access_token']}"}).status_code == 401
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {second['access_token']}"}).status_code == 200
+
+
+def test_login_returns_503_when_hash_queue_full(client, monkeypatch):
+    import utils.utils
+    client.post("/auth/register", json={"username": "busyuser", "password": "test123"})
+    monkeypatch.setattr(utils.utils, "PASSWORD_HASH_QUEUE_LIMIT", 0)
+
+    response = client.post("/auth/login", data={"username": "busyuser", "password": "test123"})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_register_returns_503_when_hash_queue_full(client, monkeypatch):
+    import utils.utils
+    monkeypatch.setattr(utils.utils, "PASSWORD_HASH_QUEUE_LIMIT", 0)
+
+    response = client.post("/auth/register", json={"username": "busyreg", "password": "test123"})
+    assert response.status_code == 503
@@ -0,0 +1,52 @@
+"""Модульные тесты utils.cache: TTLCache и BloomFilter."""
+from unittest.mock import patch
+from utils.cache import TTLCache, BloomFilter
+
+
+class TestTTLCache:
+    def test_get_returns_stored_value_and_counts_hits(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_entries_expire(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        with patch("utils.cache.time.monotonic", return_value=1000.0):
+            cache.set("a", 1)
+        with patch("utils.cache.time.monotonic", return_value=1061.0):
+            assert cache.get("a") is None
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert len(cache) == 2
+
+    def test_pop_removes_entry(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        assert cache.pop("a") == 1
+        assert cache.get("a") is None
+
+
+class TestBloomFilter:
+    def test_added_items_are_always_found(self):
+        bloom = BloomFilter(capacity=1000)
+        items = [f"jti-{i}" for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+        assert all(item in bloom for item in items)
+
+    def test_false_positive_rate_is_low(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"in-{i}")
+        false_positives = sum(f"out-{i}" in bloom for i in range(10_000))
+        assert false_positives < 300
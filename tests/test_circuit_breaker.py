@@ -0,0 +1,66 @@
+"""Модульные тесты utils.circuit_breaker."""
+from unittest.mock import patch
+from utils.circuit_breaker import CircuitBreaker
+
+
+def _at(seconds: float):
+    return patch("utils.circuit_breaker.time.monotonic", return_value=seconds)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.stats() == {"state": "open", "failures": 3, "opened": 1, "rejected": 1}
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+
+
+def test_half_open_lets_single_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    with _at(1000.0):
+        breaker.record_failure()
+        assert breaker.retry_in() == 30
+    with _at(1031.0):
+        assert breaker.allow()
+        assert not breaker.allow()  # пока пробный запрос не завершился
+        breaker.record_failure()
+        assert breaker.state == "open"
+    with _at(1062.0):
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.allow() and breaker.allow()
+        assert breaker.state == "closed"
+
+
+def test_released_trial_lets_next_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    with _at(1000.0):
+        breaker.record_failure()
+    with _at(1031.0):
+        assert breaker.allow()
+        breaker.release()  # пробный запрос отменён до ответа
+        assert breaker.state == "half_open"
+        assert breaker.allow()
+        assert not breaker.allow()
+
+
+def test_abandoned_trial_expires_after_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    with _at(1000.0):
+        breaker.record_failure()
+    with _at(1031.0):
+        assert breaker.allow()
+    with _at(1060.0):
+        assert not breaker.allow()
+    with _at(1061.0):
+        assert breaker.allow()
@@ -0,0 +1,109 @@
+"""Модульные тесты db.database: async URL, параметры движка, метрики пула, профиль SQLite."""
+import pytest
+from sqlalchemy import create_engine, event, text, exc
+from sqlalchemy.orm import sessionmaker
+from db.database import (
+    to_sync_url, to_async_url, engine_options, InstrumentedQueuePool, PoolMetrics,
+    apply_sqlite_pragmas, SerializedWriteSession, sqlite_write_lock, Base,
+)
+from models.models import User
+
+
+class TestDatabaseConfig:
+    def test_async_url_for_sqlite(self):
+        assert to_async_url("sqlite:///./finance.db") == "sqlite+aiosqlite:///./finance.db"
+
+    def test_async_url_for_postgres(self):
+        assert to_async_url("postgresql://u:p@db:5432/finance") == "postgresql+asyncpg://u:p@db:5432/finance"
+        assert to_async_url("postgresql+psycopg2://u:p@db/finance") == "postgresql+asyncpg://u:p@db/finance"
+
+    def test_sync_url_defaults_to_psycopg_for_postgres(self):
+        assert to_sync_url("postgres://u:p@db/finance") == "postgresql+psycopg://u:p@db/finance"
+        assert to_sync_url("postgresql+psycopg2://u:p@db/finance") == "postgresql+psycopg2://u:p@db/finance"
+        assert to_sync_url("sqlite:///./finance.db") == "sqlite:///./finance.db"
+
+    def test_pool_options_for_server_database(self):
+        options = engine_options("postgresql://u:p@db/finance", InstrumentedQueuePool)
+        assert options["poolclass"] is InstrumentedQueuePool
+        assert {"pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping"} <= options.keys()
+        assert "connect_args" not in options
+
+    def test_in_memory_sqlite_keeps_default_pool(self):
+        options = engine_options("sqlite://", InstrumentedQueuePool)
+        assert "poolclass" not in options
+        assert options["connect_args"] == {"check_same_thread": False}
+
+
+class TestPoolMetrics:
+    def _engine(self, tmp_path, metrics, **pool):
+        pool_cls = type("TestPool", (InstrumentedQueuePool,), {"metrics": metrics})
+        return create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=pool_cls, **pool)
+
+    def test_checkouts_and_saturation_are_reported(self, tmp_path):
+        metrics = PoolMetrics()
+        engine = self._engine(tmp_path, metrics, pool_size=2, max_overflow=0)
+        with engine.connect() as conn:
+            conn.execute(text("select 1"))
+            snapshot = metrics.snapshot(engine.pool)
+        assert snapshot["checkouts"] == 1
+        assert snapshot["checked_out"] == 1
+        assert snapshot["saturation"] == 0.5
+
+    def test_checkout_timeout_is_counted(self, tmp_path):
+        metrics = PoolMetrics()
+        engine = self._engine(tmp_path, metrics, pool_size=1, max_overflow=0, pool_timeout=0.05)
+        with engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+        snapshot = metrics.snapshot(engine.pool)
+        assert snapshot["timeouts"] == 1
+        assert snapshot["wait_max_ms"] >= 50
+
+
+class TestSqliteProfile:
+    def _engine(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}", connect_args={"check_same_thread": False})
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+        return engine
+
+    def test_pragmas_applied_on_connect(self, tmp_path):
+        with self._engine(tmp_path).connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() > 0
+            assert conn.execute(text("PRAGMA temp_store")).scalar() == 2  # MEMORY
+
+    def test_reader_not_blocked_by_open_write_transaction(self, tmp_path):
+        engine = self._engine(tmp_path)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        with engine.connect() as writer, engine.connect() as reader:
+            writer.begin()
+            writer.execute(text("INSERT INTO t VALUES (1)"))
+            assert reader.execute(text("SELECT count(*) FROM t")).scalar() == 0
+            writer.commit()
+
+    def test_write_lock_held_from_flush_until_commit(self, tmp_path):
+        engine = self._engine(tmp_path)
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine, autoflush=False, class_=SerializedWriteSession)()
+        try:
+            db.query(User).all()
+            assert not sqlite_write_lock.locked()  # чтение lock не берёт
+
+            db.add(User(username="writer", hashed_password="x"))
+            db.flush()
+            assert sqlite_write_lock.locked()
+            db.commit()
+            assert not sqlite_write_lock.locked()
+
+            db.add(User(username="rolled-back", hashed_password="x"))
+            db.flush()
+            db.rollback()
+            assert not sqlite_write_lock.locked()
+
+            db.query(User).filter(User.username == "writer").delete()
+            assert sqlite_write_lock.locked()
+        finally:
+            db.close()
+        assert not sqlite_write_lock.locked()
@@ -2,11 +2,13 @@
 Интеграционные тесты файловых эндпоинтов (S3 мокируется).
 POST   /operations/{id}/files
 GET    /operations/{id}/files/{fid}/url
+GET    /operations/{id}/files/urls, /operations/files/urls?ids=
 DELETE /operations/{id}/files/{fid}
+и потоковая загрузка s3_service.upload_file (boto3-клиент — MagicMock).
 """
 import io
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 from datetime import date
 from tests.conftest import register_and_login
 
@@ -96,6 +98,38 @@ class TestFileUpload:
         assert response.status_code == 400
         assert "large" in response.json()["detail"].lower()
 
+    def test_upload_streams_file_object(self, client):
+        tokens = register_and_login(client, "fup_stream")
+        op_id = _make_operation(client, tokens)
+        received = {}
+
+        def fake_upload(fileobj, filename, content_type):
+            received["data"] = fileobj.read()
+            return "k.pdf"
+
+        with patch("services.s3_service.upload_file", side_effect=fake_upload):
+            response = client.post(
+                f"/operations/{op_id}/files",
+                files={"file": ("receipt.pdf", b"%PDF-stream", "application/pdf")},
+                headers={"Authorization": f"Bearer {tokens['access_token']}"},
+            )
+        assert response.status_code == 200
+        assert received["data"] == b"%PDF-stream"
+
+    def test_limit_exceeded_while_streaming_returns_400(self, client):
+        import services.s3_service as s3
+        tokens = register_and_login(client, "fup_stream2")
+        op_id = _make_operation(client, tokens)
+
+        with patch("services.s3_service.upload_file", side_effect=s3.FileTooLargeError("too big")):
+            response = client.post(
+                f"/operations/{op_id}/files",
+                files={"file": ("receipt.pdf", b"%PDF", "application/pdf")},
+                headers={"Authorization": f"Bearer {tokens['access_token']}"},
+            )
+        assert response.status_code == 400
+        assert "large" in response.json()["detail"].lower()
+
     def test_upload_to_nonexistent_operation_returns_404(self, client):
         tokens = register_and_login(client, "fup5")
 
@@ -183,6 +217,148 @@ class TestFileUrl:
         assert response.status_code == 404
 
 
+# ---------------------------------------------------------------------------
+# Кэш presigned URL и URL всех вложений
+# ---------------------------------------------------------------------------
+
+def _upload(client, tokens, op_id, s3_key, filename="r.pdf"):
+    with patch("services.s3_service.upload_file", return_value=s3_key):
+        r = client.post(
+            f"/operations/{op_id}/files",
+            files={"file": (filename, b"%PDF", "application/pdf")},
+            headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        )
+    return r.json()["id"]
+
+
+def _make_plain_operation(client, tokens):
+    return client.post(
+        "/operations/",
+        json={"date": str(date.today()), "amount": 50.0},
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+    ).json()["id"]
+
+
+def _sign(s3_key):
+    return f"http://minio/{s3_key}?sig"
+
+
+class TestPresignedUrlCache:
+    def test_repeated_requests_sign_once(self, client):
+        tokens = register_and_login(client, "purl1")
+        op_id = _make_operation(client, tokens)
+        fid = _upload(client, tokens, op_id, "a.pdf")
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+        with patch("services.s3_service.get_presigned_url", side_effect=_sign) as sign, \
+                patch("services.s3_service.time") as fake_time:
+            fake_time.time.return_value = 1000.0
+            first = client.get(f"/operations/{op_id}/files/{fid}/url", headers=headers).json()
+            fake_time.time.return_value = 1600.0
+            second = client.get(f"/operations/{op_id}/files/{fid}/url", headers=headers).json()
+
+        assert sign.call_count == 1
+        assert first["url"] == second["url"] == "http://minio/a.pdf?sig"
+        assert first["expires_in"] == 3600
+        assert second["expires_in"] == 3000
+
+    def test_cache_ttl_leaves_refresh_margin(self):
+        from services import s3_service
+        assert s3_service.presigned_url_cache.ttl == (
+            s3_service.PRESIGNED_URL_EXPIRES - s3_service.PRESIGNED_URL_REFRESH_MARGIN
+        )
+
+    def test_expired_entry_is_signed_again(self):
+        from services import s3_service
+        with patch("services.s3_service.get_presigned_url", side_effect=["http://u1", "http://u2"]):
+            assert s3_service.get_cached_presigned_url("k")[0] == "http://u1"
+            s3_service.presigned_url_cache.set("k", ("http://u1", 0.0), ttl=0)
+            assert s3_service.get_cached_presigned_url("k") == ("http://u2", s3_service.PRESIGNED_URL_EXPIRES)
+
+    def test_delete_invalidates_cache(self):
+        from services import s3_service
+        s3_service.presigned_url_cache.set("a", ("http://a", 0.0))
+        s3_service.presigned_url_cache.set("b", ("http://b", 0.0))
+        fake = MagicMock()
+        fake.delete_objects.return_value = {}
+        with patch.object(s3_service, "_get_client", return_value=fake):
+            s3_service.delete_file("a")
+            s3_service.delete_files(["b"])
+        assert s3_service.presigned_url_cache.get("a") is None
+        assert s3_service.presigned_url_cache.get("b") is None
+
+
+class TestFileUrlsBatch:
+    def test_operation_files_urls(self, client):
+        tokens = register_and_login(client, "purl2")
+        op_id = _make_operation(client, tokens)
+        first = _upload(client, tokens, op_id, "a.pdf", "a.pdf")
+        second = _upload(client, tokens, op_id, "b.pdf", "b.pdf")
+
+        with patch("services.s3_service.get_presigned_url", side_effect=_sign):
+            response = client.get(
+                f"/operations/{op_id}/files/urls",
+                headers={"Authorization": f"Bearer {tokens['access_token']}"},
+            )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["operation_id"] == op_id
+        assert {f["id"]: f["url"] for f in data["files"]} == {
+            first: "http://minio/a.pdf?sig", second: "http://minio/b.pdf?sig",
+        }
+        assert all(f["expires_in"] == 3600 for f in data["files"])
+
+    def test_batch_keeps_ids_order(self, client):
+        tokens = register_and_login(client, "purl3")
+        op_a = _make_operation(client, tokens)
+        op_b = _make_plain_operation(client, tokens)
+        _upload(client, tokens, op_a, "a.pdf")
+
+        with patch("services.s3_service.get_presigned_url", side_effect=_sign) as sign:
+            response = client.get(
+                f"/operations/files/urls?ids={op_b}&ids={op_a}&ids={op_b}",
+                headers={"Authorization": f"Bearer {tokens['access_token']}"},
+            )
+        assert response.status_code == 200
+        data = response.json()
+        assert [item["operation_id"] for item in data] == [op_b, op_a]
+        assert data[0]["files"] == []
+        assert data[1]["files"][0]["url"] == "http://minio/a.pdf?sig"
+        assert sign.call_count == 1
+
+    def test_batch_with_foreign_operation_returns_404(self, client):
+        tokens_a = register_and_login(client, "purl_a")
+        tokens_b = register_and_login(client, "purl_b")
+        own = _make_operation(client, tokens_a)
+        foreign = _make_plain_operation(client, tokens_b)
+
+        response = client.get(
+            f"/operations/files/urls?ids={own}&ids={foreign}",
+            headers={"Authorization": f"Bearer {tokens_a['access_token']}"},
+        )
+        assert response.status_code == 404
+        assert str(foreign) in response.json()["detail"]
+
+    def test_batch_without_ids_returns_422(self, client):
+        tokens = register_and_login(client, "purl4")
+        response = client.get(
+            "/operations/files/urls",
+            headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        )
+        assert response.status_code == 422
+
+    def test_operation_files_urls_for_other_user_returns_404(self, client):
+        tokens_a = register_and_login(client, "purl_c")
+        tokens_b = register_and_login(client, "purl_d")
+        op_id = _make_operation(client, tokens_a)
+
+        response = client.get(
+            f"/operations/{op_id}/files/urls",
+            headers={"Authorization": f"Bearer {tokens_b['access_token']}"},
+        )
+        assert response.status_code == 404
+
+
 # ---------------------------------------------------------------------------
 # Delete file
 # ---------------------------------------------------------------------------
@@ -246,3 +422,124 @@ class TestFileDelete:
                 headers={"Authorization": f"Bearer {tokens['access_token']}"},
             )
         mock_del.assert_called_once()
+
+
+# ---------------------------------------------------------------------------
+# s3_service.upload_file — загрузка кусками
+# ---------------------------------------------------------------------------
+
+class TestS3StreamingUpload:
+    PART = 5
+
+    @pytest.fixture
+    def s3_client(self, monkeypatch):
+        import services.s3_service as s3
+        client = MagicMock()
+        client.create_multipart_upload.return_value = {"UploadId": "up-1"}
+        client.upload_part.side_effect = lambda **kw: {"ETag": f"etag-{kw['PartNumber']}"}
+        monkeypatch.setattr(s3, "_get_client", lambda: client)
+        monkeypatch.setattr(s3, "S3_UPLOAD_PART_SIZE", self.PART)
+        return client
+
+    class _Reads(io.BytesIO):
+        """BytesIO, запоминающий размер каждого read."""
+        def __init__(self, data):
+            super().__init__(data)
+            self.sizes = []
+
+        def read(self, size=-1):
+            self.sizes.append(size)
+            return super().read(size)
+
+    def test_small_file_uses_single_put(self, s3_client):
+        import services.s3_service as s3
+        key = s3.upload_file(io.BytesIO(b"abc"), "a.pdf", "application/pdf")
+        assert key.endswith(".pdf")
+        s3_client.put_object.assert_called_once()
+        assert s3_client.put_object.call_args.kwargs["Body"] == b"abc"
+        s3_client.create_multipart_upload.assert_not_called()
+
+    def test_large_file_uses_multipart_in_chunks(self, s3_client):
+        import services.s3_service as s3
+        fileobj = self._Reads(b"0123456789ab")
+        key = s3.upload_file(fileobj, "a.pdf", "application/pdf", max_size=100)
+        bodies = [c.kwargs["Body"] for c in s3_client.upload_part.call_args_list]
+        assert bodies == [b"01234", b"56789", b"ab"]
+        assert set(fileobj.sizes) == {self.PART}  # файл ни разу не читается целиком
+        s3_client.complete_multipart_upload.assert_called_once_with(
+            Bucket=s3.S3_BUCKET, Key=key, UploadId="up-1",
+            MultipartUpload={"Parts": [{"PartNumber": i, "ETag": f"etag-{i}"} for i in (1, 2, 3)]},
+        )
+        s3_client.put_object.assert_not_called()
+
+    def test_oversized_stream_is_aborted_early(self, s3_client):
+        import services.s3_service as s3
+        fileobj = self._Reads(b"x" * 100)
+        with pytest.raises(s3.FileTooLargeError):
+            s3.upload_file(fileobj, "a.pdf", "application/pdf", max_size=12)
+        assert s3_client.upload_part.call_count == 2  # третий кусок уже за лимитом
+        assert len(fileobj.sizes) == 3
+        s3_client.abort_multipart_upload.assert_called_once()
+        s3_client.complete_multipart_upload.assert_not_called()
+
+    def test_oversized_single_chunk_never_reaches_s3(self, s3_client):
+        import services.s3_service as s3
+        with pytest.raises(s3.FileTooLargeError):
+            s3.upload_file(io.BytesIO(b"abcd"), "a.pdf", "application/pdf", max_size=3)
+        s3_client.put_object.assert_not_called()
+        s3_client.create_multipart_upload.assert_not_called()
+
+    def test_failed_part_aborts_upload(self, s3_client):
+        import services.s3_service as s3
+        s3_client.upload_part.side_effect = RuntimeError("network")
+        with pytest.raises(RuntimeError):
+            s3.upload_file(io.BytesIO(b"x" * 12), "a.pdf", "application/pdf")
+        s3_client.abort_multipart_upload.assert_called_once_with(Bucket=s3.S3_BUCKET, Key=ANY, UploadId="up-1")
+
+
+
+# ---------------------------------------------------------------------------
+# s3_service — кэш boto3-клиентов
+# ---------------------------------------------------------------------------
+
+class TestS3Clients:
+    @pytest.fixture(autouse=True)
+    def empty_cache(self, monkeypatch):
+        import services.s3_service as s3
+        monkeypatch.setattr(s3, "_clients", {})
+
+    def test_client_is_created_once(self):
+        import services.s3_service as s3
+        client = s3._get_client()
+        assert s3._get_client() is client
+        assert client.meta.config.max_pool_connections == s3.S3_MAX_POOL_CONNECTIONS
+        assert client.meta.config.retries["total_max_attempts"] == s3.S3_MAX_ATTEMPTS
+
+    def test_public_client_uses_public_endpoint(self, monkeypatch):
+        import services.s3_service as s3
+        monkeypatch.setattr(s3, "S3_PUBLIC_ENDPOINT", "http://public.example:9000")
+        s3.init_clients()
+        assert s3._get_public_client().meta.endpoint_url == "http://public.example:9000"
+        assert s3._get_client() is not s3._get_public_client()
+        assert len(s3._clients) == 2
+
+    def test_concurrent_first_calls_create_one_client(self, monkeypatch):
+        import threading
+        import time
+        import services.s3_service as s3
+        created = []
+
+        def slow_new_client(endpoint_url):
+            time.sleep(0.05)
+            created.append(endpoint_url)
+            return MagicMock()
+
+        monkeypatch.setattr(s3, "_new_client", slow_new_client)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(s3._get_client())) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(created) == 1
+        assert all(r is results[0] for r in results)
@@ -152,3 +152,259 @@ def test_get_nonexistent_operation(client):
     tokens = register_and_login(client, "opuser9")
     response = client.get("/operations/999", headers={"Authorization": f"Bearer {tokens['access_token']}"})
     assert response.status_code == 404
+
+
+def _walk_cursor_pages(client, tokens, query):
+    ids, pages = [], 0
+    url = f"/operations/?{query}"
+    while True:
+        data = client.get(url, headers={"Authorization": f"Bearer {tokens['access_token']}"}).json()
+        ids.extend(item["id"] for item in data["items"])
+        pages += 1
+        if not data["next_cursor"]:
+            return ids, pages
+        url = f"/operations/?{query}&cursor={data['next_cursor']}"
+
+
+def test_cursor_pagination_walks_all_operations(client):
+    tokens = register_and_login(client, "opuser10")
+    category_id = create_test_category(client, tokens)
+    created = []
+    # две операции на одну дату — проверяем тай-брейкер по id
+    for days_ago in (0, 1, 1, 2, 3):
+        r = client.post(
+            "/operations/",
+            json={"date": str(date.today() - timedelta(days=days_ago)), "amount": 10.0, "category_id": category_id},
+            headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        )
+        created.append(r.json()["id"])
+
+    ids, pages = _walk_cursor_pages(client, tokens, "page_size=2")
+    assert pages == 3
+    assert len(ids) == len(set(ids)) == 5
+    assert set(ids) == set(created)
+    assert ids[0] == created[0] and ids[-1] == created[-1]
+
+
+def test_cursor_pagination_by_amount_asc(client):
+    tokens = register_and_login(client, "opuser11")
+    category_id = create_test_category(client, tokens)
+    for amount in (30.0, 10.0, 20.0, 10.0):
+        client.post(
+            "/operations/",
+            json={"date": str(date.today()), "amount": amount, "category_id": category_id},
+            headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        )
+
+    ids, _ = _walk_cursor_pages(client, tokens, "sort_by=amount&sort_order=asc&page_size=1")
+    assert len(ids) == len(set(ids)) == 4
+    amounts = [client.get(f"/operations/{i}", headers={"Authorization": f"Bearer {tokens['access_token']}"}).json()["amount"] for i in ids]
+    assert amounts == sorted(amounts)
+
+
+def test_invalid_cursor_returns_422(client):
+    tokens = register_and_login(client, "opuser12")
+    response = client.get("/operations/?cursor=not-a-cursor", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 422
+
+
+def test_cursor_from_other_sort_returns_422(client):
+    tokens = register_and_login(client, "opuser13")
+    category_id = create_test_category(client, tokens)
+    for _ in range(2):
+        client.post("/operations/", json={"date": str(date.today()), "amount": 5.0, "category_id": category_id}, headers={"Authorization": f"Bearer {tokens['access_token']}"})
+
+    first = client.get("/operations/?page_size=1", headers={"Authorization": f"Bearer {tokens['access_token']}"}).json()
+    response = client.get(
+        f"/operations/?page_size=1&sort_by=amount&cursor={first['next_cursor']}",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+    )
+    assert response.status_code == 422
+
+
+def test_get_operations_without_total(client):
+    tokens = register_and_login(client, "opuser14")
+    category_id = create_test_category(client, tokens)
+    for _ in range(3):
+        client.post("/operations/", json={"date": str(date.today()), "amount": 5.0, "category_id": category_id}, headers={"Authorization": f"Bearer {tokens['access_token']}"})
+
+    response = client.get("/operations/?with_total=false&page_size=2", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] is None
+    assert data["pages"] is None
+    assert len(data["items"]) == 2
+    assert data["next_cursor"] is not None
+
+
+def test_async_get_operations_matches_sync(client):
+    import asyncio
+    import crud.operation
+    from models import models
+    from tests.conftest import TestingSessionLocal, TestingAsyncSessionLocal
+
+    tokens = register_and_login(client, "opuser15")
+    category_id = create_test_category(client, tokens)
+    for i in range(3):
+        client.post("/operations/", json={"date": str(date.today() - timedelta(days=i)), "amount": 5.0 + i, "category_id": category_id}, headers={"Authorization": f"Bearer {tokens['access_token']}"})
+
+    db = TestingSessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.username == "opuser15").first()
+        sync_page = crud.operation.get_operations(db, user, sort_by="amount", page_size=2)
+    finally:
+        db.close()
+
+    async def _fetch():
+        async with TestingAsyncSessionLocal() as adb:
+            return await crud.operation.get_operations_async(adb, user, sort_by="amount", page_size=2)
+
+    async_page = asyncio.run(_fetch())
+    assert [op.id for op in async_page["items"]] == [op.id for op in sync_page["items"]]
+    assert async_page["total"] == sync_page["total"] == 3
+    assert async_page["next_cursor"] == sync_page["next_cursor"]
+    assert async_page["items"][0].category.name == "Food"
+
+
+def test_materialized_balance_follows_writes(client):
+    from models import models
+    from tests.conftest import TestingSessionLocal
+
+    tokens = register_and_login(client, "opuser16")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    first = client.post("/operations/", json={"date": str(date.today()), "amount": 100.0}, headers=headers).json()
+    second = client.post("/operations/", json={"date": str(date.today()), "amount": -30.0}, headers=headers).json()
+    client.put(f"/operations/{first['id']}", json={"date": str(date.today()), "amount": 80.0}, headers=headers)
+    client.delete(f"/operations/{second['id']}", headers=headers)
+    client.post("/operations/import", files={"file": ("ops.csv", b"date,amount\n2024-01-01,5\n2024-01-02,-1\n", "text/csv")}, headers=headers)
+    client.post("/operations/batch", json={"actions": [
+        {"action": "create", "data": {"date": "2024-01-03", "amount": 10.0}},
+        {"action": "update", "id": first["id"], "data": {"date": "2024-01-03", "amount": 70.0}},
+    ]}, headers=headers)
+
+    assert client.get("/operations/balance/total", headers=headers).json()["balance"] == 84.0
+    db = TestingSessionLocal()
+    try:
+        stored = db.query(models.UserBalance).one()
+        assert stored.balance == 84.0
+    finally:
+        db.close()
+
+
+def test_first_balance_write_races_with_concurrent_insert(client):
+    import crud.operation
+    from models import models
+    from tests.conftest import TestingSessionLocal
+
+    tokens = register_and_login(client, "opuser22")
+    client.post("/operations/", json={"date": str(date.today()), "amount": 40.0},
+                headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    db = TestingSessionLocal()
+    try:
+        user = db.query(models.User).filter_by(username="opuser22").one()
+        db.query(models.UserBalance).delete()
+        db.commit()
+        # строки нет — создаётся из SUM по операциям
+        crud.operation._upsert_balance(db, user.id, 40.0)
+        db.commit()
+        assert db.get(models.UserBalance, user.id).balance == 40.0
+        # строку уже вставила параллельная транзакция (UPDATE промахнулся) — delta прибавляется
+        crud.operation._upsert_balance(db, user.id, 2.5)
+        db.commit()
+        db.expire_all()
+        assert db.get(models.UserBalance, user.id).balance == 42.5
+
+        crud.operation.set_balances(db, {user.id: 40.0})
+        db.expire_all()
+        assert db.get(models.UserBalance, user.id).balance == 40.0
+    finally:
+        db.close()
+
+def _stats(client, headers, **params):
+    response = client.get("/operations/stats", params=params, headers=headers)
+    assert response.status_code == 200
+    return response.json()["items"]
+
+
+def test_operation_stats_by_day_week_month(client):
+    tokens = register_and_login(client, "opuser17")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    food = create_test_category(client, tokens, name="Food")
+    ops = [
+        ("2024-01-01", -10.0, food),  # понедельник
+        ("2024-01-01", -30.0, food),
+        ("2024-01-03", -5.0, food),
+        ("2024-01-03", 100.0, None),
+        ("2024-02-10", -7.0, food),
+    ]
+    for day, amount, category_id in ops:
+        client.post("/operations/", json={"date": day, "amount": amount, "category_id": category_id}, headers=headers)
+
+    days = _stats(client, headers)
+    assert [(b["period"], b["category"], b["total"], b["count"]) for b in days] == [
+        ("2024-01-01", "Food", -40.0, 2),
+        ("2024-01-03", None, 100.0, 1),
+        ("2024-01-03", "Food", -5.0, 1),
+        ("2024-02-10", "Food", -7.0, 1),
+    ]
+    assert (days[0]["min"], days[0]["max"]) == (-30.0, -10.0)
+
+    weeks = _stats(client, headers, granularity="week", category_id=food)
+    assert [(b["period"], b["total"], b["count"], b["min"], b["max"]) for b in weeks] == [
+        ("2024-01-01", -45.0, 3, -30.0, -5.0),
+        ("2024-02-05", -7.0, 1, -7.0, -7.0),
+    ]
+
+    months = _stats(client, headers, granularity="month", start_date="2024-01-02", end_date="2024-01-31")
+    assert [(b["period"], b["category_id"], b["total"]) for b in months] == [
+        ("2024-01-01", None, 100.0),
+        ("2024-01-01", food, -5.0),
+    ]
+
+
+def test_operation_stats_follow_updates_and_deletes(client):
+    tokens = register_and_login(client, "opuser18")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    op = client.post("/operations/", json={"date": "2024-03-01", "amount": 50.0}, headers=headers).json()
+    other = client.post("/operations/", json={"date": "2024-03-01", "amount": 20.0}, headers=headers).json()
+
+    client.put(f"/operations/{op['id']}", json={"date": "2024-03-02", "amount": 60.0}, headers=headers)
+    assert [(b["period"], b["total"]) for b in _stats(client, headers)] == [("2024-03-01", 20.0), ("2024-03-02", 60.0)]
+
+    client.delete(f"/operations/{other['id']}", headers=headers)
+    client.post("/operations/batch", json={"actions": [{"action": "create", "data": {"date": "2024-03-02", "amount": 1.0}}]}, headers=headers)
+    client.post("/operations/import", files={"file": ("o.csv", b"date,amount\n2024-03-05,2\n", "text/csv")}, headers=headers)
+    assert [(b["period"], b["total"], b["count"]) for b in _stats(client, headers)] == [
+        ("2024-03-02", 61.0, 2), ("2024-03-05", 2.0, 1),
+    ]
+
+
+def test_operation_stats_follow_category_delete(client):
+    tokens = register_and_login(client, "opuser21")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    food = create_test_category(client, tokens, name="Food21")
+    client.post("/operations/", json={"date": "2024-04-01", "amount": -10.0, "category_id": food}, headers=headers)
+    client.post("/operations/", json={"date": "2024-04-01", "amount": -5.0}, headers=headers)
+
+    assert client.delete(f"/categories/{food}", headers=headers).status_code == 200
+    assert [(b["period"], b["category_id"], b["total"], b["count"]) for b in _stats(client, headers)] == [
+        ("2024-04-01", None, -15.0, 2),
+    ]
+    ops = client.get("/operations/", headers=headers).json()
+    assert all(op["category_id"] is None for op in ops["items"])
+
+
+def test_operation_stats_are_per_user(client):
+    tokens_a = register_and_login(client, "opuser19a")
+    tokens_b = register_and_login(client, "opuser19b")
+    client.post("/operations/", json={"date": "2024-03-01", "amount": 5.0}, headers={"Authorization": f"Bearer {tokens_a['access_token']}"})
+    assert _stats(client, {"Authorization": f"Bearer {tokens_b['access_token']}"}) == []
+
+
+def test_operation_stats_invalid_range_returns_422(client):
+    tokens = register_and_login(client, "opuser20")
+    response = client.get(
+        "/operations/stats?start_date=2024-02-01&end_date=2024-01-01",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+    )
+    assert response.status_code == 422
@@ -0,0 +1,315 @@
+"""
+Интеграционные тесты массовых операций:
+POST /operations/import
+GET  /operations/export
+POST /operations/batch
+"""
+import csv
+import io
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+import crud.operation
+from tests.conftest import register_and_login
+from tests.test_operations import create_test_category
+
+
+def _auth(tokens):
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+def _import(client, tokens, content: bytes, filename="ops.csv", **params):
+    return client.post(
+        "/operations/import",
+        params=params,
+        files={"file": (filename, content, "text/plain")},
+        headers=_auth(tokens),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Import
+# ---------------------------------------------------------------------------
+
+class TestImport:
+    def test_import_csv_with_category_names(self, client):
+        tokens = register_and_login(client, "imp1")
+        create_test_category(client, tokens, name="Food")
+        csv_data = (
+            "date,amount,comment,category\n"
+            "2024-01-01,-100.5,Обед,Food\n"
+            "2024-01-02,2000,,\n"
+        ).encode()
+
+        response = _import(client, tokens, csv_data)
+        assert response.status_code == 200
+        assert response.json() == {"imported": 2, "failed": 0, "errors": []}
+
+        items = client.get("/operations/?sort_order=asc", headers=_auth(tokens)).json()["items"]
+        assert [op["amount"] for op in items] == [-100.5, 2000.0]
+        assert items[0]["category"]["name"] == "Food"
+        assert items[0]["comment"] == "Обед"
+        assert items[1]["comment"] is None and items[1]["category_id"] is None
+
+    def test_import_jsonl_detected_by_extension(self, client):
+        tokens = register_and_login(client, "imp2")
+        category_id = create_test_category(client, tokens)
+        lines = [
+            {"date": "2024-02-01", "amount": 10, "category_id": category_id},
+            {"date": "2024-02-02", "amount": -5, "comment": "x"},
+        ]
+        content = "\n".join(json.dumps(line) for line in lines).encode()
+
+        response = _import(client, tokens, content, filename="ops.jsonl")
+        assert response.json()["imported"] == 2
+        balance = client.get("/operations/balance/total", headers=_auth(tokens)).json()["balance"]
+        assert balance == 5.0
+
+    def test_bad_rows_reported_without_aborting_import(self, client):
+        tokens = register_and_login(client, "imp3")
+        csv_data = (
+            "date,amount,category\n"
+            "2024-01-01,10,\n"
+            "not-a-date,10,\n"
+            "2024-01-03,0,\n"
+            "2024-01-04,10,Unknown\n"
+            "2024-01-05,20,\n"
+        ).encode()
+
+        data = _import(client, tokens, csv_data).json()
+        assert data["imported"] == 2
+        assert data["failed"] == 3
+        assert [e["line"] for e in data["errors"]] == [3, 4, 5]
+        assert "date" in data["errors"][0]["error"]
+        assert "Unknown category" in data["errors"][2]["error"]
+
+    def test_invalid_json_line_reported(self, client):
+        tokens = register_and_login(client, "imp4")
+        content = b'{"date": "2024-01-01", "amount": 1}\n{broken\n[1, 2]\n'
+
+        data = _import(client, tokens, content, format="jsonl").json()
+        assert data["imported"] == 1
+        assert [e["line"] for e in data["errors"]] == [2, 3]
+
+    def test_cannot_import_into_other_users_category(self, client):
+        tokens_a = register_and_login(client, "imp_a")
+        tokens_b = register_and_login(client, "imp_b")
+        foreign_category = create_test_category(client, tokens_a, name="Private")
+
+        data = _import(client, tokens_b, f"date,amount,category_id\n2024-01-01,1,{foreign_category}\n".encode()).json()
+        assert data["imported"] == 0
+        assert "Category not found" in data["errors"][0]["error"]
+
+    def test_rows_inserted_in_chunks(self, client):
+        tokens = register_and_login(client, "imp5")
+        rows = "".join(f"2024-03-{day:02d},{day},\n" for day in range(1, 8))
+        with patch("services.import_service.IMPORT_CHUNK_SIZE", 3), \
+                patch("crud.operation.bulk_create_operations", wraps=crud.operation.bulk_create_operations) as bulk:
+            data = _import(client, tokens, ("date,amount,comment\n" + rows).encode()).json()
+        assert data["imported"] == 7
+        assert [len(call.args[1]) for call in bulk.call_args_list] == [3, 3, 1]
+
+    def test_non_utf8_file_returns_400(self, client):
+        tokens = register_and_login(client, "imp6")
+        response = _import(client, tokens, "date,amount,comment\n2024-01-01,1,Кофе\n".encode("cp1251"))
+        assert response.status_code == 400
+
+    def test_import_requires_auth(self, client):
+        response = client.post("/operations/import", files={"file": ("a.csv", b"date,amount\n", "text/csv")})
+        assert response.status_code == 401
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+class TestExport:
+    CSV = (
+        "date,amount,comment,category\n"
+        "2024-01-01,-10,Кофе,Food\n"
+        "2024-01-02,500,,\n"
+        "2024-02-01,-20,Обед,Food\n"
+    ).encode()
+
+    def _seed(self, client, username):
+        tokens = register_and_login(client, username)
+        create_test_category(client, tokens, name="Food")
+        assert _import(client, tokens, self.CSV).json()["imported"] == 3
+        return tokens
+
+    def test_export_csv_gzipped_when_accepted(self, client):
+        tokens = self._seed(client, "exp1")
+        response = client.get("/operations/export", headers={**_auth(tokens), "Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"].startswith("text/csv")
+
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [r["amount"] for r in rows] == ["-10.0", "500.0", "-20.0"]
+        assert rows[0]["category"] == "Food" and rows[0]["comment"] == "Кофе"
+        assert rows[1]["category"] == "" and rows[1]["category_id"] == ""
+
+    def test_export_not_compressed_without_gzip(self, client):
+        tokens = self._seed(client, "exp2")
+        response = client.get("/operations/export", headers={**_auth(tokens), "Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.content.decode().splitlines()[0] == "id,date,amount,comment,category_id,category"
+
+    def test_export_jsonl_with_filters(self, client):
+        tokens = self._seed(client, "exp3")
+        response = client.get(
+            "/operations/export?format=jsonl&start_date=2024-01-02&max_amount=0", headers=_auth(tokens),
+        )
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 1
+        assert lines[0]["date"] == "2024-02-01" and lines[0]["amount"] == -20.0
+
+    def test_export_contains_only_own_operations(self, client):
+        self._seed(client, "exp_a")
+        tokens_b = register_and_login(client, "exp_b")
+        response = client.get("/operations/export", headers=_auth(tokens_b))
+        assert response.text.strip() == "id,date,amount,comment,category_id,category"
+
+    def test_export_parquet_written_in_row_groups(self, client):
+        pq = pytest.importorskip("pyarrow.parquet")
+        tokens = self._seed(client, "exp4")
+        with patch("services.export_service.EXPORT_BATCH_SIZE", 2):
+            response = client.get("/operations/export?format=parquet", headers=_auth(tokens))
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
+        parquet = pq.ParquetFile(io.BytesIO(response.content))
+        assert parquet.num_row_groups == 2
+        table = parquet.read()
+        assert table.column("amount").to_pylist() == [-10.0, 500.0, -20.0]
+        assert table.column("category").to_pylist() == ["Food", None, "Food"]
+
+    def test_export_parquet_without_pyarrow_returns_400(self, client):
+        tokens = register_and_login(client, "exp5")
+        with patch("services.export_service.pa", None):
+            response = client.get("/operations/export?format=parquet", headers=_auth(tokens))
+        assert response.status_code == 400
+
+    def test_export_requires_auth(self, client):
+        assert client.get("/operations/export").status_code == 401
+
+
+# ---------------------------------------------------------------------------
+# Batch
+# ---------------------------------------------------------------------------
+
+class TestBatch:
+    def _create(self, client, tokens, amount, category_id=None):
+        return client.post(
+            "/operations/",
+            json={"date": "2024-05-01", "amount": amount, "category_id": category_id},
+            headers=_auth(tokens),
+        ).json()["id"]
+
+    def _batch(self, client, tokens, actions):
+        return client.post("/operations/batch", json={"actions": actions}, headers=_auth(tokens))
+
+    def test_mixed_batch_applied(self, client):
+        tokens = register_and_login(client, "bat1")
+        category_id = create_test_category(client, tokens)
+        keep = self._create(client, tokens, 10.0)
+        drop = self._create(client, tokens, 20.0)
+
+        with patch("crud.operation.get_operations_by_ids", wraps=crud.operation.get_operations_by_ids) as lookup:
+            response = self._batch(client, tokens, [
+                {"action": "create", "data": {"date": "2024-05-02", "amount": 5.0, "category_id": category_id}},
+                {"action": "update", "id": keep, "data": {"date": "2024-05-03", "amount": 15.0, "comment": "edited"}},
+                {"action": "delete", "id": drop},
+            ])
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["created"]) == 1
+        assert data["updated"] == [keep] and data["deleted"] == [drop]
+        assert lookup.call_count == 1  # одна проверка владения на весь batch
+
+        items = {op["id"]: op for op in client.get("/operations/", headers=_auth(tokens)).json()["items"]}
+        assert set(items) == {keep, data["created"][0]}
+        assert items[keep]["amount"] == 15.0 and items[keep]["comment"] == "edited"
+        assert items[data["created"][0]]["category"]["name"] == "Food"
+
+    def test_foreign_operation_rejects_whole_batch(self, client):
+        tokens_a = register_and_login(client, "bat_a")
+        tokens_b = register_and_login(client, "bat_b")
+        foreign = self._create(client, tokens_a, 10.0)
+
+        response = self._batch(client, tokens_b, [
+            {"action": "create", "data": {"date": "2024-05-02", "amount": 5.0}},
+            {"action": "delete", "id": foreign},
+        ])
+        assert response.status_code == 404
+        assert client.get("/operations/", headers=_auth(tokens_b)).json()["total"] == 0
+        assert client.get("/operations/", headers=_auth(tokens_a)).json()["total"] == 1
+
+    def test_foreign_category_rejected(self, client):
+        tokens_a = register_and_login(client, "bat_c")
+        tokens_b = register_and_login(client, "bat_d")
+        foreign_category = create_test_category(client, tokens_a, name="Private")
+
+        response = self._batch(client, tokens_b, [
+            {"action": "create", "data": {"date": "2024-05-02", "amount": 5.0, "category_id": foreign_category}},
+        ])
+        assert response.status_code == 404
+
+    def test_duplicate_id_returns_422(self, client):
+        tokens = register_and_login(client, "bat2")
+        op_id = self._create(client, tokens, 10.0)
+        response = self._batch(client, tokens, [
+            {"action": "delete", "id": op_id},
+            {"action": "update", "id": op_id, "data": {"date": "2024-05-03", "amount": 1.0}},
+        ])
+        assert response.status_code == 422
+
+    @pytest.mark.parametrize("action", [
+        {"action": "create"},
+        {"action": "create", "id": 1, "data": {"date": "2024-05-02", "amount": 5.0}},
+        {"action": "update", "data": {"date": "2024-05-02", "amount": 5.0}},
+        {"action": "delete"},
+        {"action": "archive", "id": 1},
+    ])
+    def test_malformed_action_returns_422(self, client, action):
+        tokens = register_and_login(client, "bat3")
+        assert self._batch(client, tokens, [action]).status_code == 422
+
+    def test_empty_batch_returns_422(self, client):
+        tokens = register_and_login(client, "bat4")
+        assert self._batch(client, tokens, []).status_code == 422
+
+    def test_deleted_attachments_removed_in_one_s3_call(self, client):
+        tokens = register_and_login(client, "bat5")
+        op_ids = [self._create(client, tokens, 10.0), self._create(client, tokens, 20.0)]
+        for i, op_id in enumerate(op_ids):
+            with patch("services.s3_service.upload_file", return_value=f"key-{i}.pdf"):
+                client.post(
+                    f"/operations/{op_id}/files",
+                    files={"file": ("r.pdf", b"%PDF", "application/pdf")},
+                    headers=_auth(tokens),
+                )
+
+        with patch("services.s3_service.delete_files", return_value=[]) as delete_files, \
+                patch("services.s3_service.delete_file") as delete_file:
+            response = self._batch(client, tokens, [{"action": "delete", "id": op_id} for op_id in op_ids])
+        assert response.status_code == 200
+        delete_files.assert_called_once()
+        assert sorted(delete_files.call_args.args[0]) == ["key-0.pdf", "key-1.pdf"]
+        delete_file.assert_not_called()
+
+    def test_batch_requires_auth(self, client):
+        response = client.post("/operations/batch", json={"actions": [{"action": "delete", "id": 1}]})
+        assert response.status_code == 401
+
+
+class TestS3DeleteFiles:
+    def test_keys_sent_in_chunks_and_errors_returned(self):
+        import services.s3_service as s3
+        client = MagicMock()
+        client.delete_objects.side_effect = [{}, {"Errors": [{"Key": "k-1000", "Code": "AccessDenied"}]}]
+        keys = [f"k-{i}" for i in range(1001)]
+        with patch.object(s3, "_get_client", return_value=client):
+            failed = s3.delete_files(keys)
+        assert failed == ["k-1000"]
+        assert [len(call.kwargs["Delete"]["Objects"]) for call in client.delete_objects.call_args_list] == [1000, 1]
@@ -0,0 +1,169 @@
+"""
+Проверка запросов к таблице operations:
+- планы (SQLite EXPLAIN QUERY PLAN): для каждой комбинации фильтров, которую
+  может построить GET /operations, и для подсчёта баланса запрос должен идти
+  через индекс, а не полным сканом;
+- количество SQL-запросов на страницу не зависит от её размера (нет N+1).
+"""
+import itertools
+import re
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from db.database import Base
+from models import models
+import crud.operation
+from schemas import operation as op_schema
+
+FILTERS = {
+    "start_date": date(2024, 1, 1),
+    "end_date": date(2024, 12, 31),
+    "category_id": 1,
+    "comment": "кофе",
+    "min_amount": -100.0,
+    "max_amount": 100.0,
+}
+FILTER_COMBINATIONS = [
+    combo
+    for r in range(len(FILTERS) + 1)
+    for combo in itertools.combinations(FILTERS, r)
+]
+TABLE_SCAN = re.compile(r"\bSCAN (TABLE )?operations\b")
+
+
+@pytest.fixture(scope="module")
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = models.User(username="planner", hashed_password="x")
+    db.add(user)
+    db.flush()
+    category = models.Category(name="Еда", user_id=user.id)
+    db.add(category)
+    db.flush()
+    for i in range(50):
+        op = models.Operation(
+            date=date(2024, 1, 1) + timedelta(days=i), amount=float(i - 25) or 1.0,
+            comment=f"op {i}", category_id=category.id, user_id=user.id,
+        )
+        op.files.append(models.OperationFile(filename=f"r{i}.pdf", s3_key=f"key-{i}"))
+        db.add(op)
+    db.commit()
+    yield db, user
+    db.close()
+    engine.dispose()
+
+
+def _captured_statements(db, fn):
+    statements = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", _capture)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", _capture)
+    return statements
+
+
+def _assert_no_table_scan(db, statements):
+    assert statements
+    for statement, parameters in statements:
+        plan = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        details = [row[-1] for row in plan]
+        scans = [d for d in details if TABLE_SCAN.search(d)]
+        assert not scans, f"table scan on operations:\n{statement}\n{details}"
+
+
+@pytest.mark.parametrize("sort_by", ["date", "amount"])
+@pytest.mark.parametrize("use_cursor", [False, True])
+@pytest.mark.parametrize("combo", FILTER_COMBINATIONS, ids=lambda c: "+".join(c) or "no_filters")
+def test_get_operations_uses_index(session, combo, sort_by, use_cursor):
+    db, user = session
+    filters = {name: FILTERS[name] for name in combo}
+    cursor = None
+    if use_cursor:
+        first_page = crud.operation.get_operations(db, user, sort_by=sort_by, page_size=1)
+        cursor = first_page["next_cursor"]
+
+    statements = _captured_statements(db, lambda: crud.operation.get_operations(
+        db, user, sort_by=sort_by, cursor=cursor, **filters,
+    ))
+    _assert_no_table_scan(db, statements)
+
+
+def test_get_total_balance_uses_index(session):
+    """Без строки в user_balances баланс считается SUM по индексу."""
+    db, user = session
+    statements = _captured_statements(db, lambda: crud.operation.get_total_balance(db, user))
+    _assert_no_table_scan(db, statements)
+
+
+def test_materialized_balance_read_skips_operations():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, expire_on_commit=False)()
+    try:
+        user = models.User(username="balance", hashed_password="x")
+        db.add(user)
+        db.commit()
+        for amount in (10.0, -3.0):
+            crud.operation.create_operation(op_schema.OperationCreate(date=date(2024, 6, 1), amount=amount), db, user)
+
+        statements = _captured_statements(db, lambda: crud.operation.get_total_balance(db, user))
+        assert crud.operation.get_total_balance(db, user) == 7.0
+        assert len(statements) == 1
+        assert "operations" not in statements[0][0]
+    finally:
+        db.close()
+        engine.dispose()
+
+
+# ---------------------------------------------------------------------------
+# Количество запросов на страницу (N+1)
+# ---------------------------------------------------------------------------
+
+def _statements_per_page(db, user, page_size, relations_loading):
+    db.expunge_all()
+
+    def _fetch_and_serialize():
+        result = crud.operation.get_operations(
+            db, user, page_size=page_size, relations_loading=relations_loading,
+        )
+        op_schema.OperationsPage.model_validate(result, from_attributes=True)
+
+    return len(_captured_statements(db, _fetch_and_serialize))
+
+
+@pytest.mark.parametrize("relations_loading", ["selectin", "joined"])
+def test_page_query_count_is_constant(session, relations_loading):
+    db, user = session
+    small = _statements_per_page(db, user, 5, relations_loading)
+    large = _statements_per_page(db, user, 40, relations_loading)
+    assert small == large
+    assert large <= 4  # COUNT + страница + (для selectin) category и files
+
+
+def test_lazy_loading_grows_with_page_size(session):
+    """Контрольный тест: без eager loading запросов становится больше с размером страницы."""
+    db, user = session
+    assert _statements_per_page(db, user, 40, "lazy") > _statements_per_page(db, user, 5, "lazy")
+
+
+def test_get_operation_loads_relations_eagerly(session):
+    db, user = session
+    op_id = crud.operation.get_operations(db, user, page_size=1)["items"][0].id
+    db.expunge_all()
+
+    def _fetch_and_serialize():
+        op = crud.operation.get_operation(op_id, db, user)
+        op_schema.Operation.model_validate(op, from_attributes=True)
+
+    assert len(_captured_statements(db, _fetch_and_serialize)) <= 3
@@ -1,12 +1,20 @@
 """
 Модульные тесты сервисного слоя:
-- groq_service: _build_prompt, analyze_operations (с мок-HTTP)
-- auth_service: create_access_token, decode_access_token
+- groq_service: _build_prompt (и сжатие под бюджет токенов), analyze_operations (против локальной заглушки Groq), кэш, circuit breaker
+- analytics_service: compute_summary
+- job_service: очередь задач AI-анализа
+- auth_service: create_access_token, decode_access_token, RevocationCache
+- maintenance_service: purge_expired_tokens, reconcile_balances, rebuild_stats
 """
+import asyncio
+import time
 import pytest
 from unittest.mock import patch, AsyncMock, MagicMock
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 import services.groq_service as gs
+from services.job_service import JobQueue, JobStore, QueueFullError, UserLimitError
+from utils.cache import TTLCache
+from utils.circuit_breaker import CircuitBreaker
 
 
 # ---------------------------------------------------------------------------
@@ -55,21 +63,62 @@ class TestBuildPrompt:
         assert result.count("\n") >= 1
 
 
+class TestPromptCompaction:
+    @staticmethod
+    def _op(day, amount, category="Еда", comment=None):
+        return {"date": str(day), "amount": amount, "comment": comment,
+                "category": {"name": category} if category else None}
+
+    def _year(self, per_day=4):
+        start = date(2024, 1, 1)
+        ops = [
+            self._op(start + timedelta(days=i // per_day), -float(100 + (i * 37) % 900), ("Еда", "Кафе", "Дом")[i % 3], f"чек {i}")
+            for i in range(366 * per_day)
+        ]
+        ops += [self._op(date(2024, m, 5), -9.99, "Подписки", "Netflix") for m in range(1, 13)]
+        ops.append(self._op(date(2024, 6, 1), -50000.0, "Дом", "ремонт"))
+        return ops
+
+    def test_small_input_is_unchanged(self):
+        ops = [self._op(date(2024, 1, d), -10.0 * d) for d in range(1, 6)]
+        assert gs._build_prompt(ops) == "\n".join(gs._operation_line(op) for op in ops)
+
+    def test_repeated_operations_are_collapsed_first(self):
+        ops = [self._op(date(2024, 1, d), -9.99, "Подписки", "Netflix") for d in range(1, 31)]
+        ops.append(self._op(date(2024, 1, 15), -500.0, "Еда", "Ужин"))
+        full = "\n".join(gs._operation_line(op) for op in ops)
+        prompt = gs._build_prompt(ops, budget=gs._estimate_tokens(full) - 1)
+        assert prompt.splitlines() == [
+            "- -9.99 ₽ ×30 (2024-01-01 … 2024-01-30), категория: Подписки, комментарий: Netflix",
+            "- 2024-01-15: -500.0 ₽, категория: Еда, комментарий: Ужин",
+        ]
+
+    @pytest.mark.parametrize("budget", [300, 1000, 3000])
+    def test_year_of_history_fits_budget(self, budget):
+        ops = self._year()
+        prompt = gs._build_prompt(ops, budget=budget)
+        assert gs._estimate_tokens(prompt) <= budget
+        assert prompt.startswith("Период: 2024-01-01 — 2024-12-31, операций: 1477")
+        assert "2024-12:" in prompt  # последние месяцы остаются даже при маленьком бюджете
+
+    def test_aggregated_prompt_keeps_key_facts(self):
+        prompt = gs._build_prompt(self._year(), budget=3000)
+        assert "- 2024-01:" in prompt and "Кафе" in prompt
+        assert "- -9.99 ₽ ×12 (2024-01-05 … 2024-12-05), категория: Подписки, комментарий: Netflix" in prompt
+        assert "- 2024-06-01: -50000.0 ₽, категория: Дом, комментарий: ремонт" in prompt
+
+    def test_budget_defaults_to_setting(self, monkeypatch):
+        ops = self._year(per_day=1)
+        monkeypatch.setattr(gs, "GROQ_PROMPT_TOKEN_BUDGET", 500)
+        assert gs._estimate_tokens(gs._build_prompt(ops)) <= 500
+
+
 # ---------------------------------------------------------------------------
-# groq_service — тесты analyze_operations (мок httpx)
+# groq_service — тесты analyze_operations (локальная заглушка Groq)
 # ---------------------------------------------------------------------------
 
 class TestAnalyzeOperations:
-    def _ok_patch(self, text="OK"):
-        mock_response = MagicMock()
-        mock_response.raise_for_status = MagicMock()
-        mock_response.json.return_value = {"choices": [{"message": {"content": text}}]}
-        mock_client = AsyncMock()
-        mock_client.post = AsyncMock(return_value=mock_response)
-        mock_cls = MagicMock()
-        mock_cls.return_value.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_cls.return_value.__aexit__ = AsyncMock(return_value=False)
-        return patch.object(gs.httpx, "AsyncClient", mock_cls)
+    OPS = [{"date": "2024-01-01", "amount": 100.0, "comment": "Test", "category": None}]
 
     @pytest.mark.asyncio
     async def test_raises_value_error_when_no_api_key(self, monkeypatch):
@@ -78,56 +127,248 @@ class TestAnalyzeOperations:
             await gs.analyze_operations([])
 
     @pytest.mark.asyncio
-    async def test_returns_text_on_success(self, monkeypatch):
-        monkeypatch.setattr(gs, "GROQ_API_KEY", "fake-key")
-        with self._ok_patch("Анализ готов"):
-            result = await gs.analyze_operations([
-                {"date": "2024-01-01", "amount": 100.0, "comment": "Test", "category": None}
-            ])
+    async def test_returns_text_on_success(self, groq_stub):
+        groq_stub.reply = "Анализ готов"
+        result = await gs.analyze_operations(self.OPS)
         assert result == "Анализ готов"
+        request = groq_stub.requests[0]
+        assert request["headers"]["authorization"] == "Bearer fake-key"
+        assert request["json"]["model"] == gs.GROQ_MODEL
 
     @pytest.mark.asyncio
-    async def test_raises_runtime_error_on_timeout(self, monkeypatch):
-        import httpx
-        monkeypatch.setattr(gs, "GROQ_API_KEY", "fake-key")
+    async def test_raises_runtime_error_on_timeout(self, groq_stub, monkeypatch):
         monkeypatch.setattr(gs, "MAX_RETRIES", 0)
+        monkeypatch.setattr(gs, "TIMEOUT", 0.05)
+        groq_stub.latency = 0.5
+        with pytest.raises(RuntimeError, match="Таймаут"):
+            await gs.analyze_operations([])
 
-        mock_client = AsyncMock()
-        mock_client.post = AsyncMock(side_effect=httpx.TimeoutException("timeout"))
-        mock_cls = MagicMock()
-        mock_cls.return_value.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_cls.return_value.__aexit__ = AsyncMock(return_value=False)
+    @pytest.mark.asyncio
+    async def test_retries_server_errors(self, groq_stub):
+        groq_stub.then(status=503).then(status=500)
+        assert await gs.analyze_operations([]) == "Анализ готов"
+        assert len(groq_stub.requests) == 3
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_not_retried(self, groq_stub):
+        groq_stub.then(status=401)
+        with pytest.raises(RuntimeError, match="401"):
+            await gs.analyze_operations([])
+        assert len(groq_stub.requests) == 1
 
-        with patch.object(gs.httpx, "AsyncClient", mock_cls):
-            with pytest.raises(RuntimeError, match="Таймаут"):
+    @pytest.mark.asyncio
+    async def test_rate_limit_waits_for_retry_after(self, groq_stub):
+        groq_stub.then(status=429, headers={"Retry-After": "0.3"})
+        started = time.monotonic()
+        assert await gs.analyze_operations([]) == "Анализ готов"
+        assert time.monotonic() - started >= 0.3
+        assert len(groq_stub.requests) == 2
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_with_long_retry_after_fails_fast(self, groq_stub, monkeypatch):
+        monkeypatch.setattr(gs, "MAX_RETRIES", 2)
+        groq_stub.then(status=429, headers={"Retry-After": "3600"})
+        with pytest.raises(RuntimeError, match="лимит"):
+            await gs.analyze_operations([])
+        assert len(groq_stub.requests) == 1  # ждать час не стали
+
+    @pytest.mark.asyncio
+    async def test_connections_are_reused(self, groq_stub):
+        await gs.analyze_operations(self.OPS)
+        await gs.analyze_operations([])
+        assert len(groq_stub.requests) == 2
+        assert len(groq_stub.connections) == 1
+
+    @pytest.mark.asyncio
+    async def test_close_client(self, groq_stub):
+        await gs.analyze_operations([])
+        client = gs.get_client()
+        await gs.close_client()
+        assert client.is_closed
+        assert gs.get_client() is not client
+
+    @pytest.mark.asyncio
+    async def test_breaker_fails_fast_while_groq_is_down(self, groq_stub, monkeypatch):
+        monkeypatch.setattr(gs, "MAX_RETRIES", 0)
+        monkeypatch.setattr(gs, "breaker", CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        for status in (500, 502):
+            groq_stub.then(status=status)
+            with pytest.raises(RuntimeError, match="Ошибка Groq API"):
                 await gs.analyze_operations([])
 
+        with pytest.raises(RuntimeError, match="временно недоступен"):
+            await gs.analyze_operations([])
+        assert len(groq_stub.requests) == 2
+        assert gs.breaker.stats()["rejected"] == 1
+
     @pytest.mark.asyncio
-    async def test_no_retry_on_rate_limit(self, monkeypatch):
-        import httpx
+    async def test_breaker_closes_after_successful_trial(self, groq_stub, monkeypatch):
+        monkeypatch.setattr(gs, "MAX_RETRIES", 0)
+        monkeypatch.setattr(gs, "breaker", CircuitBreaker(failure_threshold=1, reset_timeout=60))
+        groq_stub.then(status=500)
+        with pytest.raises(RuntimeError):
+            await gs.analyze_operations([])
+        with patch("utils.circuit_breaker.time.monotonic", return_value=time.monotonic() + 61):
+            assert await gs.analyze_operations([]) == "Анализ готов"
+        assert gs.breaker.state == "closed"
+
+
+    @pytest.mark.asyncio
+    async def test_cancelled_trial_releases_breaker(self, groq_stub, monkeypatch):
+        monkeypatch.setattr(gs, "breaker", CircuitBreaker(failure_threshold=1, reset_timeout=0.3))
+        gs.breaker.record_failure()
+        await asyncio.sleep(0.35)
+        groq_stub.then(delay=5)
+        task = asyncio.create_task(gs._request_analysis(gs._build_payload([])))
+        await asyncio.sleep(0.05)
+        assert gs.breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert gs.breaker.allow()
+
+class TestStreamAnalysis:
+    OPS = TestAnalyzeOperations.OPS
+
+    @staticmethod
+    async def _collect(chunks):
+        return [chunk async for chunk in chunks]
+
+    @pytest.mark.asyncio
+    async def test_yields_chunks_from_stream(self, groq_stub):
+        groq_stub.reply = "Траты на кафе выросли"
+        chunks = await self._collect(gs.stream_analysis(self.OPS))
+        assert len(chunks) == 4
+        assert "".join(chunks) == "Траты на кафе выросли"
+        assert groq_stub.requests[0]["json"]["stream"] is True
+
+    @pytest.mark.asyncio
+    async def test_streamed_answer_is_cached(self, groq_stub):
+        streamed = "".join(await self._collect(gs.stream_analysis(self.OPS)))
+        assert await self._collect(gs.stream_analysis(self.OPS)) == [streamed]
+        assert await gs.analyze_operations(self.OPS) == streamed
+        assert len(groq_stub.requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_error_before_first_chunk(self, groq_stub):
+        groq_stub.then(status=503)
+        with pytest.raises(RuntimeError, match="503"):
+            await self._collect(gs.stream_analysis(self.OPS))
+        assert gs.breaker.stats()["failures"] == 1
+        assert gs.cache_stats()["size"] == 0
+
+
+    @pytest.mark.asyncio
+    async def test_cancelled_stream_trial_releases_breaker(self, groq_stub, monkeypatch):
+        monkeypatch.setattr(gs, "breaker", CircuitBreaker(failure_threshold=1, reset_timeout=0.3))
+        gs.breaker.record_failure()
+        await asyncio.sleep(0.35)
+        groq_stub.then(delay=5)
+        task = asyncio.create_task(self._collect(gs._stream_request(gs._build_payload(self.OPS))))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert gs.breaker.state == "half_open"
+        assert gs.breaker.allow()
+
+def test_retry_after_accepts_http_date():
+    import httpx
+    from email.utils import format_datetime
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    response = httpx.Response(429, headers={"Retry-After": format_datetime(when, usegmt=True)})
+    assert 25 <= gs._retry_after_seconds(response) <= 30
+    assert gs._retry_after_seconds(httpx.Response(429, headers={"Retry-After": "junk"})) is None
+
+
+def test_backoff_is_capped_and_jittered(monkeypatch):
+    monkeypatch.setattr(gs, "GROQ_BACKOFF_BASE_SECONDS", 1)
+    monkeypatch.setattr(gs, "GROQ_BACKOFF_MAX_SECONDS", 4)
+    delays = [gs._backoff_delay(10) for _ in range(200)]
+    assert all(0 <= d <= 4 for d in delays)
+    assert len(set(delays)) > 1
+
+
+class TestAnalysisCache:
+    OPS = [{"date": "2024-01-01", "amount": -100.0, "comment": "Кофе", "category": {"name": "Еда"}}]
+
+    def _counting_request(self, monkeypatch, delay=0.0, fail=False):
+        calls = []
+
+        async def fake_request(payload):
+            calls.append(payload)
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError("Ошибка Groq API: 500")
+            return f"анализ #{len(calls)}"
+
         monkeypatch.setattr(gs, "GROQ_API_KEY", "fake-key")
-        monkeypatch.setattr(gs, "MAX_RETRIES", 2)
+        monkeypatch.setattr(gs, "_request_analysis", fake_request)
+        return calls
 
-        call_count = 0
+    @pytest.mark.asyncio
+    async def test_same_operations_hit_cache(self, monkeypatch):
+        calls = self._counting_request(monkeypatch)
+        first = await gs.analyze_operations(self.OPS)
+        second = await gs.analyze_operations([dict(op) for op in self.OPS])
+        assert first == second == "анализ #1"
+        assert len(calls) == 1
+        assert gs.cache_stats()["hits"] == 1
 
-        async def fake_post(*args, **kwargs):
-            nonlocal call_count
-            call_count += 1
-            resp = MagicMock()
-            resp.status_code = 429
-            raise httpx.HTTPStatusError("rate limit", request=MagicMock(), response=resp)
+    @pytest.mark.asyncio
+    async def test_changed_operations_miss_cache(self, monkeypatch):
+        calls = self._counting_request(monkeypatch)
+        await gs.analyze_operations(self.OPS)
+        changed = [{**self.OPS[0], "amount": -150.0}]
+        assert await gs.analyze_operations(changed) == "анализ #2"
+        assert len(calls) == 2
 
-        mock_client = AsyncMock()
-        mock_client.post = fake_post
-        mock_cls = MagicMock()
-        mock_cls.return_value.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_cls.return_value.__aexit__ = AsyncMock(return_value=False)
+    @pytest.mark.asyncio
+    async def test_model_and_parameters_are_part_of_key(self, monkeypatch):
+        calls = self._counting_request(monkeypatch)
+        await gs.analyze_operations(self.OPS)
+        monkeypatch.setattr(gs, "TEMPERATURE", 0.2)
+        await gs.analyze_operations(self.OPS)
+        monkeypatch.setattr(gs, "GROQ_MODEL", "other-model")
+        await gs.analyze_operations(self.OPS)
+        assert len(calls) == 3
 
-        with patch.object(gs.httpx, "AsyncClient", mock_cls):
-            with pytest.raises(RuntimeError, match="лимит"):
-                await gs.analyze_operations([])
+    @pytest.mark.asyncio
+    async def test_errors_are_not_cached(self, monkeypatch):
+        calls = self._counting_request(monkeypatch, fail=True)
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await gs.analyze_operations(self.OPS)
+        assert len(calls) == 2
+        assert gs.cache_stats()["size"] == 0
+
+    @pytest.mark.asyncio
+    async def test_expired_entry_is_requested_again(self, monkeypatch):
+        calls = self._counting_request(monkeypatch)
+        monkeypatch.setattr(gs, "analysis_cache", TTLCache(maxsize=10, ttl=0))
+        await gs.analyze_operations(self.OPS)
+        await gs.analyze_operations(self.OPS)
+        assert len(calls) == 2
 
-        assert call_count == 1  # нет ретрая при 429
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_requests_share_one_call(self, monkeypatch):
+        calls = self._counting_request(monkeypatch, delay=0.05)
+        results = await asyncio.gather(*(gs.analyze_operations(self.OPS) for _ in range(5)))
+        assert results == ["анализ #1"] * 5
+        assert len(calls) == 1
+        stats = gs.cache_stats()
+        assert stats["coalesced"] == 4
+        assert stats["inflight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_shared_call(self, monkeypatch):
+        calls = self._counting_request(monkeypatch, delay=0.05)
+        first = asyncio.ensure_future(gs.analyze_operations(self.OPS))
+        second = asyncio.ensure_future(gs.analyze_operations(self.OPS))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "анализ #1"
+        assert len(calls) == 1
 
 
 # ---------------------------------------------------------------------------
@@ -177,3 +418,359 @@ class TestAuthService:
         with pytest.raises(HTTPException) as exc_info:
             decode_access_token(expired_token)
         assert exc_info.value.status_code == 401
+
+    def test_access_tokens_have_unique_jti(self):
+        from services.auth_service import create_access_token, decode_access_token
+        user = self._make_user()
+        first = decode_access_token(create_access_token(user))
+        second = decode_access_token(create_access_token(user))
+        assert first["jti"] and second["jti"]
+        assert first["jti"] != second["jti"]
+
+
+# ---------------------------------------------------------------------------
+# auth_service — кэш отозванных токенов
+# ---------------------------------------------------------------------------
+
+class TestRevocationCache:
+    def _cache(self, sync_seconds=60):
+        from services.auth_service import RevocationCache
+        return RevocationCache(capacity=1000, sync_seconds=sync_seconds)
+
+    def test_valid_token_checked_without_db_lookup(self):
+        cache = self._cache()
+        with patch("services.auth_service.token_repo") as repo:
+            repo.get_revoked_jtis.return_value = []
+            assert cache.is_revoked(MagicMock(), "fresh-jti") is False
+            assert cache.is_revoked(MagicMock(), "fresh-jti") is False
+        repo.is_access_token_revoked.assert_not_called()
+        assert repo.get_revoked_jtis.call_count == 1  # синхронизация не чаще sync_seconds
+
+    def test_locally_revoked_token_is_rejected(self):
+        cache = self._cache()
+        with patch("services.auth_service.token_repo") as repo:
+            repo.get_revoked_jtis.return_value = []
+            cache.add("revoked-jti")
+            assert cache.is_revoked(MagicMock(), "revoked-jti") is True
+        repo.is_access_token_revoked.assert_not_called()
+
+    def test_revocation_from_other_worker_picked_up_on_sync(self):
+        cache = self._cache(sync_seconds=0)
+        with patch("services.auth_service.token_repo") as repo:
+            repo.get_revoked_jtis.return_value = []
+            assert cache.is_revoked(MagicMock(), "other-jti") is False
+
+            repo.get_revoked_jtis.return_value = [("other-jti", datetime.utcnow())]
+            repo.is_access_token_revoked.return_value = True
+            assert cache.is_revoked(MagicMock(), "other-jti") is True
+
+
+    def test_false_positive_is_not_cached_as_valid(self):
+        cache = self._cache(sync_seconds=0)
+        with patch("services.auth_service.token_repo") as repo:
+            # ложное срабатывание фильтра: jti в нём есть, но в БД токен не отозван
+            cache._filter.add("jti")
+            repo.get_revoked_jtis.return_value = []
+            repo.is_access_token_revoked.return_value = False
+            assert cache.is_revoked(MagicMock(), "jti") is False
+
+            # позже токен отзывают в другом воркере
+            repo.get_revoked_jtis.return_value = [("jti", datetime.utcnow())]
+            repo.is_access_token_revoked.return_value = True
+            assert cache.is_revoked(MagicMock(), "jti") is True
+            assert cache.is_revoked(MagicMock(), "jti") is True
+        assert repo.is_access_token_revoked.call_count == 2
+
+# ---------------------------------------------------------------------------
+# maintenance_service — очистка истёкших токенов
+# ---------------------------------------------------------------------------
+
+class TestTokenPurge:
+    def test_deletes_only_expired_rows_in_batches(self, client):
+        from tests.conftest import TestingSessionLocal
+        from models.models import User, RefreshToken, RevokedToken
+        from services.maintenance_service import purge_expired_tokens, purge_stats
+
+        db = TestingSessionLocal()
+        try:
+            user = User(username="purger", hashed_password="x")
+            db.add(user)
+            db.flush()
+            past = datetime.utcnow() - timedelta(minutes=1)
+            future = datetime.utcnow() + timedelta(days=1)
+            for i in range(5):
+                db.add(RefreshToken(token=f"old-{i}", user_id=user.id, expires_at=past, revoked=True))
+                db.add(RevokedToken(jti=f"old-{i}", expires_at=past))
+            db.add(RefreshToken(token="live", user_id=user.id, expires_at=future))
+            db.add(RevokedToken(jti="live", expires_at=future))
+            db.commit()
+            runs_before = purge_stats["runs"]
+
+            result = purge_expired_tokens(db, batch_size=2)
+
+            assert result["refresh_tokens_deleted"] == 5
+            assert result["revoked_tokens_deleted"] == 5
+            assert [t.token for t in db.query(RefreshToken).all()] == ["live"]
+            assert [t.jti for t in db.query(RevokedToken).all()] == ["live"]
+            assert purge_stats["runs"] == runs_before + 1
+        finally:
+            db.close()
+
+
+# ---------------------------------------------------------------------------
+# maintenance_service — сверка материализованных балансов
+# ---------------------------------------------------------------------------
+
+class TestReconcileBalances:
+    def _seed(self, db):
+        from models.models import User, Operation, UserBalance
+        users = [User(username=f"bal{i}", hashed_password="x") for i in range(3)]
+        db.add_all(users)
+        db.flush()
+        ok, drifted, missing = users
+        today = datetime.utcnow().date()
+        for user, amounts in ((ok, [10.0, 5.0]), (drifted, [20.0]), (missing, [-3.0])):
+            db.add_all(Operation(date=today, amount=a, user_id=user.id) for a in amounts)
+        db.add_all([UserBalance(user_id=ok.id, balance=15.0), UserBalance(user_id=drifted.id, balance=25.0)])
+        db.commit()
+        return ok.id, drifted.id, missing.id
+
+    def test_reports_and_fixes_drift(self, client):
+        from tests.conftest import TestingSessionLocal
+        from models.models import UserBalance
+        from services.maintenance_service import reconcile_balances
+
+        db = TestingSessionLocal()
+        try:
+            ok_id, drifted_id, missing_id = self._seed(db)
+
+            report = reconcile_balances(db, fix=False)
+            assert report["fixed"] == 0
+            assert report["users"] == [
+                {"user_id": drifted_id, "stored": 25.0, "actual": 20.0},
+                {"user_id": missing_id, "stored": None, "actual": -3.0},
+            ]
+
+            assert reconcile_balances(db)["fixed"] == 2
+            balances = dict(db.query(UserBalance.user_id, UserBalance.balance).all())
+            assert balances == {ok_id: 15.0, drifted_id: 20.0, missing_id: -3.0}
+            assert reconcile_balances(db)["drifted"] == 0
+        finally:
+            db.close()
+
+
+# ---------------------------------------------------------------------------
+# maintenance_service — пересборка дневной статистики
+# ---------------------------------------------------------------------------
+
+class TestRebuildStats:
+    def test_rebuild_matches_incremental_rollup(self, client):
+        from tests.conftest import TestingSessionLocal
+        from models.models import User, Operation, OperationDailyStat
+        from services.maintenance_service import rebuild_stats
+
+        db = TestingSessionLocal()
+        try:
+            user = User(username="stats", hashed_password="x")
+            db.add(user)
+            db.flush()
+            day = datetime(2024, 1, 1).date()
+            # в обход crud: rollup пустой, пока его не пересобрать
+            db.add_all([
+                Operation(date=day, amount=10.0, user_id=user.id),
+                Operation(date=day, amount=-4.0, user_id=user.id),
+                Operation(date=day + timedelta(days=1), amount=3.0, user_id=user.id, category_id=7),
+            ])
+            db.commit()
+            assert db.query(OperationDailyStat).count() == 0
+
+            assert rebuild_stats(db)["rows"] == 2
+            rows = db.query(OperationDailyStat).order_by(OperationDailyStat.day).all()
+            assert [(r.day, r.category_id, r.total, r.count, r.min_amount, r.max_amount) for r in rows] == [
+                (day, None, 6.0, 2, -4.0, 10.0),
+                (day + timedelta(days=1), 7, 3.0, 1, 3.0, 3.0),
+            ]
+        finally:
+            db.close()
+
+
+# ---------------------------------------------------------------------------
+# analytics_service — векторные метрики
+# ---------------------------------------------------------------------------
+
+class TestAnalyticsService:
+    def _arrays(self, rows):
+        from services.analytics_service import to_arrays
+        return to_arrays(rows)
+
+    def _summary(self, rows, today):
+        from services.analytics_service import compute_summary
+        return compute_summary(*self._arrays(rows), today=today)
+
+    def test_empty_input(self):
+        summary = self._summary([], date(2024, 1, 1))
+        assert summary["operations_count"] == 0
+        assert summary["recurring_payments"] == [] and summary["anomalies"] == []
+
+    def test_moving_averages_cover_days_without_operations(self):
+        rows = [(date(2024, 1, 1), -70.0, None), (date(2024, 1, 7), -7.0, None), (date(2024, 1, 7), 500.0, None)]
+        ma = self._summary(rows, date(2024, 1, 7))["moving_average"]
+        assert ma["latest"]["ma7"] == 11.0  # (70 + 7) / 7, доход не учитывается
+        assert ma["series"]["date"][0] == "2024-01-01"
+        assert ma["series"]["spend"] == [70.0, 0.0, 0.0, 0.0, 0.0, 0.0, 7.0]
+
+    def test_month_over_month(self):
+        rows = [
+            (date(2024, 1, 5), -100.0, 1), (date(2024, 1, 6), 1000.0, None),
+            (date(2024, 3, 1), -150.0, 1),
+        ]
+        months = self._summary(rows, date(2024, 3, 31))["month_over_month"]
+        assert [m["month"] for m in months] == ["2024-01", "2024-02", "2024-03"]
+        assert months[0] == {"month": "2024-01", "income": 1000.0, "spend": 100.0, "net": 900.0, "spend_change_pct": None}
+        assert months[1]["spend_change_pct"] == -100.0
+        assert months[2]["spend_change_pct"] is None  # в феврале трат не было
+
+    def test_category_percentiles_match_numpy(self):
+        import numpy as np
+        amounts = [-3.0, -1.0, -10.0, -7.5, -2.25, -4.0]
+        rows = [(date(2024, 1, i + 1), a, 5) for i, a in enumerate(amounts)] + [(date(2024, 1, 1), -42.0, None)]
+        percentiles = self._summary(rows, date(2024, 1, 31))["category_percentiles"]
+        assert [p["category_id"] for p in percentiles] == [None, 5]
+        expected = np.percentile([-a for a in amounts], [50, 90, 95])
+        assert [percentiles[1][k] for k in ("p50", "p90", "p95")] == [round(float(v), 2) for v in expected]
+        assert percentiles[1]["count"] == 6 and percentiles[1]["total"] == 27.75
+
+    def test_recurring_payment_detected_only_while_active(self):
+        rows = [(date(2024, m, 10), -9.99, 3) for m in range(1, 7)]
+        rows += [(date(2024, 1, 3), -9.99, 4), (date(2024, 5, 20), -9.99, 4), (date(2024, 6, 1), -9.99, 4)]
+        recurring = self._summary(rows, date(2024, 6, 20))["recurring_payments"]
+        assert len(recurring) == 1
+        assert recurring[0]["category_id"] == 3 and recurring[0]["period"] == "monthly"
+        assert recurring[0]["occurrences"] == 6 and recurring[0]["next_expected"] == "2024-07-10"
+
+        assert self._summary(rows, date(2024, 9, 1))["recurring_payments"] == []
+
+    def test_anomaly_flagged_within_category(self):
+        rows = [(date(2024, 1, d), -10.0 - d % 3, 1) for d in range(1, 29)] + [(date(2024, 1, 15), -500.0, 1)]
+        rows += [(date(2024, 1, d), -400.0, 2) for d in range(1, 10)]  # дорого, но обычно для категории
+        anomalies = self._summary(rows, date(2024, 1, 31))["anomalies"]
+        assert [(a["date"], a["amount"], a["category_id"]) for a in anomalies] == [("2024-01-15", -500.0, 1)]
+        assert anomalies[0]["z_score"] > 3
+
+    def test_anomaly_flagged_in_small_category(self):
+        # 5–10 трат: с z по всей категории выброс не мог превысить порог
+        for size in (5, 8, 10):
+            rows = [(date(2024, 1, d), -10.0 - d % 3, 1) for d in range(1, size)] + [(date(2024, 1, 20), -60.0, 1)]
+            anomalies = self._summary(rows, date(2024, 1, 31))["anomalies"]
+            assert [(a["date"], a["amount"]) for a in anomalies] == [("2024-01-20", -60.0)]
+
+        rows = [(date(2024, 1, d), -10.0 - d % 3, 1) for d in range(1, 4)]  # меньше ANOMALY_MIN_CATEGORY_SIZE
+        assert self._summary(rows + [(date(2024, 1, 20), -60.0, 1)], date(2024, 1, 31))["anomalies"] == []
+
+    def test_identical_amounts_are_not_anomalies(self):
+        rows = [(date(2024, 1, d), -9.99, 1) for d in range(1, 8)]
+        rows += [(date(2024, 1, d), -100.0, 2) for d in range(1, 6)] + [(date(2024, 1, 9), -101.0, 2)]
+        anomalies = self._summary(rows, date(2024, 1, 31))["anomalies"]
+        assert anomalies == []
+
+
+# ---------------------------------------------------------------------------
+# job_service — очередь задач AI-анализа
+# ---------------------------------------------------------------------------
+
+class TestJobQueue:
+    @staticmethod
+    async def _wait(job, statuses=("done", "failed")):
+        for _ in range(200):
+            if job.status in statuses:
+                return job
+            await asyncio.sleep(0.01)
+        raise AssertionError(f"job stuck in {job.status}")
+
+    @staticmethod
+    def _blocking_run(release: asyncio.Event):
+        async def run(operations):
+            await release.wait()
+            return f"анализ {len(operations)}"
+        return run
+
+    @pytest.mark.asyncio
+    async def test_job_runs_in_background(self):
+        async def run(operations):
+            return f"анализ {len(operations)}"
+
+        queue = JobQueue(run, workers=2)
+        job = await queue.submit(1, [{"amount": 1}, {"amount": 2}])
+        assert job.status == "queued"
+        await self._wait(job)
+        assert (job.status, job.analysis, job.operations_count) == ("done", "анализ 2", 2)
+        assert job.started_at <= job.finished_at
+        assert queue.stats()["done"] == 1
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_failed_job_keeps_error(self):
+        async def run(operations):
+            raise RuntimeError("Groq недоступен")
+
+        queue = JobQueue(run, workers=1)
+        job = await self._wait(await queue.submit(1, []))
+        assert (job.status, job.error) == ("failed", "Groq недоступен")
+        assert queue.stats()["failed"] == 1
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_per_user_limit(self):
+        release = asyncio.Event()
+        queue = JobQueue(self._blocking_run(release), workers=1, per_user=2)
+        jobs = [await queue.submit(1, []) for _ in range(2)]
+        with pytest.raises(UserLimitError):
+            await queue.submit(1, [])
+        await queue.submit(2, [])  # лимит на пользователя, а не общий
+        release.set()
+        for job in jobs:
+            await self._wait(job)
+        await queue.submit(1, [])
+        assert queue.stats()["rejected_user_limit"] == 1
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_queue_full(self):
+        release = asyncio.Event()
+        queue = JobQueue(self._blocking_run(release), workers=1, maxsize=1, per_user=10)
+        running = await queue.submit(1, [])
+        await self._wait(running, ("running",))
+        await queue.submit(2, [])
+        with pytest.raises(QueueFullError):
+            await queue.submit(3, [])
+        stats = queue.stats()
+        assert (stats["queue_depth"], stats["running"], stats["rejected_queue_full"]) == (1, 1, 1)
+        release.set()
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_requeues_running_job(self):
+        release = asyncio.Event()
+        store = JobStore()
+        queue = JobQueue(self._blocking_run(release), store=store, workers=1)
+        job = await self._wait(await queue.submit(1, [{"amount": 1}]), ("running",))
+        await queue.stop()
+        assert job.status == "queued"
+
+        release.set()
+        restarted = JobQueue(self._blocking_run(release), store=store, workers=1)
+        await restarted.start()
+        assert (await self._wait(job)).analysis == "анализ 1"
+        await restarted.stop()
+
+    @pytest.mark.asyncio
+    async def test_finished_jobs_are_pruned(self):
+        async def run(operations):
+            return "ok"
+
+        queue = JobQueue(run, store=JobStore(result_ttl=0), workers=1)
+        job = await self._wait(await queue.submit(1, []))
+        await queue.submit(1, [])
+        assert await queue.get(job.id) is None
+        await queue.stop()
+
@@ -1,13 +1,43 @@
+import os
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
 from db.database import get_db
 from models import models
-from repositories import token_repo
-from services.auth_service import decode_access_token
+from services.auth_service import decode_access_token, is_access_token_revoked
+from utils.cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# Снимки пользователей по user_id. Инвалидация — при изменении пользователя в этом
+# процессе; в остальных воркерах изменения видны не позже чем через TTL.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL_SECONDS)
+
+
+def _snapshot(user: models.User) -> models.User:
+    """Detached-копия колонок пользователя, которую можно merge'ить в любую сессию."""
+    columns = {attr.key: getattr(user, attr.key) for attr in inspect(models.User).column_attrs}
+    snapshot = models.User(**columns)
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    user_cache.pop(user_id)
+
+
+def _get_user(db: Session, user_id: int) -> models.User | None:
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        # load=False — прикрепляем снимок к сессии без SELECT
+        return db.merge(cached, load=False)
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if user is not None:
+        user_cache.set(user_id, _snapshot(user))
+    return user
+
 
 def get_current_user(
     token: str = Depends(oauth2_scheme),
@@ -15,14 +45,15 @@ def get_current_user(
 ) -> models.User:
     payload = decode_access_token(token)
     user_id: int = payload.get("user_id")
+    jti: str = payload.get("jti")
 
-    if user_id is None:
+    if user_id is None or jti is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
 
-    if token_repo.is_access_token_revoked(db, token):
+    if is_access_token_revoked(db, jti):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = _get_user(db, user_id)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
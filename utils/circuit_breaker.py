@@ -0,0 +1,85 @@
+"""Circuit breaker для внешних API: пока сервис лежит, запросы отклоняются сразу."""
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """После `failure_threshold` сбоев подряд размыкается на `reset_timeout` секунд.
+
+    Затем пропускает один пробный запрос (half-open): успех замыкает цепь,
+    сбой — снова размыкает её на `reset_timeout`. Пробный запрос, завершившийся
+    без результата (отмена), освобождает слот через release(); зависший дольше
+    `reset_timeout` считается брошенным.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0      # сколько раз цепь размыкалась
+        self.rejected = 0    # сколько запросов отклонено без вызова
+        self._opened_at = 0.0
+        self._trial_started_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and (
+                    not self._trial_in_flight or now - self._trial_started_at >= self.reset_timeout):
+                self._trial_in_flight = True
+                self._trial_started_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_in(self) -> float:
+        """Сколько секунд осталось до пробного запроса (0 — если цепь не разомкнута)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def release(self) -> None:
+        """Освобождает слот пробного запроса, завершившегося без record_success/record_failure."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_in_flight = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.failures = self.opened = self.rejected = 0
+            self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state, "failures": self.failures,
+            "opened": self.opened, "rejected": self.rejected,
+        }
@@ -1,9 +1,74 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt считается в отдельном ограниченном пуле, а не в общем threadpool Starlette:
+# всплеск логинов не должен отнимать потоки у остальных sync-роутов.
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # thread | process
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# сколько хэширований может ждать/выполняться одновременно; сверх — 503
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+
+
+class PasswordHasherBusy(RuntimeError):
+    pass
+
+
 def hash_password(password: str):
     return pwd_context.hash(password)
 
 def verify_password(plain: str, hashed: str):
-    return pwd_context.verify(plain, hashed)
\ No newline at end of file
+    return pwd_context.verify(plain, hashed)
+
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+_in_flight = 0
+_rejected = 0
+_counter_lock = threading.Lock()
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                pool_cls = ProcessPoolExecutor if PASSWORD_HASH_EXECUTOR == "process" else ThreadPoolExecutor
+                _executor = pool_cls(max_workers=PASSWORD_HASH_WORKERS)
+    return _executor
+
+
+async def _run_in_hash_pool(fn, *args):
+    global _in_flight, _rejected
+    with _counter_lock:
+        if _in_flight >= PASSWORD_HASH_QUEUE_LIMIT:
+            _rejected += 1
+            raise PasswordHasherBusy("Password hashing queue is full")
+        _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        with _counter_lock:
+            _in_flight -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_hash_pool(hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    return await _run_in_hash_pool(verify_password, plain, hashed)
+
+
+def password_hasher_stats() -> dict:
+    return {
+        "executor": PASSWORD_HASH_EXECUTOR,
+        "workers": PASSWORD_HASH_WORKERS,
+        "queue_limit": PASSWORD_HASH_QUEUE_LIMIT,
+        "in_flight": _in_flight,
+        "rejected": _rejected,
+    }